@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Micro-benchmarks of the dump, load, merge and filter methods of
+TPHAttributes.
+
+They are measured on tickets with a large description, such as a pasted log,
+and on numerous small tickets. No trac is needed.
+
+    python benchmarks/attributes.py --megabytes 1 4 --tickets 10000
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+from tph.attributes import TPHAttributes
+
+from rpc_backends import best_time, synthetic_ticket
+
+FIELDS = ["summary", "reporter", "owner", "type", "status", "priority",
+          "milestone", "component", "resolution", "keywords", "cc",
+          "estimatedhours", "parents", "blockedby", "blocking"]
+
+def log_description(megabytes):
+    """Return a description of about megabytes MB looking like a pasted
+    log."""
+    line = "2020-01-01 12:00:00,000 DEBUG [worker-%s] processing item %s\n"
+    lines = []
+    size = 0
+    index = 0
+    while size < megabytes * 1024 * 1024:
+        lines.append(line % (index % 8, index))
+        size += len(lines[-1])
+        index += 1
+    return "".join(lines)
+
+def ticket_attributes(number):
+    """Return the attributes of a synthetic ticket, with some keywords and cc
+    to merge."""
+    attributes = {key : value for (key, value)
+                  in synthetic_ticket(number)[3].items()
+                  if isinstance(value, str)}
+    attributes["cc"] = " ".join("user%s" % index for index in range(10))
+    return attributes
+
+def measures(attrs, tickets, repeat):
+    """Return the list of the tuples (method, milliseconds) of the operations
+    on all the tickets."""
+    dumped = [attrs.dump(attributes) for attributes in tickets]
+    changes = {"keywords" : "+new -k1 k2", "cc" : "-user1 +user42",
+               "summary" : "changed"}
+
+    def dump():
+        for attributes in tickets:
+            attrs.dump(attributes)
+
+    def load():
+        for string in dumped:
+            attrs.load(string)
+
+    def merge():
+        for attributes in tickets:
+            attrs.merge(dict(attributes), changes)
+
+    def filter():
+        for attributes in tickets:
+            attrs.filter(attributes)
+
+    return [(function.__name__, 1000 * best_time(function, repeat))
+            for function in (dump, load, merge, filter)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=float, nargs="+", default=[1, 4],
+                        help="sizes of the large descriptions")
+    parser.add_argument("--tickets", type=int, default=10000,
+                        help="number of small tickets")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of runs, the best time is kept")
+    args = parser.parse_args()
+    attrs = TPHAttributes(FIELDS)
+    datasets = []
+    for megabytes in args.megabytes:
+        attributes = ticket_attributes(1)
+        attributes["description"] = log_description(megabytes)
+        datasets.append(("1 ticket of %g MB" % megabytes, [attributes]))
+    datasets.append(("%s tickets" % args.tickets,
+                     [ticket_attributes(number)
+                      for number in range(1, args.tickets + 1)]))
+    line = "%-24s %-8s %10s"
+    print(line % ("dataset", "method", "ms"))
+    for (name, tickets) in datasets:
+        for (method, milliseconds) in measures(attrs, tickets, args.repeat):
+            print(line % (name, method, "%.1f" % milliseconds))
+
+if __name__ == "__main__":
+    main()
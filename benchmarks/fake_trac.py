@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Local stand-in of a trac with the XML-RPC plugin, for the benchmarks.
+
+FakeTrac serves a synthetic dataset: tickets spread over milestones, arranged in
+hierarchies through the parents field, blocking each other, with changelogs,
+and wiki pages. The dataset only depends on the number of tickets, so that the
+results of the benchmarks may be compared across commits.
+
+The server implements the ticket.*, wiki.*, search.performSearch and
+system.multicall methods used by the TPH. It waits latency seconds before
+answering each HTTP request, to simulate a distant trac, and counts the round
+trips and the calls of each method.
+
+It may also be run on its own to try trac_cmd.py against it:
+
+    python benchmarks/fake_trac.py --tickets 1000 --latency 0.05 --port 8000
+"""
+
+import argparse
+import datetime
+import random
+import socketserver
+import threading
+import time
+import xmlrpc.client
+import xmlrpc.server
+
+# date of the first ticket, each following ticket being created a minute later
+EPOCH = datetime.datetime(2020, 1, 1)
+STATUSES = ("new", "assigned", "accepted", "closed")
+PRIORITIES = ("blocker", "critical", "major", "minor", "trivial")
+TYPES = ("defect", "enhancement", "task")
+WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf",
+         "hotel", "india", "juliet", "kilo", "lima", "mike", "november")
+FIELDS = ("summary", "reporter", "owner", "description", "type", "status",
+          "priority", "milestone", "component", "resolution", "keywords", "cc",
+          "estimatedhours", "parents", "blockedby", "blocking")
+
+class FakeTrac(object):
+    """Synthetic trac answering the XML-RPC calls."""
+
+    def __init__(self, tickets=1000):
+        """Generate a dataset of tickets tickets."""
+        self.size = tickets
+        self.milestones = ["milestone%s" % index
+                           for index in range(max(1, tickets // 200))]
+        self.components = ["component%s" % index for index in range(8)]
+        self.tickets = {}
+        self.round_trips = 0
+        self.calls = {}
+        self._lock = threading.Lock()
+        for number in range(1, tickets + 1):
+            self.tickets[number] = self._ticket_attributes(number)
+        # the blocking field mirrors the blockedby one
+        for (number, attributes) in self.tickets.items():
+            if attributes["blockedby"]:
+                blocker = self.tickets[int(attributes["blockedby"])]
+                blocker["blocking"] = ", ".join(
+                    [value for value in [blocker["blocking"]] if value]
+                    + [str(number)]
+                )
+        self.pages = {}
+        for index in range(max(10, tickets // 50)):
+            rng = random.Random(-index)
+            name = "Page%s" % index if index else "WikiStart"
+            lines = [
+                " ".join(rng.choice(WORDS) for word in range(12))
+                for line in range(40)
+            ]
+            if index % 5 == 0:
+                lines[rng.randrange(len(lines))] += " TODO check #%s" % (
+                    rng.randint(1, tickets)
+                )
+            self.pages[name] = "\n".join(lines)
+
+    def _ticket_attributes(self, number):
+        rng = random.Random(number)
+        created = EPOCH + datetime.timedelta(minutes=number)
+        # about one ticket out of ten is a root, the others have a parent
+        if number > 1 and number % 10:
+            parents = str(rng.randint(max(1, number // 2 - 5), number - 1))
+        else:
+            parents = ""
+        # one ticket out of seven is blocked by a close ticket, one out of
+        # thirty five by a ticket probably in another milestone
+        blocker = number + (200 if number % 35 == 0 else 3)
+        if number % 7 == 0 and blocker <= self.size:
+            blockedby = str(blocker)
+        else:
+            blockedby = ""
+        status = STATUSES[number % len(STATUSES)]
+        attributes = {
+            "summary" : "%s %s number %s" % (rng.choice(WORDS),
+                                             rng.choice(WORDS), number),
+            "description" : "\n".join(
+                " ".join(rng.choice(WORDS) for word in range(10))
+                for line in range(5)
+            ),
+            "reporter" : "user%s" % rng.randint(0, 19),
+            "owner" : "user%s" % rng.randint(0, 19),
+            "type" : TYPES[number % len(TYPES)],
+            "status" : status,
+            "priority" : PRIORITIES[rng.randrange(len(PRIORITIES))],
+            "milestone" : self.milestones[(number * len(self.milestones))
+                                          // (self.size + 1)],
+            "component" : self.components[number % len(self.components)],
+            "resolution" : "fixed" if status == "closed" else "",
+            "keywords" : " ".join(rng.sample(WORDS, 2)),
+            "cc" : "",
+            "estimatedhours" : str(number % 8),
+            "parents" : parents,
+            "blockedby" : blockedby,
+            "blocking" : "",
+            "time" : created,
+            "changetime" : created + datetime.timedelta(
+                hours=len(self.changelog(number))
+            ),
+        }
+        return attributes
+
+    def changelog(self, number):
+        """Return the changelog of the ticket number, generated from it."""
+        created = EPOCH + datetime.timedelta(minutes=number)
+        author = "user%s" % (number % 20)
+        log = []
+        for index in range(number % 5):
+            date = created + datetime.timedelta(hours=index + 1)
+            if index % 2:
+                log.append([date, author, "status", "new", "assigned", 1])
+            else:
+                log.append([date, author, "comment", str(index + 1),
+                            "Comment %s on ticket %s" % (index + 1, number),
+                            1])
+        return log
+
+    def count(self, method):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+    def reset_counters(self):
+        with self._lock:
+            self.round_trips = 0
+            self.calls = {}
+
+    def _dispatch(self, method, params):
+        self.count(method)
+        function = getattr(self, "rpc_" + method.replace(".", "_"), None)
+        if function is None:
+            raise xmlrpc.client.Fault(1, "No such method %s" % method)
+        return function(*params)
+
+    def _get(self, number):
+        attributes = self.tickets.get(number)
+        if attributes is None:
+            raise xmlrpc.client.Fault(404, "Ticket %s does not exist."
+                                      % number)
+        return attributes
+
+    # system
+
+    def rpc_system_listMethods(self):
+        return sorted(
+            name[len("rpc_"):].replace("_", ".") for name in dir(self)
+            if name.startswith("rpc_")
+        )
+
+    def rpc_system_multicall(self, calls):
+        results = []
+        for call in calls:
+            try:
+                results.append([self._dispatch(call["methodName"],
+                                               call["params"])])
+            except xmlrpc.client.Fault as fault:
+                results.append({"faultCode" : fault.faultCode,
+                                "faultString" : fault.faultString})
+        return results
+
+    # ticket
+
+    def rpc_ticket_query(self, query="status!=closed"):
+        return self.query(query)
+
+    def rpc_ticket_get(self, number):
+        attributes = self._get(number)
+        result = dict(attributes)
+        result["_ts"] = str(attributes["changetime"].timestamp())
+        return [number, attributes["time"], attributes["changetime"], result]
+
+    def rpc_ticket_changeLog(self, number, when=0):
+        self._get(number)
+        return self.changelog(number)
+
+    def rpc_ticket_getRecentChanges(self, since):
+        since = _datetime(since)
+        return [number for (number, attributes) in self.tickets.items()
+                if attributes["changetime"] >= since]
+
+    def rpc_ticket_getTicketFields(self):
+        fields = []
+        for name in FIELDS:
+            field = {"name" : name, "label" : name.capitalize(),
+                     "type" : "text"}
+            if name == "status":
+                field["options"] = list(STATUSES)
+            elif name == "priority":
+                field["options"] = list(PRIORITIES)
+            elif name == "milestone":
+                field["options"] = list(self.milestones)
+            fields.append(field)
+        return fields
+
+    def rpc_ticket_getActions(self, number):
+        self._get(number)
+        return [["leave", "leave", "", []], ["resolve", "resolve", "", []]]
+
+    def rpc_ticket_listAttachments(self, number):
+        self._get(number)
+        return []
+
+    def rpc_ticket_update(self, number, comment, attributes, notify=False,
+                          author="", when=None):
+        ticket = self._get(number)
+        attributes = dict(attributes)
+        if attributes.pop("_ts", None) not in (None, str(
+                ticket["changetime"].timestamp()
+        )):
+            raise xmlrpc.client.Fault(
+                1, "Ticket has been updated since last get request."
+            )
+        with self._lock:
+            ticket.update(attributes)
+            ticket["changetime"] = max(
+                datetime.datetime.now(),
+                ticket["changetime"] + datetime.timedelta(seconds=1)
+            )
+        return self.rpc_ticket_get(number)
+
+    def rpc_ticket_create(self, summary, description, attributes=None,
+                          notify=False, when=None):
+        with self._lock:
+            number = max(self.tickets) + 1 if self.tickets else 1
+            now = datetime.datetime.now()
+            ticket = {field : "" for field in FIELDS}
+            ticket.update(attributes or {})
+            ticket.pop("_ts", None)
+            ticket.update({"summary" : summary, "description" : description,
+                           "time" : now, "changetime" : now})
+            self.tickets[number] = ticket
+        return number
+
+    def rpc_ticket_component_getAll(self):
+        return list(self.components)
+
+    def rpc_ticket_milestone_getAll(self):
+        return list(self.milestones)
+
+    def rpc_ticket_milestone_get(self, name):
+        return {"name" : name, "description" : "The %s" % name,
+                "due" : 0, "completed" : 0}
+
+    def rpc_ticket_priority_getAll(self):
+        return list(PRIORITIES)
+
+    def rpc_ticket_resolution_getAll(self):
+        return ["fixed", "invalid", "wontfix", "duplicate", "worksforme"]
+
+    def rpc_ticket_status_getAll(self):
+        return list(STATUSES)
+
+    def rpc_ticket_type_getAll(self):
+        return list(TYPES)
+
+    # wiki
+
+    def rpc_wiki_getAllPages(self):
+        return sorted(self.pages)
+
+    def rpc_wiki_getPage(self, name, version=None):
+        if name not in self.pages:
+            raise xmlrpc.client.Fault(404, "Wiki page %s does not exist"
+                                      % name)
+        return self.pages[name]
+
+    def rpc_wiki_getPageInfo(self, name, version=None):
+        return {"name" : name, "version" : 1, "author" : "user0",
+                "lastModified" : EPOCH}
+
+    def rpc_wiki_getRecentChanges(self, since):
+        since = _datetime(since)
+        if since > EPOCH:
+            return []
+        return [self.rpc_wiki_getPageInfo(name) for name in self.pages]
+
+    def rpc_wiki_listAttachments(self, name):
+        return []
+
+    # search
+
+    def rpc_search_performSearch(self, query, filters=None):
+        filters = filters or ["ticket", "wiki"]
+        query = query.lower()
+        results = []
+        if "ticket" in filters:
+            for (number, attributes) in self.tickets.items():
+                if query in attributes["summary"].lower() \
+                   or query in attributes["description"].lower():
+                    results.append(["/ticket/%s" % number,
+                                    "#%s: %s" % (number,
+                                                 attributes["summary"]),
+                                    attributes["changetime"],
+                                    attributes["reporter"],
+                                    attributes["summary"]])
+        if "wiki" in filters:
+            for (name, content) in sorted(self.pages.items()):
+                if query in content.lower():
+                    results.append(["/wiki/%s" % name, name, EPOCH, "user0",
+                                    content[:80]])
+        return results
+
+    def query(self, string):
+        """Evaluate the trac query string: constraints joined by &, with the
+=, !=, =~ and =! operators, | giving alternative values, the date ranges of
+        created and modified and the order, desc and max keywords."""
+        constraints = []
+        order = "priority"
+        desc = False
+        maximum = 100
+        for item in string.split("&"):
+            if not item:
+                continue
+            (field, operator, value) = _split_constraint(item)
+            if field == "order":
+                order = value
+            elif field == "desc":
+                desc = value not in ("", "0")
+            elif field == "max":
+                maximum = int(value)
+            elif field in ("col", "row", "verbose", "format"):
+                continue
+            else:
+                constraints.append((field, operator, value))
+        result = []
+        for (number, attributes) in self.tickets.items():
+            if all(_match(number, attributes, *constraint)
+                   for constraint in constraints):
+                result.append(number)
+        if order == "id":
+            result.sort(reverse=desc)
+        else:
+            ranks = {value : rank for (rank, value) in enumerate(PRIORITIES)}
+            result.sort(key=lambda number:(
+                ranks.get(self.tickets[number].get(order),
+                          str(self.tickets[number].get(order, ""))),
+                number
+            ) if order == "priority" else (
+                str(self.tickets[number].get(order, "")), number
+            ), reverse=desc)
+        if maximum:
+            result = result[:maximum]
+        return result
+
+def _datetime(value):
+    """Convert an XML-RPC date to a datetime."""
+    if isinstance(value, xmlrpc.client.DateTime):
+        return datetime.datetime.strptime(value.value, "%Y%m%dT%H:%M:%S")
+    return value
+
+def _split_constraint(item):
+    for operator in ("!=", "=~", "=!", "="):
+        if operator in item:
+            (field, value) = item.split(operator, 1)
+            if operator == "=" and value.startswith("~"):
+                (operator, value) = ("=~", value[1:])
+            return (field, operator, value)
+    raise xmlrpc.client.Fault(1, "Cannot parse the query item %s" % item)
+
+def _match(number, attributes, field, operator, value):
+    if field in ("created", "modified"):
+        # only the date ranges such as 01/31/20.. are supported
+        (start, end) = (value.split("..") + [""])[:2]
+        date = attributes["time" if field == "created" else "changetime"]
+        if start and date < datetime.datetime.strptime(start, "%m/%d/%y"):
+            return False
+        if end and date >= datetime.datetime.strptime(end, "%m/%d/%y"):
+            return False
+        return True
+    if field == "id":
+        actual = str(number)
+    else:
+        actual = attributes.get(field) or ""
+    values = value.split("|")
+    if operator == "=~":
+        return any(wanted.lower() in actual.lower() for wanted in values)
+    matched = actual in values
+    if operator in ("!=", "=!"):
+        return not matched
+    return matched
+
+class _RequestHandler(xmlrpc.server.SimpleXMLRPCRequestHandler):
+    protocol_version = "HTTP/1.1"
+    rpc_paths = ()
+
+    def do_POST(self):
+        trac = self.server.trac
+        with trac._lock:
+            trac.round_trips += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        xmlrpc.server.SimpleXMLRPCRequestHandler.do_POST(self)
+
+class FakeTracServer(socketserver.ThreadingMixIn,
+                     xmlrpc.server.SimpleXMLRPCServer):
+    """Threaded XML-RPC server of a FakeTrac."""
+
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, trac, latency=0.0, port=0):
+        """Serve trac on the local port, 0 meaning any free one, answering each
+        request after latency seconds."""
+        xmlrpc.server.SimpleXMLRPCServer.__init__(
+            self, ("127.0.0.1", port), requestHandler=_RequestHandler,
+            logRequests=False, allow_none=True
+        )
+        self.trac = trac
+        self.latency = latency
+        self.register_instance(trac)
+
+    @property
+    def url(self):
+        """Url of the XML-RPC interface."""
+        return "http://127.0.0.1:%s/rpc" % self.server_address[1]
+
+    def start(self):
+        """Serve in a background thread."""
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic trac.")
+    parser.add_argument("--tickets", type=int, default=1000,
+                        help="number of tickets of the dataset")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds waited before answering each request")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    server = FakeTracServer(FakeTrac(args.tickets), args.latency, args.port)
+    print("Serving %s tickets on %s" % (args.tickets, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
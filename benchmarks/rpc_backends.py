@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Compare the payload size and the decode time of the XML-RPC and JSON-RPC
+backends.
+
+The responses of typical calls are built from synthetic tickets, marshalled the
+way the trac RPC plugin does in both protocols and decoded the way the TPH
+does. No trac is needed.
+
+    python benchmarks/rpc_backends.py --tickets 500 --repeat 5
+"""
+
+import argparse
+import datetime
+import gzip
+import os
+import sys
+import time
+import xmlrpc.client
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+from tph import jsonrpc
+
+def synthetic_ticket(number):
+    """Return a ticket as given by ticket.get."""
+    created = datetime.datetime(2020, 1, 1) + datetime.timedelta(hours=number)
+    changed = created + datetime.timedelta(minutes=30)
+    return [
+        number,
+        xmlrpc.client.DateTime(created),
+        xmlrpc.client.DateTime(changed),
+        {
+            "summary" : "Synthetic ticket number %s" % number,
+            "description" : "Some description\nof the ticket %s.\n" % number
+            * 10,
+            "owner" : "owner%s" % (number % 7),
+            "reporter" : "reporter%s" % (number % 5),
+            "status" : ("new", "accepted", "closed")[number % 3],
+            "milestone" : "milestone%s" % (number % 4),
+            "component" : "component%s" % (number % 6),
+            "priority" : ("major", "minor")[number % 2],
+            "type" : "defect",
+            "keywords" : "k%s k%s" % (number % 3, number % 11),
+            "cc" : "",
+            "estimatedhours" : str(number % 8),
+            "parents" : str(number // 2) if number > 1 else "",
+            "blockedby" : "",
+            "blocking" : "",
+            "resolution" : "",
+            "time" : xmlrpc.client.DateTime(created),
+            "changetime" : xmlrpc.client.DateTime(changed),
+            "_ts" : str(number * 1000),
+        },
+    ]
+
+def synthetic_changelog(number, length=10):
+    """Return a changelog as given by ticket.changeLog."""
+    date = datetime.datetime(2020, 1, 1) + datetime.timedelta(hours=number)
+    return [
+        [xmlrpc.client.DateTime(date + datetime.timedelta(minutes=index)),
+         "author%s" % (index % 3), "comment", str(index),
+         "Comment number %s of the ticket %s" % (index, number), 1]
+        for index in range(length)
+    ]
+
+def multicall_responses(results):
+    """Return the tuple (xml, json) of the bodies of the system.multicall
+    responses giving results."""
+    xml = xmlrpc.client.dumps(
+        ([[result] for result in results],), methodresponse=True,
+        allow_none=True
+    ).encode("utf-8")
+    json = jsonrpc.dumps(
+        ([{"result" : result, "error" : None, "id" : index}
+          for (index, result) in enumerate(results)],),
+        methodresponse=True, request_id=1
+    )
+    return (xml, json)
+
+def scenarios(tickets):
+    """Return the list of the tuples (name, xml, json) of the responses to
+    compare."""
+    attachment = os.urandom(1024 * 1024)
+    return [
+        ("ticket.get x %s" % tickets,) + multicall_responses(
+            [synthetic_ticket(number) for number in range(1, tickets + 1)]
+        ),
+        ("ticket.changeLog x %s" % tickets,) + multicall_responses(
+            [synthetic_changelog(number) for number in range(1, tickets + 1)]
+        ),
+        (
+            "getAttachment 1 MB",
+            xmlrpc.client.dumps((xmlrpc.client.Binary(attachment),),
+                                methodresponse=True).encode("utf-8"),
+            jsonrpc.dumps((xmlrpc.client.Binary(attachment),),
+                          methodresponse=True, request_id=1),
+        ),
+    ]
+
+def best_time(function, repeat):
+    """Return the best time of repeat calls of function."""
+    best = None
+    for index in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=500,
+                        help="number of tickets of the multicall responses")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of decodings, the best time is kept")
+    args = parser.parse_args()
+    line = "%-24s %-5s %10s %10s %10s"
+    print(line % ("response", "rpc", "bytes", "gzipped", "decode ms"))
+    for (name, xml, json) in scenarios(args.tickets):
+        xml_result = xmlrpc.client.loads(xml)[0][0]
+        json_result = jsonrpc.loads(json)[0][0]
+        if isinstance(xml_result, list) and isinstance(json_result, list) \
+           and json_result and isinstance(json_result[0], dict):
+            json_result = [[response["result"]] for response in json_result]
+        assert xml_result == json_result, "the backends disagree on %s" % name
+        for (rpc, body, loads) in (("xml", xml, xmlrpc.client.loads),
+                                   ("json", json, jsonrpc.loads)):
+            print(line % (
+                name, rpc, len(body), len(gzip.compress(body)),
+                "%.1f" % (1000 * best_time(lambda:loads(body), args.repeat))
+            ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Run trac_cmd.py commands end to end against a local fake trac.
+
+For each dataset size, a benchmarks.fake_trac server is started with the given
+latency and each scenario, a trac_cmd.py command, is run repeat times by a
+fresh TracCmd, like a one shot command would be. The round trips and the calls
+the server answered and the wall clock times are reported.
+
+    python benchmarks/run.py --tickets 10 1000 10000 --latency 0.02
+
+--json writes the results, with the commit they were measured on, so that
+--compare may show the differences with another commit:
+
+    git checkout HEAD~1 && python benchmarks/run.py --json before.json
+    git checkout - && python benchmarks/run.py --compare before.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import xmlrpc.client
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from tph import transport
+from tph.trac_cmd import TracCmd
+
+from fake_trac import EPOCH, FakeTrac, FakeTracServer
+
+def scenarios(trac):
+    """Return the list of the tuples (name, command line) to run against the
+    FakeTrac trac."""
+    recent = EPOCH + datetime.timedelta(minutes=int(trac.size * 0.9))
+    roots = " ".join(str(number) for number in (1, 10, 20, 30)
+                     if number <= trac.size)
+    return [
+        ("ticket_query_print",
+         "ticket_query_print 'milestone=%s&status!=closed&max=0' summary"
+         " owner estimatedhours" % trac.milestones[0]),
+        ("ticket_remaining_time_sum", "ticket_remaining_time_sum %s" % roots),
+        ("ticket_recent_changes", "ticket_recent_changes %s"
+         % recent.strftime("%d/%m/%y %H:%M:%S")),
+        ("milestone_stuck_p", "milestone_stuck_p %s" % trac.milestones[0]),
+        ("wiki_source_grep", "wiki_source_grep '*' TODO"),
+        ("ticket_search", "ticket_search number 1"),
+    ]
+
+def make_cmd(url, multicall, max_workers):
+    """Return a new TracCmd connected to the trac at url."""
+    # shared by the server proxies, as trac_connection.factory_from_netrc does
+    pool = transport.ConnectionPool()
+
+    def server_factory():
+        return xmlrpc.client.ServerProxy(
+            url, transport=transport.make_transport("http", pool=pool),
+            allow_none=True
+        )
+
+    return TracCmd(server_factory(), login="bench", url=url,
+                   tph_options={"server_factory" : server_factory,
+                                "multicall" : multicall,
+                                "max_workers" : max_workers})
+
+def run_scenario(server, line, repeat, multicall, max_workers):
+    """Run the command line repeat times and return the dictionary of its
+    measures."""
+    times = []
+    for index in range(repeat):
+        program = make_cmd(server.url, multicall, max_workers)
+        server.trac.reset_counters()
+        output = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            program.onecmd(line)
+        times.append(time.perf_counter() - start)
+        program.tph.server("close")()
+    return {
+        "round_trips" : server.trac.round_trips,
+        "calls" : sum(server.trac.calls.values()),
+        "best" : min(times),
+        "median" : statistics.median(times),
+        "output_lines" : output.getvalue().count("\n"),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            stderr=subprocess.DEVNULL
+        ).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compared(value, previous, unit_format):
+    if previous is None:
+        return unit_format % value
+    if previous:
+        return "%s (%+.0f%%)" % (unit_format % value,
+                                 100.0 * (value - previous) / previous)
+    return "%s (was 0)" % (unit_format % value)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run trac_cmd.py commands against a local fake trac."
+    )
+    parser.add_argument("--tickets", type=int, nargs="+", default=[1000],
+                        help="sizes of the datasets (default 1000)")
+    parser.add_argument("--latency", type=float, default=0.01,
+                        help="seconds the server waits before answering each"
+                        " request (default 0.01)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of runs of each scenario (default 3)")
+    parser.add_argument("--scenario", nargs="+",
+                        help="only run these scenarios")
+    parser.add_argument("--no-multicall", action="store_true",
+                        help="do not bundle the calls with system.multicall")
+    parser.add_argument("--max-workers", type=int, default=1,
+                        help="concurrent calls without multicall (default 1)")
+    parser.add_argument("--json", metavar="FILE",
+                        help="write the results into FILE")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="show the differences with the results of FILE")
+    args = parser.parse_args()
+    previous = {}
+    if args.compare:
+        with open(args.compare, "r") as fil:
+            previous = json.load(fil)
+        print("Compared with %s" % (previous.get("commit") or args.compare))
+    results = {
+        "commit" : git_commit(),
+        "latency" : args.latency,
+        "repeat" : args.repeat,
+        "multicall" : not args.no_multicall,
+        "max_workers" : args.max_workers,
+        "datasets" : {},
+    }
+    line = "%-8s %-26s %-18s %-18s %-20s %-20s"
+    print(line % ("tickets", "scenario", "round trips", "calls", "best ms",
+                  "median ms"))
+    for size in args.tickets:
+        trac = FakeTrac(size)
+        server = FakeTracServer(trac, args.latency)
+        server.start()
+        dataset = results["datasets"].setdefault(str(size), {})
+        for (name, command) in scenarios(trac):
+            if args.scenario and name not in args.scenario:
+                continue
+            measures = run_scenario(server, command, args.repeat,
+                                    not args.no_multicall, args.max_workers)
+            dataset[name] = measures
+            before = previous.get("datasets", {}).get(str(size), {}).get(
+                name, {}
+            )
+            print(line % (
+                size, name,
+                compared(measures["round_trips"], before.get("round_trips"),
+                         "%d"),
+                compared(measures["calls"], before.get("calls"), "%d"),
+                compared(1000 * measures["best"],
+                         before.get("best") and 1000 * before["best"],
+                         "%.1f"),
+                compared(1000 * measures["median"],
+                         before.get("median") and 1000 * before["median"],
+                         "%.1f"),
+            ))
+            sys.stdout.flush()
+        server.shutdown()
+        server.server_close()
+    if args.json:
+        with open(args.json, "w") as fil:
+            json.dump(results, fil, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
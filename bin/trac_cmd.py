@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding:utf-8 -*-
 
-from tph import trac_cmd
+import sys
+from tph import daemon
 
 if __name__ == '__main__':
+    # let the daemon run the command if one is running, without even importing
+    # trac_cmd
+    status = daemon.forward(sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+    from tph import trac_cmd
     trac_cmd.main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import asyncio
+import gzip
+import os
+import xmlrpc.client
+import xmlrpc.server
+
+import pytest
+
+from tph.async_tph import AsyncServerProxy, AsyncTPH
+from tph.streaming import CHUNK_SIZE
+
+class FakeServer(object):
+    """Local XML-RPC server answering with the framing of mode: length
+    (Content-Length), chunked, gzip or close (end of the connection)."""
+
+    def __init__(self, mode="length"):
+        self.mode = mode
+        self.connections = 0
+        self.closed = 0
+        # close the connections without answering their request number
+        self.drop_request = None
+        self.attachments = {}
+        self.dispatcher = xmlrpc.server.SimpleXMLRPCDispatcher(
+            allow_none=True, encoding="utf-8"
+        )
+        self.dispatcher.register_multicall_functions()
+        functions = {
+            "echo" : lambda value:value,
+            "slow" : self.slow,
+            "fail" : self.fail,
+            "ticket.putAttachment" : self.ticket_put_attachment,
+            "ticket.listAttachments" : self.ticket_list_attachments,
+            "ticket.getAttachment" : self.ticket_get_attachment,
+            "wiki.putAttachmentEx" : self.wiki_put_attachment,
+            "wiki.listAttachments" : self.wiki_list_attachments,
+            "wiki.getAttachment" : self.wiki_get_attachment,
+        }
+        for (name, function) in functions.items():
+            self.dispatcher.register_function(function, name)
+
+    def slow(self, seconds):
+        # waited for by handle
+        if seconds < 0:
+            self.fail(-1)
+        return seconds
+
+    def fail(self, code):
+        raise xmlrpc.client.Fault(code, "failed with %s" % code)
+
+    def ticket_put_attachment(self, ticket, name, description, data,
+                              replace=True):
+        self.attachments["%s/%s" % (ticket, name)] = data.data
+        return name
+
+    def ticket_list_attachments(self, ticket):
+        return [[key.split("/", 1)[1], "", 0, None, ""]
+                for key in self.attachments
+                if key.startswith("%s/" % ticket)]
+
+    def ticket_get_attachment(self, ticket, name):
+        return xmlrpc.client.Binary(self.attachments["%s/%s" % (ticket,
+                                                                name)])
+
+    def wiki_put_attachment(self, page, name, description, data,
+                            replace=True):
+        self.attachments["%s/%s" % (page, name)] = data.data
+        return True
+
+    def wiki_list_attachments(self, page):
+        return [key for key in self.attachments if key.startswith(page + "/")]
+
+    def wiki_get_attachment(self, attachment):
+        return xmlrpc.client.Binary(self.attachments[attachment])
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = "http://127.0.0.1:%s/xmlrpc" % port
+
+    def close(self):
+        self.server.close()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        served = 0
+        try:
+            while True:
+                if not await reader.readline():
+                    break
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    (name, value) = line.split(":", 1)
+                    headers[name.lower()] = value.strip()
+                body = await reader.readexactly(int(headers["content-length"]))
+                served += 1
+                if served == self.drop_request:
+                    break
+                (params, method) = xmlrpc.client.loads(body)
+                if method == "slow" and params[0] > 0:
+                    await asyncio.sleep(params[0])
+                self.respond(writer, self.dispatcher._marshaled_dispatch(body))
+                await writer.drain()
+                if self.mode == "close":
+                    break
+        except asyncio.CancelledError:
+            # the loop is closing
+            pass
+        finally:
+            writer.close()
+            self.closed += 1
+
+    def respond(self, writer, response):
+        headers = ["HTTP/1.1 200 OK", "Content-Type: text/xml"]
+        if self.mode == "gzip":
+            response = gzip.compress(response)
+            headers.append("Content-Encoding: gzip")
+        if self.mode == "chunked":
+            headers.append("Transfer-Encoding: chunked")
+            body = b"".join(
+                b"%x\r\n%s\r\n" % (len(response[start:start + 7]),
+                                   response[start:start + 7])
+                for start in range(0, len(response), 7)
+            ) + b"0\r\n\r\n"
+        elif self.mode == "close":
+            headers.append("Connection: close")
+            body = response
+        else:
+            headers.append("Content-Length: %s" % len(response))
+            body = response
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1")
+                     + body)
+
+def run(test, mode="length"):
+    """Run the coroutine function test with a started FakeServer."""
+
+    async def main():
+        server = FakeServer(mode)
+        await server.start()
+        try:
+            return await test(server)
+        finally:
+            server.close()
+
+    return asyncio.run(main())
+
+@pytest.mark.parametrize(("mode", "connections"), [
+    ("length", 1), ("chunked", 1), ("gzip", 1), ("close", 3),
+])
+def test_response_bodies(mode, connections):
+    async def test(server):
+        async with AsyncServerProxy(server.url) as proxy:
+            for value in ("short", "x" * 200000, "été"):
+                assert await proxy.echo(value) == value
+        assert server.connections == connections
+
+    run(test, mode)
+
+def test_reconnect_once_on_stale_connection():
+    async def test(server):
+        async with AsyncServerProxy(server.url) as proxy:
+            assert await proxy.echo(1) == 1
+            # the pooled connection is closed by the server when reused
+            server.drop_request = 2
+            assert await proxy.echo(2) == 2
+        assert server.connections == 2
+
+    run(test)
+
+def test_new_connection_failing_is_not_retried():
+    async def test(server):
+        server.drop_request = 1
+        async with AsyncServerProxy(server.url) as proxy:
+            with pytest.raises(ConnectionResetError):
+                await proxy.echo(1)
+        assert server.connections == 1
+
+    run(test)
+
+def test_cancellation_closes_the_connection():
+    async def test(server):
+        async with AsyncServerProxy(server.url) as proxy:
+            assert await proxy.echo(1) == 1
+            task = asyncio.ensure_future(proxy.slow(30))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert proxy._idle == []
+            assert await proxy.echo(2) == 2
+        assert server.connections == 2
+
+    run(test)
+
+def test_fault_keeps_the_connection():
+    async def test(server):
+        async with AsyncServerProxy(server.url) as proxy:
+            with pytest.raises(xmlrpc.client.Fault):
+                await proxy.fail(1)
+            assert await proxy.echo(1) == 1
+        assert server.connections == 1
+
+    run(test)
+
+def test_multicall_faults():
+    async def test(server):
+        async with AsyncServerProxy(server.url) as proxy:
+            results = await proxy.multicall([("echo", (1,)), ("fail", (42,)),
+                                             ("echo", ("a",))])
+        assert results[0] == 1 and results[2] == "a"
+        assert isinstance(results[1], xmlrpc.client.Fault)
+        assert results[1].faultCode == 42
+        async with AsyncTPH(AsyncServerProxy(server.url)) as tph:
+            assert await tph.call_many("echo", [(1,), (2,)],
+                                       chunk_size=1) == [1, 2]
+            results = await tph.call_many("fail", [(1,), (2,)], faults=True)
+            assert [fault.faultCode for fault in results] == [1, 2]
+            with pytest.raises(xmlrpc.client.Fault):
+                await tph.call_many("fail", [(3,)])
+
+    run(test)
+
+def test_failed_call_cancels_the_other_ones():
+    async def test(server):
+        proxy = AsyncServerProxy(server.url, max_concurrency=4)
+        async with AsyncTPH(proxy, multicall=False) as tph:
+            with pytest.raises(xmlrpc.client.Fault):
+                await tph.call_many("slow", [(30,), (30,), (-1,)])
+            # the slow calls are not in progress anymore
+            assert proxy._semaphore._value == 4
+            assert len(proxy._idle) == 1
+
+    run(test)
+
+@pytest.mark.parametrize("size", [0, 1, 3, CHUNK_SIZE - 1, CHUNK_SIZE,
+                                  CHUNK_SIZE + 1, 3 * CHUNK_SIZE + 2])
+def test_ticket_attachments(size, tmp_path):
+    data = os.urandom(size)
+    source = tmp_path / "file.bin"
+    source.write_bytes(data)
+
+    async def test(server):
+        async with AsyncTPH(AsyncServerProxy(server.url)) as tph:
+            assert await tph.ticket_attachment_put(
+                12, {str(source) : "a file"}
+            ) == ["file.bin"]
+            assert await tph.ticket_attachment_list(12) == ["file.bin"]
+            assert await tph.ticket_attachment_get_many([
+                (12, "file.bin", str(tmp_path / "copy1")),
+                (12, "file.bin", str(tmp_path / "copy2")),
+            ]) == [("12/file.bin", str(tmp_path / "copy1")),
+                   ("12/file.bin", str(tmp_path / "copy2"))]
+        assert server.attachments["12/file.bin"] == data
+
+    run(test, "chunked")
+    assert (tmp_path / "copy1").read_bytes() == data
+    assert (tmp_path / "copy2").read_bytes() == data
+
+def test_wiki_attachments(tmp_path):
+    source = tmp_path / "image.png"
+    source.write_bytes(b"\x89PNG" * 1000)
+
+    async def test(server):
+        async with AsyncTPH(AsyncServerProxy(server.url)) as tph:
+            assert await tph.wiki_attachment_put("WikiStart",
+                                                 [str(source)]) \
+                == ["WikiStart/image.png"]
+            assert await tph.wiki_attachment_list("WikiStart") \
+                == ["WikiStart/image.png"]
+            await tph.wiki_attachment_get("WikiStart/image.png",
+                                          str(tmp_path / "copy"))
+
+    run(test, "gzip")
+    assert (tmp_path / "copy").read_bytes() == source.read_bytes()
+
+def test_failed_download_leaves_no_file(tmp_path):
+    async def test(server):
+        async with AsyncTPH(AsyncServerProxy(server.url)) as tph:
+            with pytest.raises(xmlrpc.client.Fault):
+                await tph.ticket_attachment_get(12, "missing",
+                                                str(tmp_path / "copy"))
+
+    run(test)
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import pytest
+
+from tph.attributes import TPHAttributes
+
+FIELDS = ["summary", "owner", "keywords", "parents"]
+
+@pytest.fixture
+def attrs():
+    return TPHAttributes(FIELDS)
+
+def attributes(number, description):
+    return {"summary" : "ticket %s" % number, "owner" : "me",
+            "keywords" : "a b", "parents" : "", "description" : description}
+
+DESCRIPTIONS = [
+    "one line",
+    "several\nlines\n\nwith an empty one",
+    "a line looking like a field\nowner=someone else",
+    "#### ticket 42 #### inside a line",
+    "trailing line break\n",
+    "x" * 100000,
+]
+
+@pytest.mark.parametrize("description", DESCRIPTIONS)
+def test_dump_load(attrs, description):
+    # load drops the last line break, as the editors add one
+    expected = attributes(1, description.rstrip("\n"))
+    assert attrs.load(attrs.dump(attributes(1, description))) == expected
+
+def test_load_without_description(attrs):
+    loaded = attrs.load("summary=s\nowner=\n")
+    assert loaded == {"summary" : "s", "owner" : ""}
+
+def test_load_other_line_breaks(attrs):
+    loaded = attrs.load("summary=s\r\nowner=me\r\nfirst\r\nsecond")
+    assert loaded == {"summary" : "s", "owner" : "me",
+                      "description" : "first\nsecond"}
+
+def test_dump_many_load_many(attrs):
+    tickets = [(number, attributes(number, description))
+               for (number, description) in enumerate(DESCRIPTIONS, 1)
+               if not description.endswith("\n")]
+    assert attrs.load_many(attrs.dump_many(tickets)) == ("", tickets)
+
+def test_load_many_preamble(attrs):
+    string = "a comment\n" + attrs.dump_many([(12, attributes(12, "d"))])
+    assert attrs.load_many(string) == ("a comment\n",
+                                       [(12, attributes(12, "d"))])
+    assert attrs.load_many("no section") == ("no section", [])
+
+def test_load_many_accepts_hash_and_crlf(attrs):
+    string = "#### ticket #3 ####\r\nsummary=s\r\nd\r\n"
+    assert attrs.load_many(string) == ("", [(3, {"summary" : "s",
+                                                 "description" : "d"})])
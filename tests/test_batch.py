@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import json
+import socketserver
+import sys
+import threading
+import xmlrpc.server
+
+import pytest
+
+from tph import trac_cmd, transport
+from tph.instrumentation import InstrumentedServerProxy, Recorder
+from tph.trac_cmd import TracCmd
+
+@pytest.mark.parametrize("options", [
+    ["--batch", "FILE"], ["--json", "--batch", "FILE"],
+    ["--batch=FILE", "--jobs", "2"], ["--jobs=2", "--json", "--batch=FILE"],
+])
+def test_batch_options(options, monkeypatch, tmp_path):
+    commands = tmp_path / "commands.txt"
+    commands.write_text("whoami\nmethod_list\n")
+    runs = []
+
+    def batch(self, lines, worker_factory=None, jobs=4, json_output=False):
+        runs.append((lines, jobs, json_output))
+        return 0
+
+    monkeypatch.setattr(trac_cmd, "get_configuration_options",
+                        lambda:("me", None, "http", "host", "/trac", "", {}))
+    monkeypatch.setattr(TracCmd, "batch", batch)
+    monkeypatch.setattr(sys, "argv", ["trac_cmd.py"] + [
+        option.replace("FILE", str(commands)) for option in options
+    ])
+    with pytest.raises(SystemExit) as exit:
+        trac_cmd.main()
+    assert exit.value.code == 0
+    assert runs == [(["whoami\n", "method_list\n"],
+                     2 if "2" in " ".join(options) else 4,
+                     "--json" in options)]
+
+def test_options_without_batch(monkeypatch):
+    monkeypatch.setattr(trac_cmd, "get_configuration_options",
+                        lambda:("me", None, "http", "host", "/trac", "", {}))
+    monkeypatch.setattr(sys, "argv", ["trac_cmd.py", "--json"])
+    with pytest.raises(SystemExit) as exit:
+        trac_cmd.main()
+    assert exit.value.code == 2
+
+class Server(socketserver.ThreadingMixIn, xmlrpc.server.SimpleXMLRPCServer):
+    daemon_threads = True
+
+@pytest.fixture
+def trac():
+    server = Server(("127.0.0.1", 0), logRequests=False)
+    server.register_introspection_functions()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%s/RPC2" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+def test_batch_commands_are_measured(trac, tmp_path, capsys):
+    trace_file = tmp_path / "trace.jsonl"
+    recorder = Recorder(str(trace_file))
+
+    def make_cmd():
+        return TracCmd(InstrumentedServerProxy(
+            trac, recorder,
+            transport=transport.make_transport("http", recorder=recorder)
+        ), login="me")
+
+    program = make_cmd()
+    lines = ["method_help system.listMethods", "method_list",
+             "method_help system.methodHelp", "whoami"]
+    assert program.batch(lines, worker_factory=make_cmd) == 0
+    recorder.close()
+    calls = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    assert sorted((call["command"], call["method"]) for call in calls) == [
+        ("method_help system.listMethods", "system.methodHelp"),
+        ("method_help system.methodHelp", "system.methodHelp"),
+        ("method_list", "system.listMethods"),
+    ]
+    assert recorder.session.methods["system.methodHelp"].calls == 2
+    assert recorder.command_line is not None
+    assert recorder.command.wall is not None
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import xmlrpc.client
+
+import pytest
+
+from tph.trac_cmd import TracCmd
+
+FIELDS = ["summary", "owner", "keywords", "description", "time"]
+
+class TicketsServer(object):
+    """Server proxy of a trac whose tickets are the dictionary tickets number
+    -> attributes. Updating the ticket numbers in self.failing fails."""
+
+    def __init__(self, tickets, prefix="", failing=()):
+        self.tickets = tickets
+        self.prefix = prefix
+        self.failing = failing
+        self.updates = []
+
+    def __getattr__(self, name):
+        name = self.prefix + name
+        if name in ("ticket", "system"):
+            server = TicketsServer(self.tickets, name + ".", self.failing)
+            server.updates = self.updates
+            return server
+        return getattr(self, name.replace(".", "_"))
+
+    def ticket_getTicketFields(self):
+        return [{"name" : name} for name in FIELDS]
+
+    def ticket_get(self, number):
+        return [number, None, None, dict(self.tickets[number])]
+
+    def ticket_update(self, number, comment, attributes, notify):
+        self.updates.append((number, comment, attributes))
+        if number in self.failing:
+            raise xmlrpc.client.Fault(1, "ticket %s is locked" % number)
+        ticket = self.tickets[number]
+        if attributes.pop("_ts") != ticket["_ts"]:
+            raise xmlrpc.client.Fault(
+                1, "Ticket has been updated since last get"
+            )
+        ticket.update(attributes)
+        ticket["_ts"] += "+"
+        return self.ticket_get(number)
+
+def ticket(number, **attributes):
+    result = {"summary" : "ticket %s" % number, "owner" : "me",
+              "keywords" : "a b", "description" : "first\nsecond",
+              "_ts" : "ts%s" % number}
+    result.update(attributes)
+    return result
+
+@pytest.fixture
+def server():
+    return TicketsServer(
+        dict((number, ticket(number)) for number in range(1, 6)),
+        failing=(5,)
+    )
+
+@pytest.fixture
+def program(server):
+    return TracCmd(server, tph_options={"multicall" : False})
+
+def test_batch_update_statuses(server, program):
+    tickets = program.tph.ticket_get_many([1, 2, 3, 4, 5])
+    # ticket 3 is changed by someone else after it has been got
+    server.tickets[3]["_ts"] = "changed"
+    results = program.tph.ticket_batch_update(
+        [(1, {"owner" : "me"}),
+         ("#2", {"owner" : "you", "keywords" : "+c"}),
+         (3, {"owner" : "you"}),
+         (4, {"keywords" : "-a"}),
+         (5, {"owner" : "you"})],
+        "a comment", tickets=tickets
+    )
+    assert [(result["ticket"], result["status"]) for result in results] == [
+        (1, "unchanged"), (2, "updated"), (3, "conflict"), (4, "updated"),
+        (5, "failed"),
+    ]
+    assert results[1]["changes"] == {"owner" : "you", "keywords" : "a b c"}
+    assert results[3]["changes"] == {"keywords" : "b"}
+    assert results[4]["message"] == "ticket 5 is locked"
+    assert [(number, comment) for (number, comment, attributes)
+            in server.updates] == [(2, "a comment"), (3, "a comment"),
+                                   (4, "a comment"), (5, "a comment")]
+    assert server.tickets[2]["owner"] == "you"
+    assert server.tickets[3]["owner"] == "me"
+    assert server.tickets[4]["keywords"] == "b"
+
+def test_batch_update_dry_run(server, program):
+    results = program.tph.ticket_batch_update(
+        [(1, {"owner" : "me"}), (2, {"owner" : "you", "keywords" : "c"})],
+        dry_run=True
+    )
+    assert [result["status"] for result in results] == ["unchanged",
+                                                        "dry-run"]
+    assert server.updates == []
+    assert server.tickets[2] == ticket(2)
+
+def test_batch_report_dry_run_is_deterministic(program, capsys):
+    results = program.tph.ticket_batch_update(
+        [(2, {"owner" : "you", "keywords" : "c d",
+              "description" : "first\nchanged"})],
+        dry_run=True
+    )
+    program._ticket_batch_report(results)
+    assert capsys.readouterr().out == "".join([
+        "--- #2\n",
+        "+++ #2\n",
+        "@@ -1,5 +1,5 @@\n",
+        "-keywords=a b\n",
+        "-owner=me\n",
+        "+keywords=a b c d\n",
+        "+owner=you\n",
+        " summary=ticket 2\n",
+        " first\n",
+        "-second\n",
+        "+changed\n",
+        "\n",
+        "1 dry-run\n",
+    ])
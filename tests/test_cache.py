@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import datetime
+import xmlrpc.client
+
+import pytest
+
+from tph.cache import TicketCache
+from tph.trhaelppyercthon import TPH
+
+class TracServer(object):
+    """Server proxy of a trac whose tickets are the dictionary tickets number
+    -> attributes. self.changed are the tickets given by getRecentChanges and
+    getting a ticket of self.broken raises an OSError."""
+
+    def __init__(self, tickets, prefix="", calls=None):
+        self.tickets = tickets
+        self.prefix = prefix
+        self.calls = [] if calls is None else calls
+        self.changed = []
+        self.broken = []
+
+    def __getattr__(self, name):
+        name = self.prefix + name
+        if name in ("ticket", "system"):
+            server = TracServer(self.tickets, name + ".", self.calls)
+            server.__dict__.update(changed=self.changed, broken=self.broken)
+            return server
+        return getattr(self, name.replace(".", "_"))
+
+    def ticket_getTicketFields(self):
+        return [{"name" : name} for name in ("summary", "owner", "status")]
+
+    def ticket_get(self, number):
+        self.calls.append(("ticket.get", number))
+        if number in self.broken:
+            raise OSError("connection reset")
+        if number not in self.tickets:
+            raise xmlrpc.client.Fault(404, "Ticket %s does not exist" % number)
+        return [number, None, None, dict(self.tickets[number])]
+
+    def ticket_getRecentChanges(self, since):
+        self.calls.append(("ticket.getRecentChanges", since))
+        return list(self.changed)
+
+    def ticket_query(self, query):
+        self.calls.append(("ticket.query", query))
+        return sorted(self.tickets)
+
+def attributes(number, owner="me", status="new"):
+    return {"summary" : "ticket %s" % number, "owner" : owner,
+            "status" : status, "_ts" : "ts"}
+
+@pytest.fixture
+def server():
+    return TracServer(dict(
+        (number, attributes(number)) for number in range(1, 6)
+    ))
+
+@pytest.fixture
+def tph(server, tmp_path):
+    return TPH(server, multicall=False,
+               cache=TicketCache(str(tmp_path / "cache.sqlite")))
+
+def test_incremental_sync(server, tph):
+    tph.cache_fill()
+    assert tph.cache.is_complete()
+    last_sync = tph.cache.last_sync()
+    # ticket 2 changed, ticket 5 deleted and ticket 6 created
+    server.tickets[2]["owner"] = "you"
+    del server.tickets[5]
+    server.tickets[6] = attributes(6)
+    server.changed[:] = [2, 5, 6]
+    del server.calls[:]
+    tph.cache_sync(force=True)
+    assert server.calls == [
+        ("ticket.getRecentChanges", last_sync - datetime.timedelta(minutes=5)),
+        ("ticket.get", 2), ("ticket.get", 5), ("ticket.get", 6),
+    ]
+    assert tph.cache.is_complete()
+    assert tph.cache.ticket_numbers() == [1, 2, 3, 4, 6]
+    assert tph.cache.get(2)[3]["owner"] == "you"
+    # nothing got again until something changes
+    server.changed[:] = []
+    del server.calls[:]
+    tph.cache_sync(force=True)
+    assert [name for (name, argument) in server.calls] \
+        == ["ticket.getRecentChanges"]
+
+def test_incremental_sync_of_a_partial_cache(server, tph):
+    assert [ticket[3]["owner"] for ticket in tph.ticket_get_many([1, 2])] \
+        == ["me", "me"]
+    assert not tph.cache.is_complete()
+    server.tickets[2]["owner"] = "you"
+    server.changed[:] = [2, 3]
+    tph.cache_sync(force=True)
+    # the changed tickets are only dropped, to be got again when needed
+    assert tph.cache.ticket_numbers() == [1]
+    del server.calls[:]
+    assert [ticket[3]["owner"] for ticket in tph.ticket_get_many([1, 2])] \
+        == ["me", "you"]
+    assert server.calls == [("ticket.get", 2)]
+
+def test_partial_fill_clears_complete(server, tph):
+    tph.cache_fill()
+    assert tph.cache.is_complete()
+    server.broken[:] = [4]
+    with pytest.raises(OSError):
+        tph.cache_fill()
+    assert not tph.cache.is_complete()
+    # the queries are not evaluated on the partial cache
+    del server.calls[:]
+    assert tph.ticket_query("owner=me") == [1, 2, 3, 4, 5]
+    assert server.calls == [("ticket.query", "owner=me")]
+
+def test_query_evaluated_locally_when_complete(server, tph):
+    tph.cache_fill()
+    server.tickets[3]["owner"] = "you"
+    server.changed[:] = [3]
+    tph.cache_sync(force=True)
+    del server.calls[:]
+    assert tph.ticket_query("owner=you&order=id") == [3]
+    assert server.calls == []
+
+@pytest.mark.parametrize("query", [
+    # unknown field
+    "milestone=m1",
+    # not understood by query.Query
+    "owner=$USER",
+    "summary^=ticket",
+])
+def test_query_falls_back_to_the_trac(server, tph, query):
+    tph.cache_fill()
+    del server.calls[:]
+    assert tph.ticket_query(query) == [1, 2, 3, 4, 5]
+    assert server.calls == [("ticket.query", query)]
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import threading
+
+from tph.trhaelppyercthon import TPH
+
+class EchoServer(object):
+    """Server proxy whose methods return the name of the server and their
+    arguments."""
+
+    def __init__(self, name):
+        self.name = name
+        self.threads = set()
+
+    def __getattr__(self, method_name):
+        def method(*args):
+            self.threads.add(threading.current_thread().name)
+            return (self.name, method_name) + args
+        return method
+
+def test_threaded_calls_use_the_worker_servers():
+    servers = []
+
+    def server_factory():
+        servers.append(EchoServer("worker"))
+        return servers[-1]
+
+    tph = TPH(EchoServer("main"), server_factory=server_factory,
+              multicall=False, max_workers=4)
+    results = tph.call_many("ticket.get", [(number,) for number in range(20)])
+    assert results == [("worker", "ticket.get", number)
+                       for number in range(20)]
+    assert 1 <= len(servers) <= 4
+
+def test_given_server_is_honoured():
+    def server_factory():
+        raise AssertionError("the given server should be used")
+
+    server = EchoServer("given")
+    tph = TPH(EchoServer("main"), server_factory=server_factory,
+              multicall=False, max_workers=4)
+    results = tph.call_many("ticket.get", [(number,) for number in range(20)],
+                            server=server)
+    assert results == [("given", "ticket.get", number)
+                       for number in range(20)]
+    assert server.threads == set([threading.current_thread().name])
+
+def test_executor_created_once():
+    tph = TPH(EchoServer("main"), server_factory=lambda:EchoServer("worker"),
+              multicall=False, max_workers=4)
+    executors = set()
+
+    def run():
+        tph.call_many("ticket.get", [(number,) for number in range(10)])
+        executors.add(id(tph._executor))
+
+    threads = [threading.Thread(target=run) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(executors) == 1
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import pytest
+
+from tph import daemon
+from tph.trac_cmd import TracCmd
+
+def test_forwarded_commands_exist():
+    commands = set(name[len("do_"):] for name in dir(TracCmd)
+                   if name.startswith("do_"))
+    assert daemon.forwarded_commands <= commands
+    for name in daemon.forwarded_commands:
+        # a command of its own, not a shortcut to another one
+        assert getattr(TracCmd, "do_" + name).__name__ == "do_" + name
+    assert TracCmd.parallel_commands <= daemon.forwarded_commands
+
+@pytest.mark.parametrize("argv", [
+    [], ["daemon"], ["--batch", "commands.txt"], ["ticket_edit", "1"],
+    ["ticket_edit_many", "1", "2"], ["ticket_create"], ["ticket_split", "1",
+                                                          "2"],
+    ["template_edit"], ["ticket_web", "1"], ["_interpreter"],
+])
+def test_interactive_commands_run_locally(argv, monkeypatch):
+    def socket_path():
+        raise AssertionError("%s should not be forwarded" % argv)
+
+    monkeypatch.setattr(daemon, "socket_path", socket_path)
+    assert daemon.forward(argv) is None
+
+def test_forward_without_daemon(monkeypatch, tmp_path):
+    monkeypatch.setattr(daemon, "socket_path",
+                        lambda:str(tmp_path / "socket"))
+    assert daemon.forward(["ticket_summary", "1"]) is None
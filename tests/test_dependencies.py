@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+from tph.dependencies import DependencyGraph
+
+def ticket(number, blockedby="", blocking="", status="new", milestone="m1",
+           hours=1):
+    return [number, None, None, {"blockedby" : blockedby,
+                                 "blocking" : blocking, "status" : status,
+                                 "milestone" : milestone,
+                                 "estimatedhours" : str(hours)}]
+
+def graph(*tickets):
+    return DependencyGraph(
+        tickets, weight=lambda ticket:float(ticket[3]["estimatedhours"])
+    )
+
+def test_blockers_from_both_fields():
+    dependencies = graph(ticket(1, blockedby="#2, 3"), ticket(2),
+                         ticket(3, blocking="4"), ticket(4), ticket(5, "99"))
+    assert dependencies.blockers == {1 : [2, 3], 2 : [], 3 : [], 4 : [3],
+                                     5 : []}
+
+def test_components_blockers_first():
+    dependencies = graph(ticket(1, "2"), ticket(2, "3"), ticket(3))
+    assert dependencies.components() == [[3], [2], [1]]
+    assert dependencies.cycles() == []
+
+def test_cycles():
+    dependencies = graph(ticket(1, "2"), ticket(2, "3"), ticket(3, "1"),
+                         ticket(4, "1"), ticket(5, "5"), ticket(6))
+    assert sorted(dependencies.cycles()) == [[1, 2, 3], [5]]
+    components = dependencies.components()
+    # the cycle blocking 4 comes before it
+    assert components.index([1, 2, 3]) < components.index([4])
+
+def test_long_chain_is_not_recursive():
+    size = 20000
+    dependencies = graph(*[ticket(number, str(number + 1))
+                           for number in range(1, size)] + [ticket(size)])
+    assert len(dependencies.components()) == size
+    (weight, path) = dependencies.critical_path()
+    assert weight == size
+    assert path == list(range(size, 0, -1))
+
+def test_critical_path():
+    dependencies = graph(ticket(1, "2, 3", hours=1), ticket(2, hours=5),
+                         ticket(3, "4", hours=2), ticket(4, hours=2),
+                         ticket(5, hours=3))
+    assert dependencies.critical_path() == (6, [2, 1])
+    assert dependencies.critical_path([3, 5]) == (4, [4, 3])
+    assert dependencies.critical_path([42]) == (0, [])
+
+def test_critical_path_skips_closed_tickets_and_cycles():
+    dependencies = graph(ticket(1, "2", hours=1),
+                         ticket(2, "3", hours=10, status="closed"),
+                         ticket(3, hours=1), ticket(4, "5", hours=1),
+                         ticket(5, "4", hours=1))
+    assert dependencies.critical_path([1]) == (1, [1])
+    assert dependencies.critical_path([4]) == (1, [4])
+
+def test_outside_blockers():
+    dependencies = graph(ticket(1, "2"), ticket(2, "3", milestone="m2"),
+                         ticket(3, milestone="m3"), ticket(4, "5"),
+                         ticket(5, milestone="m2", status="closed"),
+                         ticket(6, "1"))
+    assert dependencies.outside_blockers("m1") == {1 : [2, 3], 6 : [2, 3]}
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+from tph.hierarchy import TicketHierarchy, ticket_numbers
+from tph.query import Query
+from tph.trhaelppyercthon import TPH
+
+class HierarchyServer(object):
+    """Server proxy of a trac holding tickets, a dictionary giving the parents
+    of each ticket id."""
+
+    def __init__(self, tickets):
+        self.tickets = {
+            number : [number, None, None, {"parents" : parents,
+                                           "estimatedhours" : "1"}]
+            for (number, parents) in tickets.items()
+        }
+        self.queries = []
+        self.got = []
+
+    def __getattr__(self, method_name):
+        return getattr(self, method_name.replace(".", "_"))
+
+    def ticket_query(self, query):
+        self.queries.append(query)
+        return Query(query).execute(self.tickets.values())
+
+    def ticket_get(self, number):
+        self.got.append(number)
+        return self.tickets[number]
+
+def test_ticket_numbers():
+    assert ticket_numbers("#12, 15") == [12, 15]
+    assert ticket_numbers("") == [] and ticket_numbers(None) == []
+
+def test_walk_ignores_cycles():
+    hierarchy = TicketHierarchy([[1, None, None, {"parents" : "3"}],
+                                 [2, None, None, {"parents" : "1"}],
+                                 [3, None, None, {"parents" : "2"}]])
+    assert list(hierarchy.walk(1)) == [(0, 1), (1, 2), (2, 3)]
+    assert hierarchy.descendants(1) == set([1, 2, 3])
+
+def test_substring_parents_are_not_sons():
+    # 112 and 120 contain 12 but are not its sons
+    server = HierarchyServer({12 : "", 13 : "#12", 112 : "1", 120 : "#112",
+                              14 : "13, 112", 1 : ""})
+    tph = TPH(server, multicall=False)
+    hierarchy = tph.ticket_hierarchy(["#12"])
+    assert sorted(hierarchy.tickets) == [12, 13, 14]
+    assert list(hierarchy.walk(12)) == [(0, 12), (1, 13), (2, 14)]
+    # one query per level and each ticket got once
+    assert server.queries == ["parents=~12&max=0", "parents=~13&max=0",
+                              "parents=~14&max=0"]
+    assert sorted(server.got) == [12, 13, 14, 120]
+
+def test_remaining_time_sum_accepts_hash():
+    server = HierarchyServer({12 : "", 13 : "#12", 112 : "1"})
+    tph = TPH(server, multicall=False)
+    assert tph.ticket_remaining_time_sum("#12") == 2
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import pytest
+
+from tph.instrumentation import (Call, Stats, Recorder,
+                                 InstrumentedServerProxy,
+                                 InstrumentedJsonServerProxy)
+
+def call(method, latency, error=None, request_bytes=100, response_bytes=1000):
+    result = Call(method, request_bytes, 0.0, marshal=latency / 10)
+    result.wait = latency / 2
+    result.unmarshal = latency / 5
+    result.latency = latency
+    result.response_bytes = response_bytes
+    result.error = error
+    return result
+
+def test_stats_aggregation():
+    stats = Stats()
+    for latency in (0.0005, 0.001, 0.003, 0.003, 20.0):
+        stats.add(call("ticket.get", latency))
+    stats.add(call("ticket.query", 0.05, error="Fault 1", request_bytes=10))
+    assert sorted(stats.methods) == ["ticket.get", "ticket.query"]
+    get = stats.methods["ticket.get"]
+    assert (get.calls, get.errors) == (5, 0)
+    assert get.latency == pytest.approx(20.0075)
+    assert get.marshal == pytest.approx(2.00075)
+    assert get.wait == pytest.approx(10.00375)
+    assert get.unmarshal == pytest.approx(4.0015)
+    assert (get.request_bytes, get.response_bytes) == (500, 5000)
+    # <=1ms twice, <=5ms twice and above the last bound once
+    assert get.histogram == [2, 0, 2] + [0] * 10 + [1]
+    query = stats.methods["ticket.query"]
+    assert (query.calls, query.errors, query.request_bytes) == (1, 1, 10)
+    assert query.histogram[5] == 1 and sum(query.histogram) == 1
+    stats.wall = 30.0
+    lines = stats.format().splitlines()
+    assert lines[1].split() == ["ticket.get", "5", "0", "20007.5", "2000.8",
+                                "10003.8", "4001.5", "500", "5000"]
+    assert lines[2].split()[:3] == ["ticket.query", "1", "1"]
+    assert lines[3] == "6 call(s), 20057.5 ms in the calls, of which 10028.8" \
+        " ms sending and waiting, 30000.0 ms elapsed"
+    assert lines[5] == "  ticket.get: <=1ms:2 <=5ms:2 >10000ms:1"
+    assert lines[6] == "  ticket.query: <=50ms:1"
+
+def test_recorder_commands():
+    recorder = Recorder()
+    recorder.start_command("first")
+    recorder.end(recorder.begin(b"<methodName>ticket.get</methodName>"))
+    first = recorder.command
+    recorder.end_command()
+    recorder.start_command("second")
+    recorder.end(recorder.begin(b"<methodName>ticket.get</methodName>"))
+    recorder.end(recorder.begin(b'{"method": "wiki.getPage"}'))
+    recorder.end_command()
+    assert first.methods["ticket.get"].calls == 1
+    assert first.wall is not None
+    assert sorted(recorder.command.methods) == ["ticket.get", "wiki.getPage"]
+    assert recorder.session.methods["ticket.get"].calls == 2
+
+@pytest.mark.parametrize("proxy_class, uri", [
+    (InstrumentedServerProxy, "http://localhost:1/RPC2"),
+    (InstrumentedJsonServerProxy, "http://localhost:1/jsonrpc"),
+])
+def test_failed_marshalling_is_forgotten(proxy_class, uri):
+    recorder = Recorder()
+    proxy = proxy_class(uri, recorder)
+    with pytest.raises(TypeError):
+        proxy.ticket.get(object())
+    # the next request is not taken for the call that failed
+    call = recorder.begin(b"<methodName>wiki.getPage</methodName>")
+    assert call.method == "wiki.getPage"
+    assert call.marshal == 0.0
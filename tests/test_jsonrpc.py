@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import datetime
+import json
+import xmlrpc.client
+
+import pytest
+
+from tph import jsonrpc
+
+class RecordingTransport(object):
+    """Transport answering with response, a JSON-RPC response body, and
+    keeping the request bodies."""
+
+    def __init__(self, response):
+        self.response = response
+        self.bodies = []
+
+    def request(self, host, handler, request_body, verbose=False):
+        self.bodies.append(request_body)
+        return jsonrpc.loads(self.response)[0]
+
+def test_multicall_request_body():
+    transport = RecordingTransport(jsonrpc.dumps(([],), methodresponse=True,
+                                                 request_id=1))
+    proxy = jsonrpc.JsonServerProxy("http://somesite/trac/jsonrpc",
+                                    transport=transport)
+    multicall = xmlrpc.client.MultiCall(proxy)
+    multicall.ticket.get(1)
+    multicall.ticket.changeLog(2)
+    multicall()
+    assert json.loads(transport.bodies[0]) == {
+        "method" : "system.multicall",
+        "params" : [
+            {"method" : "ticket.get", "params" : [1], "id" : 0},
+            {"method" : "ticket.changeLog", "params" : [2], "id" : 1},
+        ],
+        "id" : 1,
+    }
+
+def test_multicall_response_mapping():
+    transport = RecordingTransport(json.dumps({
+        "result" : [
+            {"result" : [1, "ticket"], "error" : None, "id" : 0},
+            {"result" : None, "error" : {"code" : 404,
+                                         "message" : "no ticket 2",
+                                         "name" : "JSONRPCError"},
+             "id" : 1},
+        ],
+        "error" : None,
+        "id" : 1,
+    }).encode("utf-8"))
+    proxy = jsonrpc.JsonServerProxy("http://somesite/trac/jsonrpc",
+                                    transport=transport)
+    multicall = xmlrpc.client.MultiCall(proxy)
+    multicall.ticket.get(1)
+    multicall.ticket.get(2)
+    results = multicall()
+    assert results[0] == [1, "ticket"]
+    with pytest.raises(xmlrpc.client.Fault) as fault:
+        results[1]
+    assert fault.value.faultCode == 404
+    assert fault.value.faultString == "no ticket 2"
+
+def test_single_call():
+    transport = RecordingTransport(jsonrpc.dumps((["a", "b"],),
+                                                 methodresponse=True,
+                                                 request_id=1))
+    proxy = jsonrpc.JsonServerProxy("http://somesite/trac/jsonrpc",
+                                    transport=transport)
+    assert proxy.ticket.query("status=new") == ["a", "b"]
+    assert json.loads(transport.bodies[0]) == {
+        "method" : "ticket.query", "params" : ["status=new"], "id" : 1,
+    }
+
+def test_dumps_loads_round_trip():
+    date = datetime.datetime(2011, 7, 24, 12, 0, 0)
+    params = ([xmlrpc.client.DateTime(date), xmlrpc.client.Binary(b"\0data"),
+               {"key" : "value"}, None, 3],)
+    ((result,), method) = jsonrpc.loads(
+        jsonrpc.dumps(params, methodresponse=True, request_id=1)
+    )
+    assert method is None
+    assert result == list(params[0])
+    ((result,), method) = jsonrpc.loads(
+        jsonrpc.dumps(params, methodresponse=True, request_id=1),
+        use_builtin_types=True
+    )
+    assert result[:2] == [date, b"\0data"]
+
+def test_datetime_wire_format():
+    body = jsonrpc.dumps((datetime.datetime(2011, 7, 24, 12, 0, 0),),
+                         "ticket.getRecentChanges", request_id=3)
+    assert json.loads(body)["params"] == [
+        {"__jsonclass__" : ["datetime", "2011-07-24T12:00:00"]}
+    ]
+
+def test_fault_response():
+    with pytest.raises(xmlrpc.client.Fault) as fault:
+        jsonrpc.loads(jsonrpc.dumps(xmlrpc.client.Fault(1, "boom"),
+                                    request_id=1))
+    assert fault.value.faultString == "boom"
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import socketserver
+import threading
+import time
+import xmlrpc.client
+import xmlrpc.server
+
+import pytest
+
+from tph import transport
+from tph.metadata import MetadataCache
+from tph.trhaelppyercthon import TPH
+
+class FieldsServer(object):
+    """Server proxy whose ticket fields are the ones of self.names."""
+
+    def __init__(self, names):
+        self.names = names
+        self.calls = 0
+
+    def __getattr__(self, name):
+        assert name == "ticket.getTicketFields"
+        return self.get_ticket_fields
+
+    def get_ticket_fields(self):
+        self.calls += 1
+        return [{"name" : name} for name in self.names]
+
+def test_invalidate_builds_attrs_again(tmp_path):
+    server = FieldsServer(["summary", "owner"])
+    tph = TPH(server, metadata=MetadataCache(str(tmp_path / "metadata.json")))
+    attrs = tph.attrs
+    server.names = ["summary", "owner", "keywords"]
+    tph.metadata_invalidate(["ticket_fields"])
+    assert tph.attrs is not attrs
+    assert [field["name"] for field in tph.ticket_fields] == server.names
+
+def test_ticket_fields_follow_the_metadata_max_age(tmp_path):
+    server = FieldsServer(["summary"])
+    metadata = MetadataCache(str(tmp_path / "metadata.json"), max_age=60)
+    tph = TPH(server, metadata=metadata)
+    attrs = tph.attrs
+    assert tph.attrs is attrs
+    assert server.calls == 1
+    server.names = ["summary", "owner"]
+    metadata.values["ticket_fields"]["time"] = time.time() - 120
+    assert [field["name"] for field in tph.ticket_fields] == server.names
+    assert tph.attrs is not attrs
+    assert server.calls == 2
+
+def test_ticket_fields_without_metadata_cache():
+    server = FieldsServer(["summary"])
+    tph = TPH(server)
+    tph.ticket_fields
+    tph.attrs
+    assert server.calls == 1
+    tph.metadata_invalidate()
+    tph.ticket_fields
+    assert server.calls == 2
+
+class Server(socketserver.ThreadingMixIn, xmlrpc.server.SimpleXMLRPCServer):
+    daemon_threads = True
+
+@pytest.fixture
+def trac():
+    """Local XML-RPC server whose milestones and components are the lists
+    server.milestones and server.components, counting the calls in
+    server.calls."""
+    server = Server(("127.0.0.1", 0), logRequests=False)
+    server.milestones = ["m1"]
+    server.components = ["core"]
+    server.calls = []
+
+    def get_all(key):
+        def function():
+            server.calls.append(key)
+            return getattr(server, key)
+        return function
+
+    server.register_function(get_all("milestones"), "ticket.milestone.getAll")
+    server.register_function(get_all("components"), "ticket.component.getAll")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def tph_of(trac, metadata):
+    return TPH(xmlrpc.client.ServerProxy(
+        "http://127.0.0.1:%s/RPC2" % trac.server_address[1],
+        transport=transport.make_transport("http")
+    ), metadata=metadata)
+
+def test_metadata_expire_after_max_age(trac, tmp_path):
+    path = str(tmp_path / "metadata.json")
+    tph = tph_of(trac, MetadataCache(path, max_age=60))
+    assert tph.metadata_get("milestones") == ["m1"]
+    trac.milestones = ["m1", "m2"]
+    assert tph.metadata_get("milestones") == ["m1"]
+    # a new session reads them from the file
+    tph = tph_of(trac, MetadataCache(path, max_age=60))
+    assert tph.metadata_get("milestones") == ["m1"]
+    assert trac.calls == ["milestones"]
+    tph.metadata.values["milestones"]["time"] = time.time() - 61
+    assert tph.metadata_get("milestones") == ["m1", "m2"]
+    assert trac.calls == ["milestones", "milestones"]
+    # the new value has been saved
+    tph = tph_of(trac, MetadataCache(path, max_age=60))
+    assert tph.metadata_get("milestones") == ["m1", "m2"]
+    assert len(trac.calls) == 2
+
+def test_metadata_invalidate_reloads(trac, tmp_path):
+    path = str(tmp_path / "metadata.json")
+    tph = tph_of(trac, MetadataCache(path))
+    assert tph.metadata_get("milestones") == ["m1"]
+    assert tph.metadata_get("components") == ["core"]
+    trac.milestones = ["m2"]
+    trac.components = ["ui"]
+    tph.metadata_invalidate(["milestones"])
+    assert tph.metadata_get("milestones") == ["m2"]
+    assert tph.metadata_get("components") == ["core"]
+    # the invalidation is seen by the other sessions
+    assert MetadataCache(path).values["milestones"]["value"] == ["m2"]
+    tph.metadata_invalidate()
+    assert MetadataCache(path).values == {}
+    assert tph.metadata_get("components") == ["ui"]
+    assert trac.calls == ["milestones", "components", "milestones",
+                          "components"]
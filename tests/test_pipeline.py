@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import xmlrpc.client
+
+from tph.attributes import TPHAttributes
+from tph.pipeline import EditPipeline
+from tph.trhaelppyercthon import TPH
+
+class FailingServer(object):
+    """Server proxy refusing all the changes."""
+
+    def __getattr__(self, method_name):
+        def method(*args):
+            if method_name == "ticket.update":
+                raise xmlrpc.client.Fault(
+                    1, "Sorry, can not save your changes. This ticket has been"
+                    " modified by someone else since you started"
+                    " (updated since last get)"
+                )
+            raise xmlrpc.client.Fault(2, "%s refused" % method_name)
+        return method
+
+def make_pipeline():
+    tph = TPH(FailingServer(), server_factory=FailingServer)
+    tph.attrs = TPHAttributes(["summary", "owner", "keywords"])
+    return (tph, EditPipeline(tph))
+
+def test_kept_update_is_read_back_by_load_many():
+    (tph, pipeline) = make_pipeline()
+    attributes = {"owner" : "me", "keywords" : "a b"}
+    pipeline.update(12, "a comment", attributes)
+    (result,) = pipeline.finish()
+    assert result["status"] == "conflict"
+    with open(result["kept"], encoding="utf-8") as fil:
+        (preamble, tickets) = tph.attrs.load_many(fil.read())
+    assert preamble.strip() == "a comment"
+    assert tickets == [(12, tph.attrs.load(tph.attrs.dump(attributes)))]
+
+def test_kept_creation_is_read_back_by_load():
+    (tph, pipeline) = make_pipeline()
+    pipeline.create("a summary", "a description\nin two lines",
+                    {"owner" : "me"})
+    (result,) = pipeline.finish()
+    assert result["status"] == "failed"
+    assert result["message"] == "ticket.create refused"
+    with open(result["kept"], encoding="utf-8") as fil:
+        attributes = tph.attrs.load(fil.read())
+    assert attributes["summary"] == "a summary"
+    assert attributes["owner"] == "me"
+    assert attributes["description"] == "a description\nin two lines"
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import pytest
+
+from tph.query import Query, UnsupportedQuery
+
+def ticket(number, **attributes):
+    return [number, None, None, attributes]
+
+TICKETS = [
+    ticket(1, status="new", owner="alice", priority="major",
+           summary="Crash on startup", milestone="m1"),
+    ticket(2, status="closed", owner="bob", priority="blocker",
+           summary="Slow startup", milestone="m1"),
+    ticket(3, status="assigned", owner="alice", priority="minor",
+           summary="Typo", milestone="m2"),
+    ticket(4, status="new", owner="", priority="major",
+           summary="Crash when saving", milestone=""),
+]
+PRIORITIES = {"priority" : ["blocker", "critical", "major", "minor"]}
+
+def execute(string, default_max=100):
+    return Query(string, default_max).execute(TICKETS, PRIORITIES)
+
+@pytest.mark.parametrize(("string", "expected"), [
+    ("status=new&order=id", [1, 4]),
+    ("status!=closed&order=id", [1, 3, 4]),
+    ("status=new|assigned&order=id", [1, 3, 4]),
+    ("summary=~crash&order=id", [1, 4]),
+    ("summary=~TYPO|saving&order=id", [3, 4]),
+    ("owner=&order=id", [4]),
+    ("owner=alice&status!=closed&order=id", [1, 3]),
+    ("milestone=m1&col=summary&col=owner&order=id", [1, 2]),
+])
+def test_constraints(string, expected):
+    assert execute(string) == expected
+
+def test_default_order_is_priority():
+    # ties broken by id
+    assert execute("") == [2, 1, 4, 3]
+
+def test_order_by_text_puts_empty_values_last():
+    assert execute("order=owner") == [1, 3, 2, 4]
+    assert execute("order=owner&desc=1") == [4, 2, 1, 3]
+
+def test_max():
+    assert execute("order=id", default_max=2) == [1, 2]
+    assert execute("order=id&max=3") == [1, 2, 3]
+    assert execute("order=id&max=0", default_max=2) == [1, 2, 3, 4]
+
+@pytest.mark.parametrize("string", [
+    "status=~new&status=closed", "time=2020-01-01..", "summary=^Crash",
+    "summary=$startup", "order=milestone", "max=all", "owner",
+    "status=new&or&owner=bob", "summary=\\$x", "id=1",
+])
+def test_unsupported(string):
+    with pytest.raises(UnsupportedQuery):
+        Query(string)
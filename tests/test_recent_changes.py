@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import datetime
+
+import pytest
+
+from tph.trhaelppyercthon import TPH
+
+EPOCH = datetime.datetime(2020, 1, 1)
+
+class ChangesServer(object):
+    """Server proxy of a trac whose ticket n has been changed at the minutes
+    n, n + 1000 and n + 2000 after EPOCH, so that the changes of the tickets
+    are interleaved."""
+
+    def __init__(self, size, prefix=""):
+        self.size = size
+        self.prefix = prefix
+        self.changelogs = []
+
+    def __getattr__(self, name):
+        name = self.prefix + name
+        if name in ("ticket", "system"):
+            server = ChangesServer(self.size, name + ".")
+            server.changelogs = self.changelogs
+            return server
+        return getattr(self, name.replace(".", "_"))
+
+    def date(self, minutes):
+        return EPOCH + datetime.timedelta(minutes=minutes)
+
+    def ticket_getRecentChanges(self, since):
+        return [number for number in range(1, self.size + 1)
+                if self.date(number + 2000) >= since]
+
+    def ticket_query(self, query):
+        return []
+
+    def ticket_changeLog(self, number):
+        self.changelogs.append(number)
+        return [[self.date(number + offset), "someone", "comment", "",
+                 "change %s" % offset, 1]
+                for offset in (0, 1000, 2000)]
+
+@pytest.mark.parametrize("batch_size", [1, 7, 100])
+def test_recent_changes_iter_sorted_across_batches(batch_size):
+    tph = TPH(ChangesServer(30), multicall=False)
+    changes = list(tph.ticket_recent_changes_iter(EPOCH, batch_size=batch_size,
+                                                  ordered=True))
+    assert len(changes) == 90
+    assert [change[1] for change in changes] == sorted(
+        change[1] for change in changes
+    )
+    assert changes == tph.ticket_recent_changes(EPOCH)
+
+def test_recent_changes_iter_streams_batches():
+    server = ChangesServer(30)
+    tph = TPH(server, multicall=False)
+    changes = tph.ticket_recent_changes_iter(EPOCH, batch_size=7)
+    first = [next(changes) for index in range(21)]
+    # only the first batch has been got
+    assert server.changelogs == list(range(1, 8))
+    assert [change[1] for change in first] == sorted(
+        change[1] for change in first
+    )
+    rest = list(changes)
+    assert server.changelogs == list(range(1, 31))
+    assert sorted(first + rest, key=lambda log:log[1]) \
+        == tph.ticket_recent_changes(EPOCH)
+
+def test_recent_changes_since():
+    tph = TPH(ChangesServer(30), multicall=False)
+    since = EPOCH + datetime.timedelta(minutes=1015)
+    changes = tph.ticket_recent_changes(since)
+    assert all(change[1] >= since for change in changes)
+    assert len(changes) == 46
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import io
+import os
+import socketserver
+import threading
+import xmlrpc.client
+import xmlrpc.server
+
+import pytest
+
+from tph import transport
+from tph.streaming import CHUNK_SIZE, StreamedFile, call_with_file, \
+    call_to_file, file_parser, streamed_body
+
+SIZES = [0, 1, 2, 3, CHUNK_SIZE - 1, CHUNK_SIZE, CHUNK_SIZE + 1, 1000000]
+
+class RequestHandler(xmlrpc.server.SimpleXMLRPCRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+class Server(socketserver.ThreadingMixIn, xmlrpc.server.SimpleXMLRPCServer):
+    daemon_threads = True
+
+@pytest.fixture
+def trac():
+    """Local XML-RPC server storing attachments, its responses being gzip
+    encoded when the client accepts it."""
+    server = Server(("127.0.0.1", 0), RequestHandler, logRequests=False,
+                    allow_none=True)
+    server.attachments = {}
+
+    def put(name, data):
+        server.attachments[name] = data.data
+        return name
+
+    def get(name):
+        if name not in server.attachments:
+            raise xmlrpc.client.Fault(404, "no attachment %s" % name)
+        return xmlrpc.client.Binary(server.attachments[name])
+
+    server.register_function(put, "put")
+    server.register_function(get, "get")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def server_proxy(trac, accept_gzip=True):
+    return xmlrpc.client.ServerProxy(
+        "http://127.0.0.1:%s/RPC2" % trac.server_address[1],
+        transport=transport.make_transport("http", accept_gzip=accept_gzip)
+    )
+
+def write(tmp_path, size):
+    data = os.urandom(size)
+    path = tmp_path / "file.bin"
+    path.write_bytes(data)
+    return (str(path), data)
+
+@pytest.mark.parametrize("size", SIZES)
+def test_streamed_body(size, tmp_path):
+    (path, data) = write(tmp_path, size)
+    body = streamed_body("put", ("name", StreamedFile(path), "été"))
+    content = b"".join(body)
+    assert len(body) == len(content)
+    # the body may be sent again
+    assert b"".join(body) == content
+    (params, method_name) = xmlrpc.client.loads(content)
+    assert method_name == "put"
+    assert params[0] == "name" and params[2] == "été"
+    assert params[1].data == data
+
+@pytest.mark.parametrize("size", SIZES)
+def test_call_with_file(size, trac, tmp_path):
+    (path, data) = write(tmp_path, size)
+    progress = []
+    assert call_with_file(server_proxy(trac), "put",
+                          ("name", StreamedFile(path, progress.append))) \
+        == "name"
+    assert trac.attachments["name"] == data
+    assert progress == sorted(progress)
+    assert progress[-1:] == ([size] if size else [])
+
+def test_call_with_file_without_server_proxy(tmp_path):
+    (path, data) = write(tmp_path, 10)
+
+    class Server(object):
+        def put(self, name, binary):
+            self.data = binary.data
+            return name
+
+    server = Server()
+    progress = []
+    assert call_with_file(server, "put",
+                          ("name", StreamedFile(path, progress.append))) \
+        == "name"
+    assert server.data == data and progress == [10]
+
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("accept_gzip", [True, False])
+def test_call_to_file(size, accept_gzip, trac, tmp_path):
+    data = os.urandom(size)
+    trac.attachments["name"] = data
+    progress = []
+    path = str(tmp_path / "copy")
+    server = server_proxy(trac, accept_gzip)
+    call_to_file(server, "get", ("name",), path, progress.append)
+    with open(path, "rb") as fil:
+        assert fil.read() == data
+    assert progress == sorted(progress)
+    assert progress[-1:] == ([size] if size else [])
+    if size > 1400:
+        # SimpleXMLRPCRequestHandler.encode_threshold
+        assert (server("transport").stats.received
+                < server("transport").stats.received_raw) == accept_gzip
+    # the transport parses the responses as usual again
+    assert server.put("other", xmlrpc.client.Binary(b"x")) == "other"
+
+def test_call_to_file_fault_leaves_no_file(trac, tmp_path):
+    (tmp_path / "copy").write_bytes(b"previous")
+    with pytest.raises(xmlrpc.client.Fault):
+        call_to_file(server_proxy(trac), "get", ("missing",),
+                     str(tmp_path / "copy"))
+    assert os.listdir(str(tmp_path)) == ["copy"]
+    assert (tmp_path / "copy").read_bytes() == b"previous"
+
+@pytest.mark.parametrize(("piece", "size"), [
+    (1, 3001), (3, 3001), (4, 3001), (1000, 2 * CHUNK_SIZE + 5),
+])
+def test_file_parser_pieces(piece, size):
+    data = os.urandom(size)
+    response = xmlrpc.client.dumps((xmlrpc.client.Binary(data),),
+                                   methodresponse=True).encode("utf-8")
+    fil = io.BytesIO()
+    (parser, target) = file_parser(fil)
+    for start in range(0, len(response), piece):
+        parser.feed(response[start:start + piece])
+    parser.close()
+    target.close()
+    assert fil.getvalue() == data
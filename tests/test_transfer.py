@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import io
+import os
+import socketserver
+import threading
+import xmlrpc.client
+import xmlrpc.server
+
+import pytest
+
+from tph import transport
+from tph.transfer import Transfer, TransferError, TransferScheduler
+from tph.trhaelppyercthon import TPH
+
+class RequestHandler(xmlrpc.server.SimpleXMLRPCRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        self.server.connections += 1
+        xmlrpc.server.SimpleXMLRPCRequestHandler.setup(self)
+
+class Server(socketserver.ThreadingMixIn, xmlrpc.server.SimpleXMLRPCServer):
+    daemon_threads = True
+
+ATTACHMENTS = {
+    (1, "a.bin") : os.urandom(100000),
+    (1, "b.bin") : os.urandom(10),
+    (2, "c.bin") : os.urandom(300000),
+}
+
+@pytest.fixture
+def trac():
+    """Local XML-RPC server of the ticket attachments ATTACHMENTS."""
+    server = Server(("127.0.0.1", 0), RequestHandler, logRequests=False,
+                    allow_none=True)
+    server.connections = 0
+
+    def list_attachments(ticket):
+        return [[name, "", len(data), None, "me"]
+                for ((number, name), data) in sorted(ATTACHMENTS.items())
+                if number == ticket]
+
+    def get_attachment(ticket, name):
+        if (ticket, name) not in ATTACHMENTS:
+            raise xmlrpc.client.Fault(404, "no attachment %s" % name)
+        return xmlrpc.client.Binary(ATTACHMENTS[(ticket, name)])
+
+    server.register_function(list_attachments, "ticket.listAttachments")
+    server.register_function(get_attachment, "ticket.getAttachment")
+    server.register_multicall_functions()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def server_factory(trac):
+    pool = transport.ConnectionPool()
+
+    def factory():
+        return xmlrpc.client.ServerProxy(
+            "http://127.0.0.1:%s/RPC2" % trac.server_address[1],
+            transport=transport.make_transport("http", pool=pool)
+        )
+    return factory
+
+def test_failed_transfer_does_not_abort_the_others(trac, tmp_path, capsys):
+    factory = server_factory(trac)
+    tph = TPH(factory(), server_factory=factory, transfer_workers=2)
+    attachments = [
+        (1, "a.bin", str(tmp_path / "a.bin")),
+        (1, "missing.bin", str(tmp_path / "missing.bin")),
+        (1, "b.bin", str(tmp_path / "b.bin")),
+        ("#2", "c.bin", str(tmp_path / "c.bin")),
+    ]
+    with pytest.raises(TransferError) as error:
+        tph.ticket_attachment_get_many(attachments)
+    assert [(transfer.name, type(fault)) for (transfer, fault)
+            in error.value.failures] == [("1/missing.bin",
+                                          xmlrpc.client.Fault)]
+    assert error.value.results == [
+        ("1/a.bin", str(tmp_path / "a.bin")),
+        ("1/b.bin", str(tmp_path / "b.bin")),
+        ("2/c.bin", str(tmp_path / "c.bin")),
+    ]
+    for (ticket, name, path) in attachments:
+        if name == "missing.bin":
+            assert not os.path.exists(path)
+        else:
+            with open(path, "rb") as fil:
+                assert fil.read() == ATTACHMENTS[(int(str(ticket).strip("#")), name)]
+    err = capsys.readouterr().err
+    assert "3 file(s) transferred, 0.4 MB" in err
+    assert "1 failure(s):\n  1/missing.bin: <Fault 404" in err
+    # one connection per worker at most, the first one included
+    assert trac.connections <= 3
+
+def test_scheduler_reports_failures_in_order():
+    output = io.StringIO()
+
+    def transfer(name, error=None):
+        def function(server, progress):
+            progress(10)
+            if error is not None:
+                raise error
+            return (server, name)
+        return Transfer(name, function, 10)
+
+    transfers = [transfer("first"), transfer("second", OSError("reset")),
+                 transfer("third"), transfer("fourth", ValueError("bad"))]
+    (results, failures) = TransferScheduler(
+        "server", lambda:"server", max_workers=3, output=output
+    ).run(transfers)
+    assert results == [("server", "first"), ("server", "third")]
+    assert [(transfer.name, str(error)) for (transfer, error) in failures] \
+        == [("second", "reset"), ("fourth", "bad")]
+    lines = output.getvalue().splitlines()
+    assert sorted(line.split(" in ")[0] for line in lines[:4]) == [
+        "first: 0.0 MB", "fourth: failed (bad)", "second: failed (reset)",
+        "third: 0.0 MB",
+    ]
+    assert lines[4].startswith("2 file(s) transferred")
+    assert lines[5:] == ["2 failure(s):", "  second: reset", "  fourth: bad"]
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import socketserver
+import threading
+import xmlrpc.client
+import xmlrpc.server
+
+import pytest
+
+from tph import trac_connection, transport
+from tph.transport import ConnectionPool, CompressionStats
+
+class Connection(object):
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def test_pool_keeps_size_connections():
+    pool = ConnectionPool(size=1)
+    (first, second) = (Connection(), Connection())
+    pool.checkin("host", first)
+    pool.checkin("host", second)
+    assert second.closed
+    assert pool.checkout("host") is first
+    assert pool.checkout("host") is None
+
+def test_pool_closes_idle_connections():
+    pool = ConnectionPool(idle_timeout=0)
+    connection = Connection()
+    pool.checkin("host", connection)
+    assert pool.checkout("host") is None
+    assert connection.closed
+
+class RequestHandler(xmlrpc.server.SimpleXMLRPCRequestHandler):
+    protocol_version = "HTTP/1.1"
+    rpc_paths = ("/trac/login/xmlrpc",)
+
+    def setup(self):
+        self.server.connections += 1
+        xmlrpc.server.SimpleXMLRPCRequestHandler.setup(self)
+
+    def do_POST(self):
+        self.server.authorizations.append(self.headers.get("Authorization"))
+        self.server.encodings.append(self.headers.get("Content-Encoding"))
+        xmlrpc.server.SimpleXMLRPCRequestHandler.do_POST(self)
+
+class Server(socketserver.ThreadingMixIn, xmlrpc.server.SimpleXMLRPCServer):
+    daemon_threads = True
+
+@pytest.fixture
+def trac(monkeypatch, tmp_path):
+    server = Server(("127.0.0.1", 0), RequestHandler, logRequests=False)
+    server.connections = 0
+    server.authorizations = []
+    server.encodings = []
+    server.register_function(lambda number:number, "ticket.get")
+    server.register_function(lambda text:text, "echo")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = "127.0.0.1:%s" % server.server_address[1]
+    netrc = tmp_path / ".netrc"
+    netrc.write_text("machine http://%s login me password secret\n" % url)
+    netrc.chmod(0o600)
+    monkeypatch.setenv("HOME", str(tmp_path))
+    yield (server, url)
+    server.shutdown()
+    server.server_close()
+
+def test_factory_server_proxies_share_the_connections(trac):
+    (server, url) = trac
+    (login, server_factory) = trac_connection.factory_from_netrc(
+        url, "http", "/trac"
+    )
+    assert login == "me"
+    for number in range(3):
+        assert server_factory().ticket.get(number) == number
+    assert server.connections == 1
+    assert len(server.authorizations) == 3
+    assert server.authorizations[0] is not None
+    assert len(set(server.authorizations)) == 1
+
+def request_length(*params):
+    return len(xmlrpc.client.dumps(params, "echo", encoding="utf-8").encode())
+
+@pytest.mark.parametrize("accept_gzip", [True, False])
+def test_compression(trac, accept_gzip):
+    (server, url) = trac
+    stats = CompressionStats()
+    proxy = xmlrpc.client.ServerProxy(
+        "http://%s/trac/login/xmlrpc" % url,
+        transport=transport.make_transport("http", encode_threshold=1000,
+                                           accept_gzip=accept_gzip,
+                                           stats=stats)
+    )
+    # below the thresholds of the client and of the server
+    assert proxy.echo("small") == "small"
+    assert server.encodings == [None]
+    assert stats.sent == stats.sent_raw == request_length("small")
+    assert stats.received == stats.received_raw
+    assert stats.saved() == 0
+    (sent, received) = (stats.sent, stats.received)
+    text = "compressible " * 10000
+    assert proxy.echo(text) == text
+    assert server.encodings == [None, "gzip"]
+    assert stats.sent_raw - sent == request_length(text)
+    assert stats.sent - sent < request_length(text) / 10
+    if accept_gzip:
+        assert stats.received - received < len(text) / 10
+    else:
+        assert stats.received == stats.received_raw
+    assert stats.received_raw - received > len(text)
+    assert stats.saved() == stats.sent_raw - stats.sent \
+        + stats.received_raw - stats.received > 0
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import re
+
+import pytest
+
+from tph.trhaelppyercthon import TPH
+from tph.wiki_mirror import WikiMirror, literals
+
+PAGES = {
+    "WikiStart": "Welcome to the project\nSee the SearchGuide",
+    "SearchGuide": "How to search the tickets:\nuse ticket_query_print",
+    "Release/1.0": "Released on the 12th\nchangelog: fixed the Kelvin units",
+    "Release/2.0": "Not released yet",
+    "Notes": "abc\nxyz",
+}
+
+@pytest.mark.parametrize("pattern, expected", [
+    ("release", ["release"]),
+    ("^Welcome to", ["Welcome to"]),
+    ("fo+bar", ["f", "bar"]),
+    ("a.b", ["a", "b"]),
+    ("(?i)Kelvin units", ["elv", "n un", "t"]),
+    ("(?i)search", ["earch"]),
+    ("release|search", []),
+    ("the (release )?notes", ["the ", "notes"]),
+    ("the (release)+ notes", ["the ", " notes"]),
+    ("café au lait", ["caf", " au lait"]),
+    ("[", []),
+])
+def test_literals(pattern, expected):
+    assert literals(pattern) == expected
+
+def matching(pattern):
+    regexp = re.compile(pattern)
+    return sorted(name for (name, text) in PAGES.items()
+                  if any(regexp.search(line) for line in text.splitlines()))
+
+@pytest.fixture
+def mirror(tmp_path):
+    mirror = WikiMirror(str(tmp_path / "wiki.sqlite"))
+    mirror.put_many([(name, 1, text) for (name, text) in PAGES.items()])
+    return mirror
+
+@pytest.mark.parametrize("pattern", [
+    "release",
+    "(?i)RELEASED",
+    "(?i)kelvin",
+    "Released|Welcome",
+    "the (tickets)?:",
+    "(ticket_)+query",
+    "Guide$",
+])
+def test_candidates_contain_the_matches(mirror, pattern):
+    candidates = mirror.candidates(pattern)
+    assert set(matching(pattern)) <= set(candidates)
+    assert candidates == sorted(candidates)
+
+def test_candidates_use_the_index(mirror):
+    assert mirror.candidates("released") == ["Release/1.0", "Release/2.0"]
+    assert mirror.candidates("(?i)WELCOME") == ["WikiStart"]
+    assert mirror.candidates("SearchGuide") == ["WikiStart"]
+    assert mirror.candidates("nothing like it") == []
+
+@pytest.mark.parametrize("pattern", ["ab", "x.z", "a|xyz", ".*"])
+def test_candidates_short_literals_scan_all(mirror, pattern):
+    # less than 3 literal characters in a row, no trigram to look up
+    assert mirror.candidates(pattern) == sorted(PAGES)
+
+class WikiServer(object):
+    """Server proxy of a trac wiki whose pages are the dictionary pages name
+    -> (version, text)."""
+
+    def __init__(self, pages, prefix="", calls=None):
+        self.pages = pages
+        self.prefix = prefix
+        self.calls = [] if calls is None else calls
+
+    def __getattr__(self, name):
+        name = self.prefix + name
+        if name in ("wiki", "system"):
+            return WikiServer(self.pages, name + ".", self.calls)
+        return getattr(self, name.replace(".", "_"))
+
+    def wiki_getAllPages(self):
+        return sorted(self.pages)
+
+    def wiki_getRecentChanges(self, since):
+        return [{"name": name, "version": version}
+                for (name, (version, text)) in self.pages.items()]
+
+    def wiki_getPageInfo(self, name):
+        return {"name": name, "version": self.pages[name][0]}
+
+    def wiki_getPage(self, name):
+        self.calls.append(name)
+        return self.pages[name][1]
+
+def test_sync(tmp_path):
+    pages = dict((name, (1, text)) for (name, text) in PAGES.items())
+    server = WikiServer(pages)
+    mirror = WikiMirror(str(tmp_path / "wiki.sqlite"))
+    tph = TPH(server, multicall=False, wiki_mirror=mirror)
+    tph.wiki_mirror_sync()
+    assert server.calls == sorted(PAGES)
+    assert mirror.versions() == dict((name, 1) for name in PAGES)
+    assert mirror.last_sync() is not None
+    # synchronised less than cache_max_age seconds ago
+    pages["Release/2.0"] = (2, "Released on the 20th")
+    tph.wiki_mirror_sync()
+    assert mirror.text("Release/2.0") == "Not released yet"
+    # a page changed, a page added and a page deleted upstream
+    pages["NewPage"] = (1, "A brand new page")
+    del pages["Notes"]
+    del server.calls[:]
+    tph.wiki_mirror_sync(force=True)
+    assert server.calls == ["NewPage", "Release/2.0"]
+    assert mirror.versions() == dict(
+        (name, version) for (name, (version, text)) in pages.items()
+    )
+    assert mirror.text("Notes") is None
+    assert mirror.candidates("xyz") == []
+    assert mirror.candidates("20th") == ["Release/2.0"]
+    assert list(tph.wiki_source_grep("*", "brand|20th")) == [
+        ("NewPage", 1, "A brand new page"),
+        ("Release/2.0", 1, "Released on the 20th"),
+    ]
@@ -4,9 +4,18 @@
 from .edit import edit
 import re
 import logging
-logging.basicConfig()
 logger = logging.getLogger(__file__)
 
+# a line field=value of the dumped attributes
+FIELD_REGEXP = re.compile("^([^= ]+)=(.*)$")
+# separator of the values of the keywords and cc fields
+VALUES_SEPARATOR = re.compile("[ ,]+")
+# the line starting the section of a ticket in the output of dump_many
+SECTION_FORMAT = "#### ticket %s ####"
+SECTION_REGEXP = re.compile("^#### ticket #?([0-9]+) ####\r?$", re.M)
+# the line breaks of str.splitlines but \n
+OTHER_LINE_BREAKS = "\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
 class TPHAttributes(object):
     """Class helping the edition of ticket attributes
     """
@@ -30,15 +39,15 @@ class TPHAttributes(object):
         ticket.
         - `ignore_empty`:If true, do not display anything for empty fields.
         """
-        content = ""
+        lines = []
         for field in self.fields:
             value = attributes.get(field, "")
             if value is None:
               value = ""
             if value or not ignore_empty:
-                content = content + field+"="+value+"\n"
-        content = content + attributes.get("description", "")
-        return content
+                lines.append(field + "=" + value + "\n")
+        lines.append(attributes.get("description", ""))
+        return "".join(lines)
 
     def load(self, string):
         """From a string, return a dictionary of attributes to be given in any
@@ -50,26 +59,87 @@ class TPHAttributes(object):
         - `string`:A string got by self.dump(attributes).
         """
         attributes = {}
-        content = string.splitlines()
-        field_regexp = "^([^= ]+)=(.*)$"
-        match = re.match(field_regexp, content[0])
-        while match:
-            field_name = match.group(1)
-            field_value = match.group(2)
-            attributes[field_name] = field_value
-            content.pop(0)
-            if len(content) > 0:
-                match = re.match(field_regexp, content[0])
+        if not any(line_break in string for line_break in OTHER_LINE_BREAKS):
+            # only \n line breaks, the description is sliced out of string
+            # instead of splitting it into lines and joining them back
+            position = 0
+            while position < len(string):
+                end = string.find("\n", position)
+                if end == -1:
+                    end = len(string)
+                match = FIELD_REGEXP.match(string[position:end])
+                if not match:
+                    break
+                attributes[match.group(1)] = match.group(2)
+                position = end + 1
+            if string.endswith("\n"):
+                description = string[position:-1]
             else:
-                match = None
-
-        # the remaining of the content is the description
-        description = "\n".join(content)
+                description = string[position:]
+        else:
+            content = string.splitlines()
+            index = 0
+            while index < len(content):
+                match = FIELD_REGEXP.match(content[index])
+                if not match:
+                    break
+                attributes[match.group(1)] = match.group(2)
+                index += 1
+            # the remaining of the content is the description
+            description = "\n".join(content[index:])
         if description:
             # avoid emptying the description
             attributes["description"] = description
         return attributes
 
+    def dump_many(self, tickets, ignore_empty=False):
+        """From a list of tuples (ticket number, attributes), return a string
+        to edit the attributes of all the tickets at once.
+
+        The attributes of each ticket are in the format generated by the
+        `dump` method, in a section starting with the line
+        "#### ticket <number> ####".
+
+        Arguments:
+        - `tickets`:A list of tuples (ticket number, attributes).
+        - `ignore_empty`:See self.dump.
+        """
+        sections = []
+        for (ticket_number, attributes) in tickets:
+            sections.append(SECTION_FORMAT % ticket_number + "\n")
+            sections.append(self.dump(attributes, ignore_empty=ignore_empty))
+            sections.append("\n")
+        return "".join(sections)
+
+    def load_many(self, string):
+        """From a string, return a tuple (preamble, tickets): preamble is the
+        text before the first section and tickets the list of the tuples
+        (ticket number, attributes) of the sections, attributes being given by
+        the `load` method.
+
+        Arguments:
+        - `string`:A string got by self.dump_many(tickets), possibly preceded
+        by a preamble.
+        """
+        matches = list(SECTION_REGEXP.finditer(string))
+        if not matches:
+            return (string, [])
+        tickets = []
+        for (index, match) in enumerate(matches):
+            start = match.end()
+            # the line break ending the line of the section
+            if string.startswith("\r\n", start):
+                start += 2
+            elif string.startswith("\n", start):
+                start += 1
+            if index + 1 < len(matches):
+                end = matches[index + 1].start()
+            else:
+                end = len(string)
+            tickets.append((int(match.group(1)),
+                            self.load(string[start:end])))
+        return (string[:matches[0].start()], tickets)
+
     def edit(self, attributes, prefix="", ignore_empty=False):
         """Edit a list of ticket attributes by editing a temporary file.
 
@@ -107,11 +177,11 @@ the attributes work, the value is replaced in the old value by the new one."""
                 if new[key] == "":
                     new_values = set()
                 else:
-                    new_values = set(re.split("[ ,]+", new[key]))
+                    new_values = set(VALUES_SEPARATOR.split(new[key]))
                 if old[key] == "":
                     old_values = set()
                 else:
-                    old_values = set(re.split("[ ,]+", old[key]))
+                    old_values = set(VALUES_SEPARATOR.split(old[key]))
                 # value -> toggle the value
                 # +value -> add the value
                 # -value -> remove the value
@@ -126,7 +196,15 @@ the attributes work, the value is replaced in the old value by the new one."""
                             old_values.remove(value)
                         else:
                             old_values.add(value)
-                result_fields[key] = " ".join(list(old_values))
+                # keep the order of the old values, so that the result does
+                # not depend on the iteration order of the sets
+                kept_values = [
+                    value for value in VALUES_SEPARATOR.split(old[key])
+                    if value in old_values
+                ]
+                result_fields[key] = " ".join(
+                    kept_values + sorted(old_values.difference(kept_values))
+                )
             else:
                 result_fields[key] = new[key]
             if not only_new_fields:
@@ -139,7 +217,8 @@ the attributes work, the value is replaced in the old value by the new one."""
     def filter(self, attributes):
         """Removing any attribute in attributes that is not in the recognize
         fields but keep attributes whose key is in self.filter_exception"""
+        kept = set(self.fields).union(self.filter_exception)
         return {
             _key : attributes[_key] for _key in attributes
-            if _key in self.fields or _key in self.filter_exception
+            if _key in kept
         }
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Local on-disk cache of the trac tickets.
+
+The tickets are stored as returned by ticket.get, in a sqlite database, along
+with their changetime and _ts. The TPH keeps the cache up to date by asking the
+trac the tickets changed since the last synchronisation.
+"""
+
+import sqlite3
+import pickle
+import os
+from datetime import datetime
+
+class TicketCache(object):
+    """Class storing tickets in a sqlite database."""
+
+    def __init__(self, path):
+        """Open the cache stored in the file path, creating it if needed."""
+        self.path = os.path.expanduser(path)
+        self.connection = sqlite3.connect(self.path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS ticket ("
+                "id INTEGER PRIMARY KEY, changetime TEXT, ts TEXT, ticket BLOB)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta ("
+                "key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    def get(self, ticket_number):
+        """Return the cached ticket ticket_number or None if not cached."""
+        row = self.connection.execute(
+            "SELECT ticket FROM ticket WHERE id = ?", (int(ticket_number),)
+        ).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0])
+
+    def get_many(self, ticket_numbers):
+        """Return a dictionary id -> ticket of the cached tickets among
+        ticket_numbers."""
+        ticket_numbers = [int(number) for number in ticket_numbers]
+        tickets = {}
+        # stay below the maximum number of sqlite variables
+        for start in range(0, len(ticket_numbers), 500):
+            chunk = ticket_numbers[start:start + 500]
+            for (number, ticket) in self.connection.execute(
+                    "SELECT id, ticket FROM ticket WHERE id IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    chunk):
+                tickets[number] = pickle.loads(ticket)
+        return tickets
+
+    def put_many(self, tickets):
+        """Store tickets, as returned by ticket.get."""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO ticket VALUES (?, ?, ?, ?)",
+                [
+                    (int(ticket[0]), str(ticket[2]), ticket[3].get("_ts", ""),
+                     pickle.dumps(ticket))
+                    for ticket in tickets
+                ]
+            )
+
+    def invalidate(self, ticket_numbers):
+        """Remove ticket_numbers from the cache."""
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM ticket WHERE id = ?",
+                [(int(number),) for number in ticket_numbers]
+            )
+
+    def ticket_numbers(self):
+        """Return the ids of all the cached tickets."""
+        return [
+            row[0] for row in
+            self.connection.execute("SELECT id FROM ticket ORDER BY id")
+        ]
+
+    def tickets(self):
+        """Iterate over all the cached tickets."""
+        for row in self.connection.execute("SELECT ticket FROM ticket"):
+            yield pickle.loads(row[0])
+
+    def clear(self):
+        """Empty the cache."""
+        with self.connection:
+            self.connection.execute("DELETE FROM ticket")
+            self.connection.execute("DELETE FROM meta")
+
+    def last_sync(self):
+        """Return the date (UTC) of the last synchronisation or None."""
+        value = self._meta_get("last_sync")
+        if value is None:
+            return None
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S")
+
+    def set_last_sync(self, date):
+        """Record date (UTC) as the date of the last synchronisation."""
+        self._meta_set("last_sync", date.strftime("%Y-%m-%dT%H:%M:%S"))
+
+    def is_complete(self):
+        """Return whether the cache holds all the tickets of the trac."""
+        return self._meta_get("complete") == "1"
+
+    def set_complete(self, complete):
+        """Record whether the cache holds all the tickets of the trac."""
+        self._meta_set("complete", "1" if complete else "0")
+
+    def _meta_get(self, key):
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row and row[0]
+
+    def _meta_set(self, key, value):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value)
+            )
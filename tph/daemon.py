@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Resident trac_cmd serving the commands of thin clients.
+
+Starting trac_cmd.py costs the interpreter startup, the imports, reading the
+configuration, connecting to the trac and getting its metadata. The daemon pays
+that once and keeps its TracCmd, its connections and its caches. The clients
+connect to its Unix domain socket and send their arguments and current
+directory. The daemon runs the command and sends back its output as it comes,
+then its exit status.
+
+The messages sent back are frames made of one byte telling the kind of the
+frame, the length of the payload as four bytes in big endian order and the
+payload. The kinds are STDOUT, STDERR and EXIT, whose payload is the exit
+status.
+
+The commands are run one after the other. Only the commands of
+forwarded_commands are forwarded: neither the standard input nor the
+environment of the client reach the daemon, hence the commands opening an
+editor, a browser or an interpreter are run by the client itself.
+"""
+
+import configparser
+import contextlib
+import json
+import os
+import socket
+import struct
+import sys
+import traceback
+
+STDOUT = b"1"
+STDERR = b"2"
+EXIT = b"0"
+
+# the commands not interacting with the user, that the daemon may run for the
+# clients. It includes TracCmd.parallel_commands, the read only ones.
+forwarded_commands = set([
+    "cache_clear", "cache_fill", "cache_sync", "compression_stats",
+    "get_actions", "list_attachment", "list_components", "list_priority",
+    "list_resolution", "list_status", "list_type", "metadata_invalidate",
+    "method_help", "method_list", "milestone_list",
+    "milestone_remaining_time_sum", "milestone_stuck_p",
+    "stats", "ticket_attach_get", "ticket_attach_list", "ticket_changelog",
+    "ticket_comments", "ticket_description", "ticket_field_values",
+    "ticket_mine", "ticket_mine_pending", "ticket_parents", "ticket_print",
+    "ticket_query", "ticket_query_print", "ticket_query_remaining_time",
+    "ticket_query_time_sum", "ticket_recent_changes",
+    "ticket_recent_changes_save_date", "ticket_remaining_time",
+    "ticket_remaining_time_sum", "ticket_search", "ticket_sons",
+    "ticket_sons_recursive", "ticket_summary", "whoami", "wiki_attach_delete",
+    "wiki_attach_get", "wiki_attach_get_from_wiki_page_name",
+    "wiki_attach_list", "wiki_attach_put", "wiki_mirror_sync", "wiki_search",
+    "wiki_source_grep",
+])
+
+def socket_path():
+    """Return the path of the socket of the daemon given by the socket option of
+the daemon section of the configuration file, or None if not configured.
+
+The configuration file is found like in trac_cmd.get_configuration_options."""
+    configuration_file = os.environ.get("TRAC_CMDRC",
+                   os.path.expanduser("~/.trac_cmdrc.conf"))
+    config = configparser.ConfigParser()
+    config.read(configuration_file)
+    path = config.get("daemon", "socket", fallback="")
+    return os.path.expanduser(path) if path else None
+
+class _FrameWriter(object):
+    """File like object sending what is written as frames of kind."""
+
+    encoding = "utf-8"
+
+    def __init__(self, connection, kind):
+        self.connection = connection
+        self.kind = kind
+
+    def write(self, text):
+        if text:
+            _send_frame(self.connection, self.kind, text.encode(self.encoding))
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+def _send_frame(connection, kind, payload):
+    connection.sendall(kind + struct.pack(">I", len(payload)) + payload)
+
+def _receive_exactly(connection, size):
+    data = b""
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed by the trac_cmd daemon")
+        data += chunk
+    return data
+
+def serve(path, run):
+    """Serve the clients on the Unix domain socket path until interrupted.
+
+run is the function called with the arguments of a client to run its command,
+        while the standard outputs are sent to the client."""
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(path):
+        try:
+            server.connect(path)
+        except ConnectionRefusedError:
+            # a socket left by a dead daemon
+            os.unlink(path)
+        else:
+            server.close()
+            raise Exception("A daemon is already listening on %s" % path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # only the user may connect: the commands are run with their credentials
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+    try:
+        while True:
+            (connection, address) = server.accept()
+            with connection:
+                try:
+                    _serve_client(connection, run)
+                except (ConnectionError, ValueError) as error:
+                    print("Client dropped: %s" % error, file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(path)
+
+def _serve_client(connection, run):
+    with connection.makefile("rb") as request_file:
+        request = json.loads(request_file.readline().decode("utf-8"))
+    status = 0
+    stdout = _FrameWriter(connection, STDOUT)
+    stderr = _FrameWriter(connection, STDERR)
+    directory = os.getcwd()
+    try:
+        with contextlib.redirect_stdout(stdout), \
+             contextlib.redirect_stderr(stderr):
+            try:
+                os.chdir(request["cwd"])
+                run(request["argv"])
+            except SystemExit as exit:
+                if isinstance(exit.code, int):
+                    status = exit.code
+                elif exit.code is not None:
+                    print(exit.code, file=sys.stderr)
+                    status = 1
+            except Exception:
+                traceback.print_exc()
+                status = 1
+    finally:
+        os.chdir(directory)
+    _send_frame(connection, EXIT, str(status).encode("ascii"))
+
+def forward(argv):
+    """Have the daemon run the command argv and return its exit status.
+
+Return None if the command is to be run locally: when there is no command, when
+        it is not in forwarded_commands, such as the daemon command itself, an
+        option such as --batch or a command needing the user, or when there is
+        no daemon configured or listening."""
+    if not argv or argv[0] not in forwarded_commands:
+        return None
+    path = socket_path()
+    if path is None:
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        connection.close()
+        return None
+    with connection:
+        connection.sendall(json.dumps({
+            "argv" : argv,
+            "cwd" : os.getcwd(),
+        }).encode("utf-8") + b"\n")
+        outputs = {
+            STDOUT : sys.stdout.buffer,
+            STDERR : sys.stderr.buffer,
+        }
+        while True:
+            (kind, size) = struct.unpack(">cI",
+                                         _receive_exactly(connection, 5))
+            payload = _receive_exactly(connection, size)
+            if kind == EXIT:
+                return int(payload)
+            outputs[kind].write(payload)
+            outputs[kind].flush()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Dependency graph of tickets, built from their blockedby and blocking fields.
+
+All the algorithms are iterative and linear in the size of the graph, so that
+milestones with thousands of tickets can be analysed.
+"""
+
+from .hierarchy import ticket_numbers
+
+class DependencyGraph(object):
+    """Graph whose edges go from the tickets to the tickets blocking them."""
+
+    def __init__(self, tickets, weight=lambda ticket:0):
+        """Build the graph.
+
+tickets is an iterable of tickets, as returned by ticket.get. The graph only
+        knows about those tickets, the references to other tickets are ignored.
+weight is a function giving the weight of a ticket in the critical path, for
+        instance its remaining time.
+"""
+        self.tickets = {}
+        for ticket in tickets:
+            self.tickets[ticket[0]] = ticket
+        blockers = {number : set() for number in self.tickets}
+        for (number, ticket) in self.tickets.items():
+            for blocker in ticket_numbers(ticket[3].get("blockedby")):
+                if blocker in self.tickets:
+                    blockers[number].add(blocker)
+            for blocked in ticket_numbers(ticket[3].get("blocking")):
+                if blocked in self.tickets:
+                    blockers[blocked].add(number)
+        self.blockers = {
+            number : sorted(numbers) for (number, numbers) in blockers.items()
+        }
+        self.weights = {
+            number : weight(ticket) for (number, ticket) in self.tickets.items()
+        }
+        self._components = None
+
+    def is_open(self, ticket_number):
+        """Return whether ticket_number is not closed."""
+        return self.tickets[ticket_number][3].get("status") != "closed"
+
+    def components(self):
+        """Return the strongly connected components of the graph, each one
+being a list of ticket ids.
+
+The components are given in an order such that the components blocking a
+        component come before it (Tarjan's algorithm)."""
+        if self._components is not None:
+            return self._components
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        components = []
+        counter = 0
+        for root in sorted(self.tickets):
+            if root in index:
+                continue
+            work = [(root, 0)]
+            while work:
+                (node, position) = work.pop()
+                if position == 0:
+                    index[node] = lowlink[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack.add(node)
+                blockers = self.blockers[node]
+                while position < len(blockers):
+                    blocker = blockers[position]
+                    position += 1
+                    if blocker not in index:
+                        # come back to node once blocker is done
+                        work.append((node, position))
+                        work.append((blocker, 0))
+                        break
+                    elif blocker in on_stack:
+                        lowlink[node] = min(lowlink[node], index[blocker])
+                else:
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.remove(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        components.append(sorted(component))
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+        self._components = components
+        return components
+
+    def cycles(self):
+        """Return the dependency cycles, as lists of ticket ids."""
+        return [
+            component for component in self.components()
+            if len(component) > 1
+            or component[0] in self.blockers[component[0]]
+        ]
+
+    def outside_blockers(self, milestone_name):
+        """Return a dictionary giving, for each open ticket of milestone_name,
+the sorted list of the open tickets outside milestone_name blocking it, either
+directly or through other open tickets."""
+        outside = [
+            number for number in sorted(self.tickets)
+            if self.is_open(number)
+            and self.tickets[number][3].get("milestone") != milestone_name
+        ]
+        bits = {number : 1 << position
+                for (position, number) in enumerate(outside)}
+        # reach[c] is the set, as a bit field, of the outside tickets blocking
+        # the component c
+        component_of = {}
+        reach = []
+        for component in self.components():
+            current = len(reach)
+            for number in component:
+                component_of[number] = current
+            value = 0
+            for number in component:
+                if not self.is_open(number):
+                    continue
+                value |= bits.get(number, 0)
+                for blocker in self.blockers[number]:
+                    if self.is_open(blocker):
+                        value |= bits.get(blocker, 0)
+                        if component_of[blocker] != current:
+                            value |= reach[component_of[blocker]]
+            reach.append(value)
+        result = {}
+        for number in sorted(self.tickets):
+            if not self.is_open(number) \
+               or self.tickets[number][3].get("milestone") != milestone_name:
+                continue
+            value = reach[component_of[number]] & ~bits.get(number, 0)
+            blockers = []
+            while value:
+                lowest = value & -value
+                blockers.append(outside[lowest.bit_length() - 1])
+                value ^= lowest
+            if blockers:
+                result[number] = blockers
+        return result
+
+    def critical_path(self, ticket_numbers=None):
+        """Return a tuple (weight, path) where path is the heaviest chain of
+open tickets, each one blocked by the previous one, ending with one of
+ticket_numbers (defaults to any ticket).
+
+The edges inside a dependency cycle are ignored."""
+        component_of = {}
+        for (position, component) in enumerate(self.components()):
+            for number in component:
+                component_of[number] = position
+        weight = {}
+        previous = {}
+        for component in self.components():
+            for number in component:
+                if not self.is_open(number):
+                    continue
+                best = None
+                for blocker in self.blockers[number]:
+                    if blocker in weight \
+                       and component_of[blocker] != component_of[number] \
+                       and (best is None or weight[blocker] > weight[best]):
+                        best = blocker
+                previous[number] = best
+                weight[number] = self.weights[number] \
+                                 + (weight[best] if best is not None else 0)
+        if ticket_numbers is None:
+            ticket_numbers = weight.keys()
+        ends = [number for number in ticket_numbers if number in weight]
+        if not ends:
+            return (0, [])
+        end = max(ends, key=lambda number:(weight[number], -number))
+        path = []
+        number = end
+        while number is not None:
+            path.append(number)
+            number = previous[number]
+        path.reverse()
+        return (weight[end], path)
@@ -1,9 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding:utf-8 -*-
 
-import tempfile
 import os
-import subprocess
 
 def edit(content, suffix=".wiki", prefix=""):
     """Edit content, using a temporary file.
@@ -15,6 +13,9 @@ def edit(content, suffix=".wiki", prefix=""):
     - `suffix`:The suffix of the temporary file.
     - `prefix`:The prefix of the temporary file.
     """
+    # imported here to keep the commands not editing anything quick to start
+    import tempfile
+    import subprocess
     temp_file = tempfile.NamedTemporaryFile(prefix=prefix, suffix=suffix, delete=False)
     temp_file.write(content.encode("utf-8"))
     temp_file.close()
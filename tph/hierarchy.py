@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Parent/children relations between tickets, computed locally from the parents
+field of the tickets."""
+
+import re
+
+def ticket_numbers(value):
+    """Return the list of ticket ids written in a field such as parents or
+    blockedby, for instance "#12, 15"."""
+    return [int(number) for number in re.findall("[0-9]+", value or "")]
+
+class TicketHierarchy(object):
+    """Index of the sons of the tickets."""
+
+    def __init__(self, tickets):
+        """Build the index.
+
+tickets is an iterable of tickets, as returned by ticket.get. The hierarchy only
+        knows about those tickets.
+"""
+        self.tickets = {}
+        self.children = {}
+        for ticket in tickets:
+            self.tickets[ticket[0]] = ticket
+        for (number, ticket) in sorted(self.tickets.items()):
+            for parent in ticket_numbers(ticket[3].get("parents")):
+                self.children.setdefault(parent, []).append(number)
+
+    def sons(self, ticket_number):
+        """Return the ids of the sons of ticket_number."""
+        return self.children.get(int(ticket_number), [])
+
+    def descendants(self, ticket_number):
+        """Return the set of the ids of ticket_number and of all its
+descendants.
+
+Each ticket appears once, even if reachable through several parents, and the
+        cycles in the parents fields are ignored."""
+        seen = set([int(ticket_number)])
+        stack = [int(ticket_number)]
+        while stack:
+            for son in self.sons(stack.pop()):
+                if son not in seen:
+                    seen.add(son)
+                    stack.append(son)
+        return seen
+
+    def walk(self, ticket_number):
+        """Iterate over the tuples (depth, id) of the hierarchy below
+ticket_number, in depth first order, ticket_number being at depth 0.
+
+A ticket already being one of its own ancestors is not walked through again."""
+        stack = [(0, int(ticket_number), ())]
+        while stack:
+            (depth, number, ancestors) = stack.pop()
+            yield (depth, number)
+            ancestors = ancestors + (number,)
+            for son in reversed(self.sons(number)):
+                if son not in ancestors:
+                    stack.append((depth + 1, son, ancestors))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Instrumentation of the calls to the trac.
+
+A Recorder given to the transports of the transport library gets, for each
+request, the XML-RPC (or JSON-RPC) method, the time spent marshalling the
+request, sending it and waiting for the response, reading and unmarshalling the
+response, the size of the request and of the response and the error if any. It
+aggregates them per method for the whole session and for the current command
+and may write each call as a line of JSON into a trace file.
+
+The marshalling starts before the transport is involved, hence the server
+proxies of this module tell the recorder when they start marshalling a call.
+The calls performed without them, such as the streamed ones, are recorded
+without marshalling time.
+
+Without a recorder, the transports do not measure anything.
+"""
+
+import json
+import re
+import threading
+import time
+import xmlrpc.client
+
+from .jsonrpc import JsonServerProxy
+
+# upper bounds, in seconds, of the buckets of the latency histograms, the last
+# bucket has no upper bound
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0,
+                   2.0, 5.0, 10.0)
+
+_METHOD_NAME = re.compile(
+    rb"<methodName>([^<]*)</methodName>|\"method\"\s*:\s*\"([^\"]*)\""
+)
+
+def method_name_of(request_body):
+    """Return the method called by request_body, bytes or
+    streaming.StreamedBody."""
+    head = getattr(request_body, "prefix", request_body)[:1024]
+    match = _METHOD_NAME.search(head)
+    if match is None:
+        return "unknown"
+    return (match.group(1) or match.group(2)).decode("utf-8", "replace")
+
+class Call(object):
+    """Measures of one call."""
+
+    def __init__(self, method, request_bytes, begin, marshal=0.0):
+        self.method = method
+        self.time = time.time()
+        # perf_counter values of the start of the call and of the sending
+        self.begin = begin
+        self.sent = begin + marshal
+        self.request_bytes = request_bytes
+        self.response_bytes = 0
+        self.marshal = marshal
+        self.wait = 0.0
+        self.unmarshal = 0.0
+        self.latency = 0.0
+        self.error = None
+
+    def add_received(self, received, raw):
+        """Same as transport.CompressionStats.add_received, so that the
+        response bytes are counted like the compression statistics."""
+        self.response_bytes += raw
+
+    def as_dict(self):
+        return {
+            "time" : self.time,
+            "method" : self.method,
+            "latency" : self.latency,
+            "marshal" : self.marshal,
+            "wait" : self.wait,
+            "unmarshal" : self.unmarshal,
+            "request_bytes" : self.request_bytes,
+            "response_bytes" : self.response_bytes,
+            "error" : self.error,
+        }
+
+class MethodStats(object):
+    """Aggregated measures of the calls of one method."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = 0.0
+        self.marshal = 0.0
+        self.wait = 0.0
+        self.unmarshal = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, call):
+        self.calls += 1
+        if call.error is not None:
+            self.errors += 1
+        self.latency += call.latency
+        self.marshal += call.marshal
+        self.wait += call.wait
+        self.unmarshal += call.unmarshal
+        self.request_bytes += call.request_bytes
+        self.response_bytes += call.response_bytes
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) \
+              and call.latency > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+class Stats(object):
+    """Aggregated measures of the calls of each method."""
+
+    def __init__(self):
+        self.methods = {}
+        self.start = time.perf_counter()
+        self.wall = None
+
+    def add(self, call):
+        stats = self.methods.get(call.method)
+        if stats is None:
+            stats = MethodStats()
+            self.methods[call.method] = stats
+        stats.add(call)
+
+    def format(self):
+        """Return the table of the measures, one line per method, followed by
+        the latency histograms."""
+        line = "%-32s %6s %6s %9s %9s %9s %9s %10s %10s"
+        lines = [line % ("method", "calls", "errors", "total ms", "marsh ms",
+                         "wait ms", "unmar ms", "sent B", "received B")]
+        total = MethodStats()
+        for (method, stats) in sorted(self.methods.items()):
+            lines.append(line % (
+                method, stats.calls, stats.errors,
+                "%.1f" % (1000 * stats.latency),
+                "%.1f" % (1000 * stats.marshal),
+                "%.1f" % (1000 * stats.wait),
+                "%.1f" % (1000 * stats.unmarshal),
+                stats.request_bytes, stats.response_bytes,
+            ))
+            total.calls += stats.calls
+            total.latency += stats.latency
+            total.wait += stats.wait
+        if self.wall is not None:
+            lines.append(
+                "%s call(s), %.1f ms in the calls, of which %.1f ms sending"
+                " and waiting, %.1f ms elapsed" % (
+                    total.calls, 1000 * total.latency, 1000 * total.wait,
+                    1000 * self.wall
+                )
+            )
+        lines.append("latency histogram:")
+        bounds = ["<=%gms" % (1000 * bound) for bound in LATENCY_BUCKETS] \
+            + [">%gms" % (1000 * LATENCY_BUCKETS[-1])]
+        for (method, stats) in sorted(self.methods.items()):
+            lines.append("  %s: %s" % (method, " ".join(
+                "%s:%s" % (bound, count)
+                for (bound, count) in zip(bounds, stats.histogram) if count
+            )))
+        return "\n".join(lines)
+
+class Recorder(object):
+    """Recorder of the calls performed by the transports sharing it.
+
+It may be shared by the transports of several threads."""
+
+    def __init__(self, trace_file=None):
+        """trace_file, if given, is the path of a file each call is appended
+        to as a line of JSON."""
+        self.session = Stats()
+        self.command = Stats()
+        self.command_line = None
+        self.trace = None
+        if trace_file:
+            self.trace = open(trace_file, "a", buffering=1)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def marshal_started(self, method):
+        """Tell that the current thread starts marshalling a call of method."""
+        self._local.started = (method, time.perf_counter())
+
+    def marshal_ended(self):
+        """Tell that the current thread is done with the call told by
+        marshal_started, whether its request has been sent or not, so that a
+        failed marshalling is not counted in the next request."""
+        self._local.started = None
+
+    def begin(self, request_body):
+        """Return the Call of the request request_body the current thread is
+        about to send."""
+        started = getattr(self._local, "started", None)
+        now = time.perf_counter()
+        if started is None:
+            return Call(method_name_of(request_body), len(request_body), now)
+        self._local.started = None
+        return Call(started[0], len(request_body), started[1],
+                    now - started[1])
+
+    def end(self, call):
+        """Record call, whose request has been fully performed.
+
+It is counted in the command started by the current thread, if any, so that
+        the commands run concurrently by several threads are told apart, or in
+        the last started command otherwise."""
+        call.latency = time.perf_counter() - call.begin
+        with self._lock:
+            (command_line, command) = getattr(
+                self._local, "command", (self.command_line, self.command)
+            )
+            self.session.add(call)
+            command.add(call)
+            if self.trace is not None:
+                entry = call.as_dict()
+                entry["command"] = command_line
+                self.trace.write(json.dumps(entry) + "\n")
+
+    def start_command(self, line):
+        """Start recording the calls of a new command run by the current
+        thread."""
+        command = Stats()
+        self._local.command = (line, command)
+        with self._lock:
+            self.command = command
+            self.command_line = line
+
+    def end_command(self):
+        """Stop the clock of the current command of the current thread."""
+        (command_line, command) = getattr(
+            self._local, "command", (self.command_line, self.command)
+        )
+        command.wall = time.perf_counter() - command.start
+        if hasattr(self._local, "command"):
+            del self._local.command
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+class InstrumentedServerProxy(xmlrpc.client.ServerProxy):
+    """xmlrpc.client.ServerProxy telling recorder when it starts marshalling a
+    call."""
+
+    def __init__(self, uri, recorder, **options):
+        xmlrpc.client.ServerProxy.__init__(self, uri, **options)
+        self._recorder = recorder
+
+    def _ServerProxy__request(self, methodname, params):
+        self._recorder.marshal_started(methodname)
+        try:
+            return xmlrpc.client.ServerProxy._ServerProxy__request(
+                self, methodname, params
+            )
+        finally:
+            self._recorder.marshal_ended()
+
+class InstrumentedJsonServerProxy(JsonServerProxy):
+    """jsonrpc.JsonServerProxy telling recorder when it starts marshalling a
+    call."""
+
+    def __init__(self, uri, recorder, **options):
+        JsonServerProxy.__init__(self, uri, **options)
+        self._recorder = recorder
+
+    def _JsonServerProxy__request(self, method_name, params):
+        self._recorder.marshal_started(method_name)
+        try:
+            return JsonServerProxy._JsonServerProxy__request(
+                self, method_name, params
+            )
+        finally:
+            self._recorder.marshal_ended()
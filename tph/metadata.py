@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Local on-disk cache of the metadata of the trac.
+
+The metadata (ticket fields, components, milestones, priorities...) seldom
+change but are needed at startup and when completing. They are kept in a JSON
+file, each value with the time it was got from the trac, and are got again once
+older than max_age seconds or when explicitly invalidated.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+# XML-RPC method giving each piece of metadata
+METHODS = {
+    "ticket_fields" : "ticket.getTicketFields",
+    "components" : "ticket.component.getAll",
+    "milestones" : "ticket.milestone.getAll",
+    "priorities" : "ticket.priority.getAll",
+    "resolutions" : "ticket.resolution.getAll",
+    "statuses" : "ticket.status.getAll",
+    "types" : "ticket.type.getAll",
+}
+
+class MetadataCache(object):
+    """Class storing the metadata in a JSON file."""
+
+    def __init__(self, path, max_age=86400):
+        """Open the cache stored in the file path, creating it if needed.
+
+max_age is the number of seconds during which a value is trusted."""
+        self.path = os.path.expanduser(path)
+        self.max_age = max_age
+        self.values = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as fil:
+                    self.values = json.load(fil)
+            except ValueError:
+                # corrupted file, start afresh
+                self.values = {}
+
+    def get(self, key, fetch):
+        """Return the value of key, calling fetch to get it if not cached or
+        too old."""
+        entry = self.values.get(key)
+        if entry is None or time.time() - entry["time"] > self.max_age:
+            entry = {"time" : time.time(), "value" : fetch()}
+            self.values[key] = entry
+            self._save()
+        return entry["value"]
+
+    def invalidate(self, keys=None):
+        """Forget the values of keys, all the values if None."""
+        if keys is None:
+            self.values = {}
+        else:
+            for key in keys:
+                self.values.pop(key, None)
+        self._save()
+
+    def _save(self):
+        # write a new file renamed into place, so that concurrent sessions
+        # never read a partial file
+        (descriptor, temporary_path) = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path))
+        )
+        try:
+            with os.fdopen(descriptor, "w") as fil:
+                json.dump(self.values, fil)
+            os.replace(temporary_path, self.path)
+        except:
+            os.unlink(temporary_path)
+            raise
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Pipelined edition of tickets one after the other.
+
+While the user edits a ticket, the next tickets are got in the background and
+the changes of the previous ones are sent in the background, so that the editor
+opens without waiting for the trac.
+
+The tickets are got in chunks of prefetch tickets by a thread and the changes
+are sent in order by another one, each one with its own server proxy. A ticket
+got again after being updated is got after the update is sent. The failed
+changes, including the ones refused because the ticket changed in the meantime,
+are reported when the pipeline is finished, with their content kept in a file
+to try again.
+"""
+
+import concurrent.futures
+import threading
+import xmlrpc.client
+
+class EditPipeline(object):
+    """Get the tickets ahead and send the changes behind the editions."""
+
+    def __init__(self, tph, ticket_numbers=(), prefetch=4):
+        """tph is the TPH whose server_factory gives the server proxies of the
+threads.
+ticket_numbers are the tickets that will be edited, in that order.
+prefetch is the number of tickets got ahead of the one being edited."""
+        self.tph = tph
+        self.prefetch = max(1, prefetch)
+        self._numbers = [
+            int(str(ticket_number).replace("#", ""))
+            for ticket_number in ticket_numbers
+        ]
+        self._next = 0
+        self._tickets = {}
+        self._submitted = []
+        self._updated = set()
+        self._local = threading.local()
+        self._fetcher = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._sender = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def _server(self):
+        server = getattr(self._local, "server", None)
+        if server is None:
+            server = self.tph.server_factory()
+            self._local.server = server
+        return server
+
+    def _fetch(self, numbers):
+        tickets = self.tph.call_many("ticket.get",
+                                     [(number,) for number in numbers],
+                                     faults=True, server=self._server())
+        return dict(zip(numbers, tickets))
+
+    def _fetch_ahead(self, position):
+        """Get in the background the tickets following the one at position in
+        the tickets to edit, if not already done."""
+        while self._next < len(self._numbers) \
+              and self._next - position <= self.prefetch:
+            chunk = [
+                number
+                for number in self._numbers[self._next:
+                                            self._next + self.prefetch]
+                if number not in self._tickets
+            ]
+            self._next += self.prefetch
+            if chunk:
+                future = self._fetcher.submit(self._fetch, chunk)
+                for number in chunk:
+                    self._tickets[number] = future
+
+    def get(self, ticket_number):
+        """Return the ticket ticket_number, as TPH.ticket_get does, and get the
+next tickets to edit in the background.
+
+A ticket updated through the pipeline is got again, once the update is sent."""
+        ticket_number = int(str(ticket_number).replace("#", ""))
+        if ticket_number in self._numbers:
+            self._fetch_ahead(self._numbers.index(ticket_number))
+        if ticket_number in self._updated:
+            self._updated.discard(ticket_number)
+            self._tickets[ticket_number] = self._sender.submit(
+                self._fetch, [ticket_number]
+            )
+        elif ticket_number not in self._tickets:
+            self._tickets[ticket_number] = self._fetcher.submit(
+                self._fetch, [ticket_number]
+            )
+        ticket = self._tickets[ticket_number].result()[ticket_number]
+        if isinstance(ticket, xmlrpc.client.Fault):
+            raise ticket
+        return ticket
+
+    def _submit(self, result, method_name, args):
+        result["future"] = self._sender.submit(
+            lambda:getattr(self._server(), method_name)(*args)
+        )
+        self._submitted.append(result)
+
+    def update(self, ticket_number, comment, attributes):
+        """Send in the background the update of the ticket ticket_number, see
+        TPH.ticket_update. The _ts of attributes, if any, makes trac refuse the
+        update if the ticket changed since it was got."""
+        ticket_number = int(ticket_number)
+        self._updated.add(ticket_number)
+        self._submit({"ticket" : ticket_number, "action" : "update",
+                      "comment" : comment, "attributes" : attributes},
+                     "ticket.update",
+                     (ticket_number, comment, attributes, True))
+
+    def create(self, summary, description, attributes):
+        """Send in the background the creation of a ticket and return the
+concurrent.futures.Future of its id."""
+        result = {"ticket" : None, "action" : "create", "comment" : "",
+                  "attributes" : dict(attributes, summary=summary,
+                                      description=description)}
+        self._submit(result, "ticket.create",
+                     (summary, description, attributes, True))
+        return result["future"]
+
+    def finish(self):
+        """Wait for all the changes to be sent and return a list of
+dictionaries, one per change, in the order they were made, with the keys:
+- ticket: the ticket id, the created one for a creation,
+- action: update or create,
+- status: updated, created, conflict (the ticket was changed by someone else
+        since it was got) or failed,
+- message: the error message of a failed change,
+- comment and attributes: the content of the change, the attributes of a
+        creation holding the summary and the description,
+- kept: the file keeping the content of a failed change, None otherwise."""
+        self._fetcher.shutdown(wait=False)
+        self._sender.shutdown(wait=True)
+        results = []
+        for submitted in self._submitted:
+            result = dict(submitted)
+            future = result.pop("future")
+            result["message"] = ""
+            result["kept"] = None
+            try:
+                value = future.result()
+            except Exception as error:
+                if isinstance(error, xmlrpc.client.Fault):
+                    result["message"] = error.faultString
+                else:
+                    result["message"] = str(error)
+                if "updated since last get" in result["message"]:
+                    result["status"] = "conflict"
+                else:
+                    result["status"] = "failed"
+                result["kept"] = self._keep(result)
+            else:
+                if result["action"] == "create":
+                    result["ticket"] = value
+                    result["status"] = "created"
+                else:
+                    result["status"] = "updated"
+                    if self.tph.cache is not None:
+                        self.tph.cache.put_many([value])
+            results.append(result)
+        self._submitted = []
+        return results
+
+    def _keep(self, result):
+        """Write the content of the failed change result into a file and return
+        its path.
+
+An update is written in the format of TPHAttributes.dump_many, with the comment
+        as preamble, and a creation in the format of TPHAttributes.dump, so
+        that TPHAttributes.load_many and TPHAttributes.load read them back."""
+        import tempfile
+        (descriptor, path) = tempfile.mkstemp(
+            prefix="ticket_%s_" % (result["ticket"] or "new"), suffix=".wiki"
+        )
+        with open(descriptor, "w", encoding="utf-8") as fil:
+            if result["action"] == "create":
+                fil.write(self.tph.attrs.dump(result["attributes"]))
+            else:
+                fil.write(result["comment"] + "\n")
+                fil.write(self.tph.attrs.dump_many(
+                    [(result["ticket"], result["attributes"])]
+                ))
+        return path
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Local evaluation of trac ticket queries.
+
+Only a subset of the trac query language is understood: constraints joined by
+&, using the =, != and =~ operators and | to give alternative values, as well as
+the order, desc and max keywords. Anything else raises UnsupportedQuery so that
+the caller can give the query to the trac instead.
+"""
+
+import re
+
+# keywords that only change the way the results are displayed
+DISPLAY_KEYWORDS = ("col", "row", "verbose", "format")
+# fields whose values cannot be compared as plain strings
+UNSUPPORTED_FIELDS = ("id", "time", "changetime", "created", "modified",
+                      "report", "group", "groupdesc", "page")
+# fields ordered by something else than their value
+UNSUPPORTED_ORDER = ("milestone", "version", "time", "changetime")
+
+class UnsupportedQuery(Exception):
+    """The query uses something the local evaluator does not handle."""
+
+class Query(object):
+    """A parsed ticket query."""
+
+    def __init__(self, string, default_max=100):
+        """Parse the query string.
+
+default_max is the maximum number of results when the query does not give
+        one, it should match the items_per_page setting of the trac.
+"""
+        self.string = string
+        self.constraints = []
+        self.order = "priority"
+        self.desc = False
+        self.max = default_max
+        if "\\" in string or "$" in string:
+            raise UnsupportedQuery("Escapes and variables are not supported")
+        fields = set()
+        for item in string.split("&"):
+            if not item:
+                continue
+            match = re.match("^([^!=~^$]+)(=~|!=|=)(.*)$", item)
+            if not match:
+                raise UnsupportedQuery("Cannot parse %s" % item)
+            (field, operator, value) = match.groups()
+            if value[:1] in ("~", "^", "$", "!"):
+                raise UnsupportedQuery("Operator of %s not supported" % item)
+            if field in DISPLAY_KEYWORDS:
+                continue
+            if operator != "=" and field in ("order", "desc", "max"):
+                raise UnsupportedQuery("Cannot parse %s" % item)
+            if field == "order":
+                if value in UNSUPPORTED_ORDER:
+                    raise UnsupportedQuery("Cannot order by %s" % value)
+                self.order = value
+            elif field == "desc":
+                self.desc = value not in ("", "0")
+            elif field == "max":
+                if not re.match("^[0-9]+$", value):
+                    raise UnsupportedQuery("Cannot parse %s" % item)
+                self.max = int(value)
+            elif field in UNSUPPORTED_FIELDS or field == "or" \
+                 or field in fields:
+                raise UnsupportedQuery("Constraint %s not supported" % item)
+            else:
+                fields.add(field)
+                self.constraints.append((field, operator, value.split("|")))
+
+    def match(self, attributes):
+        """Return whether the ticket attributes match the constraints."""
+        for (field, operator, values) in self.constraints:
+            value = attributes.get(field) or ""
+            if operator == "=~":
+                value = value.lower()
+                matched = any(wanted.lower() in value for wanted in values)
+            else:
+                matched = value in values
+                if operator == "!=":
+                    matched = not matched
+            if not matched:
+                return False
+        return True
+
+    def execute(self, tickets, enums={}):
+        """Return the ids of the tickets matching the query, sorted as trac
+does.
+
+tickets is an iterable of tickets, as returned by ticket.get.
+enums maps the enumeration fields (priority, severity...) to the list of their
+        values, in order.
+"""
+        matching = [ticket for ticket in tickets if self.match(ticket[3])]
+        if self.order == "id":
+            key = lambda ticket:ticket[0]
+        elif self.order in enums:
+            ranks = {
+                value : rank for (rank, value) in enumerate(enums[self.order])
+            }
+            key = lambda ticket:ranks.get(ticket[3].get(self.order), len(ranks))
+        else:
+            # empty values come last, like in trac
+            key = lambda ticket:(
+                not ticket[3].get(self.order),
+                ticket[3].get(self.order) or ""
+            )
+        # ties are broken by id, the sorts being stable even in reverse order
+        matching.sort(key=lambda ticket:ticket[0])
+        matching.sort(key=key, reverse=self.desc)
+        ids = [ticket[0] for ticket in matching]
+        if self.max:
+            ids = ids[:self.max]
+        return ids
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Transfer of big attachments without holding them in memory.
+
+xmlrpc.client needs the whole content of a file in memory, then a base64
+encoded copy of it and then a copy of the XML body of the request. Here, the
+request body is generated on the fly while being sent: the file is read (mapped
+if possible) and base64 encoded a chunk at a time. In the same way, the
+responses are parsed while being received and the base64 values are decoded a
+chunk at a time into a file.
+"""
+
+import xmlrpc.client
+import base64
+import contextlib
+import mmap
+import os
+
+from .transport import response_chunks
+
+# size of the chunks read from the files, a multiple of 3 so that the base64
+# encoded chunks can be concatenated
+CHUNK_SIZE = 3 * 64 * 1024
+
+class StreamedFile(object):
+    """Parameter of an XML-RPC call standing for the base64 encoded content of
+    the file path."""
+
+    def __init__(self, path, progress=None):
+        """path is the file to send.
+progress, if given, is called with the number of bytes of the file sent so far
+        after each chunk."""
+        self.path = path
+        self.progress = progress
+        self.size = os.path.getsize(path)
+
+    def encoded_length(self):
+        """Return the length of the base64 encoded content."""
+        return 4 * ((self.size + 2) // 3)
+
+    def chunks(self):
+        """Iterate over the base64 encoded chunks of the content."""
+        with open(self.path, "rb") as fil:
+            try:
+                content = mmap.mmap(fil.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # empty or not mappable file
+                content = None
+            done = 0
+            while done < self.size:
+                if content is not None:
+                    chunk = content[done:done + CHUNK_SIZE]
+                else:
+                    chunk = fil.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                done += len(chunk)
+                yield base64.b64encode(chunk)
+                if self.progress:
+                    self.progress(done)
+            if content is not None:
+                content.close()
+
+class StreamedBody(object):
+    """Body of an HTTP request made of a prefix, the base64 encoded content of
+a StreamedFile and a suffix.
+
+It has a length and may be iterated several times, so that any xmlrpc.client
+        transport can send it and send it again when reconnecting."""
+
+    def __init__(self, prefix, streamed_file, suffix):
+        self.prefix = prefix
+        self.streamed_file = streamed_file
+        self.suffix = suffix
+
+    def __len__(self):
+        return len(self.prefix) + self.streamed_file.encoded_length() \
+            + len(self.suffix)
+
+    def __iter__(self):
+        yield self.prefix
+        for chunk in self.streamed_file.chunks():
+            yield chunk
+        yield self.suffix
+
+def _streamed_file_index(params):
+    return [
+        position for (position, param) in enumerate(params)
+        if isinstance(param, StreamedFile)
+    ][0]
+
+def streamed_body(method_name, params, encoding="utf-8", allow_none=False):
+    """Return the StreamedBody of the XML-RPC request calling method_name with
+    params, one of them being a StreamedFile."""
+    index = _streamed_file_index(params)
+    streamed_file = params[index]
+    # marshal the request with a marker in place of the file and cut the body
+    # around it
+    marker = os.urandom(16).hex().encode("ascii")
+    params = list(params)
+    params[index] = xmlrpc.client.Binary(marker)
+    body = xmlrpc.client.dumps(
+        tuple(params), method_name,
+        encoding=encoding,
+        allow_none=allow_none
+    ).encode(encoding, "xmlcharrefreplace")
+    encoded_marker = base64.encodebytes(marker)
+    position = body.index(encoded_marker)
+    return StreamedBody(body[:position], streamed_file,
+                        b"\n" + body[position + len(encoded_marker):])
+
+def call_with_file(server, method_name, params):
+    """Call the XML-RPC method method_name of server with params, one of them
+being a StreamedFile, and return the result.
+
+The request body is streamed when server is a xmlrpc.client.ServerProxy.
+        Otherwise, the file is read in memory and given as a
+        xmlrpc.client.Binary."""
+    if not isinstance(server, xmlrpc.client.ServerProxy):
+        index = _streamed_file_index(params)
+        streamed_file = params[index]
+        with open(streamed_file.path, "rb") as fil:
+            content = fil.read()
+        params = list(params)
+        params[index] = xmlrpc.client.Binary(content)
+        result = getattr(server, method_name)(*params)
+        if streamed_file.progress:
+            streamed_file.progress(len(content))
+        return result
+    transport = server._ServerProxy__transport
+    host = server._ServerProxy__host
+    handler = server._ServerProxy__handler
+    body = streamed_body(method_name, params,
+                         server._ServerProxy__encoding or "utf-8",
+                         server._ServerProxy__allow_none)
+    response = transport.request(host, handler, body,
+                                 verbose=server._ServerProxy__verbose)
+    if len(response) == 1:
+        response = response[0]
+    return response
+
+class _Base64Writer(object):
+    """Decoder of base64 text given in pieces, writing the decoded bytes into a
+    file."""
+
+    def __init__(self, fil, progress=None):
+        self.fil = fil
+        self.progress = progress
+        self.pieces = []
+        self.length = 0
+        self.done = 0
+
+    def write(self, text):
+        text = "".join(text.split())
+        self.pieces.append(text)
+        self.length += len(text)
+        if self.length >= 4 * CHUNK_SIZE // 3:
+            self.flush(final=False)
+
+    def flush(self, final=True):
+        text = "".join(self.pieces)
+        # only decode full quanta of 4 characters until the end
+        cut = len(text) if final else len(text) - len(text) % 4
+        self.pieces = [text[cut:]]
+        self.length = len(text) - cut
+        if cut:
+            data = base64.b64decode(text[:cut])
+            self.fil.write(data)
+            self.done += len(data)
+            if self.progress:
+                self.progress(self.done)
+
+class _FileUnmarshaller(object):
+    """Target of the XML parser giving everything to a regular unmarshaller,
+    except the content of the base64 values that goes to a _Base64Writer."""
+
+    def __init__(self, unmarshaller, writer):
+        self.unmarshaller = unmarshaller
+        self.writer = writer
+        self.in_base64 = False
+
+    def xml(self, encoding, standalone):
+        self.unmarshaller.xml(encoding, standalone)
+
+    def start(self, tag, attrs):
+        self.in_base64 = tag == "base64"
+        self.unmarshaller.start(tag, attrs)
+
+    def data(self, text):
+        if self.in_base64:
+            self.writer.write(text)
+        else:
+            self.unmarshaller.data(text)
+
+    def end(self, tag):
+        if tag == "base64":
+            self.in_base64 = False
+            self.writer.flush()
+        self.unmarshaller.end(tag)
+
+    def close(self):
+        return self.unmarshaller.close()
+
+def file_parser(fil, progress=None, use_datetime=False,
+                use_builtin_types=False):
+    """Return a tuple (parser, target) to parse a response whose result is a
+base64 value: the decoded value is written into the file fil and the rest is
+        unmarshalled as usual, target.close() giving the result.
+
+progress, if given, is called with the number of bytes written so far after
+        each chunk."""
+    unmarshaller = xmlrpc.client.Unmarshaller(use_datetime, use_builtin_types)
+    target = _FileUnmarshaller(unmarshaller, _Base64Writer(fil, progress))
+    return (xmlrpc.client.ExpatParser(target), target)
+
+@contextlib.contextmanager
+def atomic_file(path):
+    """Context manager giving a temporary file, opened for writing in binary
+mode, that is renamed to path when the context exits without error and removed
+        otherwise, so that path is never left truncated."""
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(path))
+    (descriptor, temporary_path) = tempfile.mkstemp(
+        prefix="." + os.path.basename(path) + ".", dir=directory
+    )
+    try:
+        with os.fdopen(descriptor, "wb") as fil:
+            yield fil
+        # give the file the permissions open would have given it
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temporary_path, 0o666 & ~umask)
+        os.replace(temporary_path, path)
+    except:
+        os.unlink(temporary_path)
+        raise
+
+def call_to_file(server, method_name, params, path, progress=None):
+    """Call the XML-RPC method method_name of server with params, the result
+being a base64 value, and write the decoded result into the file path.
+
+The content is written in a temporary file renamed to path once complete, see
+        atomic_file.
+progress, if given, is called with the number of bytes written so far after
+        each chunk.
+The response is parsed while being received when server is a
+        xmlrpc.client.ServerProxy. Otherwise, the result is held in memory.
+To do so, the parse_response method of the transport of server is replaced for
+        the duration of the call. Hence, that transport must not be used by
+        another thread meanwhile, as is the case of the transports of the server
+        proxies of trac_connection.factory_from_netrc, one per thread."""
+    with atomic_file(path) as fil:
+        if isinstance(server, xmlrpc.client.ServerProxy):
+            _call_to_file(server, method_name, params, fil, progress)
+        else:
+            data = getattr(server, method_name)(*params).data
+            fil.write(data)
+            if progress:
+                progress(len(data))
+
+def _call_to_file(server, method_name, params, fil, progress):
+    transport = server._ServerProxy__transport
+    encoding = server._ServerProxy__encoding or "utf-8"
+    body = xmlrpc.client.dumps(
+        tuple(params), method_name,
+        encoding=encoding,
+        allow_none=server._ServerProxy__allow_none
+    ).encode(encoding, "xmlcharrefreplace")
+
+    def parse_response(response):
+        # the request may be sent again when reconnecting, start afresh
+        fil.seek(0)
+        fil.truncate()
+        (parser, target) = file_parser(fil, progress, transport._use_datetime,
+                                       transport._use_builtin_types)
+        # unlike xmlrpc.client, decompress the gzip responses on the fly
+        for data in response_chunks(response,
+                                    getattr(transport, "response_stats",
+                                            None)):
+            parser.feed(data)
+        parser.close()
+        return target.close()
+
+    # the transport is only used by the current thread, the way it parses the
+    # responses may be changed for the duration of the call
+    transport.parse_response = parse_response
+    try:
+        transport.request(server._ServerProxy__host,
+                          server._ServerProxy__handler, body,
+                          verbose=server._ServerProxy__verbose)
+    finally:
+        del transport.parse_response
@@ -13,44 +13,46 @@ specific to your projects.
 import xmlrpc.client
 import configparser
 import cmd
-import subprocess
-import tempfile
 import os
 import sys
-import pprint
 import string
-import json
 from . import trac_connection
 import re
-import pickle
 import shlex
-import readline
 import glob
 import socket
-
-# setup the readline library so that it dos not take / and - as separator
-readline.set_completer_delims(
-    readline.get_completer_delims().replace("/", "").replace("-", "")
-)
-
-# handle the history
-histfile = os.environ.get("TRAC_CMD_TEMPLATE_FILE",
-                          os.path.expanduser("~/.traccmd_history"))
-try:
-    readline.read_history_file(histfile)
-except IOError:
-    pass
-import atexit
-atexit.register(readline.write_history_file, histfile)
-del histfile
+import threading
 
 from datetime import datetime
 from datetime import timedelta
 from .trhaelppyercthon import TPH
+from .transfer import TransferError
+from .metadata import METHODS
 from .attributes import TPHAttributes
 from .edit import edit
 import logging
-logging.basicConfig(level=logging.DEBUG)
+
+# the modules only needed by some commands, such as pprint, subprocess, json,
+# pickle or difflib, and the readline library, only needed in interactive mode,
+# are imported when used, to keep the one shot commands quick to start
+
+def setup_readline():
+    """Setup the readline library and the history of the interactive mode."""
+    import readline
+    import atexit
+    # setup the readline library so that it dos not take / and - as separator
+    readline.set_completer_delims(
+        readline.get_completer_delims().replace("/", "").replace("-", "")
+    )
+
+    # handle the history
+    histfile = os.environ.get("TRAC_CMD_TEMPLATE_FILE",
+                              os.path.expanduser("~/.traccmd_history"))
+    try:
+        readline.read_history_file(histfile)
+    except IOError:
+        pass
+    atexit.register(readline.write_history_file, histfile)
 
 def safe_to_int(value):
     try:
@@ -64,8 +66,46 @@ def glob_them(files):
         res += glob.glob(file)
     return res
 
+class _ThreadOutput(object):
+    """Replacement of sys.stdout writing into the buffer of the current thread,
+    if it has one, and into output otherwise."""
+
+    def __init__(self, output):
+        self.output = output
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            return self.output.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        if getattr(self.local, "buffer", None) is None:
+            self.output.flush()
+
+    def isatty(self):
+        return False
+
 class TracCmd(cmd.Cmd, object):
-    def __init__(self, server, login="", url="", template_file="", report_last_time_file=""):
+    # the commands only reading from the trac, that may be run concurrently by
+    # batch
+    parallel_commands = set([
+        "get_actions", "list_attachment", "list_components", "list_priority",
+        "list_resolution", "list_status", "list_type", "method_help",
+        "method_list", "milestone_list",
+        "milestone_remaining_time_sum", "milestone_stuck_p", "ticket_attach_list",
+        "ticket_changelog", "ticket_comments", "ticket_description",
+        "ticket_field_values", "ticket_mine", "ticket_mine_pending",
+        "ticket_parents", "ticket_print", "ticket_query", "ticket_query_print",
+        "ticket_query_remaining_time", "ticket_query_time_sum",
+        "ticket_remaining_time", "ticket_remaining_time_sum", "ticket_search",
+        "ticket_sons", "ticket_sons_recursive", "ticket_summary", "whoami",
+        "wiki_attach_list", "wiki_search",
+    ])
+
+    def __init__(self, server, login="", url="", template_file="", report_last_time_file="",
+                 tph_options={}):
         """Initializes the TracCmd object.
 
 server, the xml rpc server to use
@@ -76,13 +116,13 @@ template_file, the location of the default template file to use, defaults to the
 report_last_time_file, the location of a file storing the last time the ticket
         report has been seen, see the documentation of the ticket_recent_changes
         command for more information.
+tph_options, the keyword arguments given to TPH, see its documentation.
 """
         cmd.Cmd.__init__(self)
-        self.tph = TPH(server)
+        self.tph = TPH(server, **tph_options)
 
         self._ticket_order = None
         self.me = login
-        self.pp = pprint.PrettyPrinter(indent=4)
         self.url = url
         self.template_file = template_file \
                              or \
@@ -98,6 +138,146 @@ report_last_time_file, the location of a file storing the last time the ticket
 
         self.last_recent_change_date = None
 
+    @property
+    def pp(self):
+        """Pretty printer used to show the raw results of the trac."""
+        import pprint
+        return pprint.PrettyPrinter(indent=4)
+
+    def preloop(self):
+        setup_readline()
+
+    @property
+    def recorder(self):
+        """The instrumentation.Recorder of the transport of the server, None if
+        the calls are not measured."""
+        return getattr(self._transport(), "recorder", None)
+
+    def _transport(self):
+        try:
+            return self.tph.server("transport")
+        except (TypeError, AttributeError):
+            return None
+
+    def precmd(self, line):
+        recorder = self.recorder
+        if recorder is not None and line.split(" ", 1)[0] != "stats":
+            recorder.start_command(line)
+        return line
+
+    def postcmd(self, stop, line):
+        recorder = self.recorder
+        if recorder is not None and line.split(" ", 1)[0] != "stats":
+            recorder.end_command()
+        return stop
+
+    def batch(self, lines, worker_factory=None, jobs=4, json_output=False):
+        """Run the commands of lines, one per line, and print their outputs in
+the same order. Empty lines and lines beginning with # are ignored.
+
+The consecutive commands of parallel_commands are run concurrently by at most
+        jobs threads, each one with its own TracCmd made by worker_factory. The
+        other ones are run one after the other by self. Without worker_factory,
+        all the commands are run by self.
+If json_output is set, print for each command a JSON object with the line
+        number, command, exit status, output and error. Otherwise, print their
+        outputs and report the failures on stderr.
+Return the number of failed commands."""
+        import concurrent.futures
+        import json
+        commands = [
+            (number, line.strip()) for (number, line)
+            in enumerate(lines, 1)
+            if line.strip() and not line.strip().startswith("#")
+        ]
+        output = _ThreadOutput(sys.stdout)
+        local = threading.local()
+
+        def worker_run(command):
+            worker = getattr(local, "worker", None)
+            if worker is None:
+                worker = worker_factory()
+                local.worker = worker
+            worker.me = self.me
+            worker._ticket_order = self._ticket_order
+            return self._batch_run(worker, command, output)
+
+        def report(result):
+            if json_output:
+                output.output.write(json.dumps(result) + "\n")
+            else:
+                output.output.write(result["output"])
+                if result["status"]:
+                    sys.stderr.write("line %s: %s failed: %s\n" % (
+                        result["line"], result["command"], result["error"]
+                    ))
+            output.output.flush()
+
+        failures = 0
+        (sys.stdout, old_stdout) = (output, sys.stdout)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=jobs) as executor:
+                index = 0
+                while index < len(commands):
+                    group = [commands[index]]
+                    if worker_factory is not None \
+                       and self.parseline(commands[index][1])[0] \
+                       in self.parallel_commands:
+                        while index + len(group) < len(commands) \
+                              and self.parseline(
+                                  commands[index + len(group)][1]
+                              )[0] in self.parallel_commands:
+                            group.append(commands[index + len(group)])
+                        results = executor.map(worker_run, group)
+                    else:
+                        results = [self._batch_run(self, group[0], output)]
+                    for result in results:
+                        failures += bool(result["status"])
+                        report(result)
+                    index += len(group)
+        finally:
+            sys.stdout = old_stdout
+        sys.stderr.write("%s command(s) run, %s failed\n" % (len(commands),
+                                                              failures))
+        return failures
+
+    def _batch_run(self, program, command, output):
+        """Run command, a tuple (line number, line), with program and return
+        its result, see batch."""
+        import io
+        (number, line) = command
+        buffer = io.StringIO()
+        status = 0
+        error = ""
+        output.local.buffer = buffer
+        try:
+            name = program.parseline(line)[0]
+            if not name or not hasattr(program, "do_" + name):
+                status = 1
+                error = "Unknown command"
+            else:
+                program.stdout = output
+                # through the hooks, so that the calls are measured per command
+                line = program.precmd(line)
+                program.postcmd(program.onecmd(line), line)
+        except SystemExit as exit:
+            if exit.code:
+                status = exit.code if isinstance(exit.code, int) else 1
+                error = str(exit.code)
+        except Exception as exception:
+            status = 1
+            error = "%s: %s" % (type(exception).__name__, exception)
+        finally:
+            output.local.buffer = None
+        return {
+            "line" : number,
+            "command" : line,
+            "status" : status,
+            "output" : buffer.getvalue(),
+            "error" : error,
+        }
+
     def do_ticket_create(self, line):
         """Create a new ticket, interpreting the remaining of the line as a
 python dictionary containing default attributes."""
@@ -106,6 +286,7 @@ python dictionary containing default attributes."""
             "status":"new",
         }
         if line:
+            import json
             attributes.update(json.loads(line))
 
         ticket_number = self.tph.ticket_create(attributes, True)
@@ -189,7 +370,7 @@ The first argument of the line is the ticket number to clone, the rest is
         query may be for instance "owner=owner&status=accepted"."""
         assert line, "argument cannot be empty"
         try:
-            print(self.tph.server.ticket.query(line))
+            print(self.tph.ticket_query(line))
         except xmlrpc.client.Fault as e:
             print(e)
 
@@ -225,7 +406,10 @@ The first argument of the line is the ticket number to clone, the rest is
         """Return the list of sons of ticket_number and their sons and the sons
         of their sons and the..."""
         assert ticket_number, "argument cannot be empty"
-        self._ticket_sons_recursive(ticket_number, "")
+        ticket_number = int(ticket_number.replace("#", ""))
+        hierarchy = self.tph.ticket_hierarchy([ticket_number])
+        for (depth, son) in hierarchy.walk(ticket_number):
+            print("  " * depth + str(son))
 
     def do_ticket_parents(self, ticket_number):
         """Returns the list of parents of ticket_number."""
@@ -257,32 +441,41 @@ The first argument of the line is the ticket number to clone, the rest is
         """Displays the sum of the remaining times of the tickets matching the
         query."""
         assert query, "argument cannot be empty"
-        ticket_numbers = self.tph.server.ticket.query(query)
+        ticket_numbers = self.tph.ticket_query(query)
         self._ticket_remaining_time(ticket_numbers)
 
     def do_ticket_recent_changes(self, date_time):
         """Dump the recent changes of tickets since date_time. If date_time is
-        not given, pickel loads it from self.report_last_time_file."""
+        not given, pickel loads it from self.report_last_time_file.
+
+The changes are got a batch of tickets at a time and printed as soon as their
+        batch is got, sorted by date within the batch only. If the first
+        argument is --sorted, all the changes are printed sorted by date, but
+        nothing is printed until the changes of all the tickets are got, see
+        TPH.ticket_recent_changes_iter."""
+        (ordered, date_time) = self._flag_parse(date_time, "--sorted")
         date = self._parse_date_recent_changes(date_time)
         print(("Report for date %s" % date))
-        changes = self.tph.ticket_recent_changes(
-            date,
-            filter=lambda log:not (
-                log[3] == "comment" \
-                and log[5] == ""
-            )
-        )
         # recent changes do not show created tickets get the created tickets
         # from that time
         self.last_recent_change_date = datetime.today()
-        for change in sorted(changes, key=lambda change:change[1]):
+        for change in self.tph.ticket_recent_changes_iter(
+                date,
+                filter=lambda log:not (
+                    log[3] == "comment" \
+                    and log[5] == ""
+                ),
+                ordered=ordered
+        ):
             #self.pp.pprint(change)
             self._dump_change(change)
+            sys.stdout.flush()
 
     def do_ticket_recent_changes_save_date(self, date_time):
         """Record the last report date.
         If a date is given as argument, use that date.
         Default to the last report date"""
+        import pickle
         assert self.report_last_time_file,\
             "You must indicate a file in the config file"
         if date_time:
@@ -341,13 +534,16 @@ The first argument of the line is the ticket number to clone, the rest is
         self._ticket_edit(ticket_numbers)
 
     def do_ticket_edit_batch(self, tickets):
-        """Batch edit the tickets."""
+        """Batch edit the tickets.
+
+If the first argument is --dry-run, only print what would be changed."""
+        (dry_run, tickets) = self._dry_run_parse(tickets)
         tickets = self._ticket_list_parse(tickets)
-        self._ticket_edit_batch(tickets)
+        self._ticket_edit_batch(tickets, dry_run)
 
     def do_ticket_query_edit(self, query):
         """Edit the tickets matching query."""
-        tickets = self.tph.server.ticket.query(query)
+        tickets = self.tph.ticket_query(query)
         self._ticket_edit(tickets)
 
     def do_ticket_order(self, line):
@@ -377,8 +573,8 @@ The first argument of the line is the ticket number to clone, the rest is
         assert fields, "Fields must be given"
         assert query, "Query must be given"
         try:
-            tickets = self.tph.server.ticket.query(query)
-            tickets = [self.tph.ticket_get(ticket) for ticket in tickets]
+            tickets = self.tph.ticket_query(query)
+            tickets = self.tph.ticket_get_many(tickets)
             if self._ticket_order:
                 sorter = eval("lambda x:" + self._ticket_order)
                 tickets.sort(key=lambda x:sorter(x[3]))
@@ -402,9 +598,29 @@ The first argument of the line is the ticket number to clone, the rest is
             print(ticket, self.tph.ticket_get(ticket)[3][field])
 
     def do_ticket_query_edit_batch(self, query):
-        """Batch edit all the tickets matching query."""
-        tickets = self.tph.server.ticket.query(query)
-        self._ticket_edit_batch(tickets)
+        """Batch edit all the tickets matching query.
+
+If the first argument is --dry-run, only print what would be changed."""
+        (dry_run, query) = self._dry_run_parse(query)
+        tickets = self.tph.ticket_query(query)
+        self._ticket_edit_batch(tickets, dry_run)
+
+    def do_ticket_edit_many(self, tickets):
+        """Edit the tickets in a single document, opening the editor once.
+
+The text above the first ticket is the comment of the changes. Only the changed
+        tickets are updated. If the first argument is --dry-run, only print
+        what would be changed."""
+        (dry_run, tickets) = self._dry_run_parse(tickets)
+        self._ticket_edit_many(self._ticket_list_parse(tickets), dry_run)
+
+    def do_ticket_query_edit_many(self, query):
+        """Edit all the tickets matching query in a single document, see
+        ticket_edit_many.
+
+If the first argument is --dry-run, only print what would be changed."""
+        (dry_run, query) = self._dry_run_parse(query)
+        self._ticket_edit_many(self.tph.ticket_query(query), dry_run)
 
     def _ticket_changelog(self, line, filter, long=False):
         ticket_number, *lines = shlex.split(line)
@@ -488,10 +704,14 @@ Description""" % fil)
             match = re.search("^[^\n]+\n\n(.+)$", desc)
             desc = match.group(1)
             files[fil] = desc
-        print(self.tph.ticket_attachment_put(
-            ticket,
-            files
-        ))
+        try:
+            print(self.tph.ticket_attachment_put(
+                ticket,
+                files
+            ))
+        except TransferError as error:
+            print(error)
+            return
         print("Files attached to the ticket")
 
     def do_ticket_attach_get(self, ticket_attachs):
@@ -523,7 +743,16 @@ The first argument is the ticket to split, the second one is the number of
         number = args[1]
         assert ticket and re.search("^[0-9]+$", ticket)
         assert number and re.search("^[0-9]+$", number)
-        tickets = self.tph.ticket_split(int(ticket), int(number), self.me, use_editor=True)
+        pipeline = self.tph.edit_pipeline([ticket])
+        try:
+            tickets = self.tph.ticket_split(int(ticket), int(number), self.me,
+                                            use_editor=True, pipeline=pipeline)
+        finally:
+            if pipeline is not None:
+                results = self._pipeline_report(pipeline.finish())
+        if pipeline is not None:
+            tickets = [result["ticket"] for result in results
+                       if result["action"] == "create"]
         if tickets != []:
             print("Ticket %s split into %s" % (ticket, tickets))
         else:
@@ -578,19 +807,35 @@ The first argument is the ticket to split, the second one is the number of
 
     def do_milestone_stuck_p(self, milestone_name):
         """The milestone is stuck if one of its tickets is blocked by a tickets
-not closed or not into the milestone"""
-        ticket_numbers = self.tph.server.ticket.query("milestone=%s&blockedby!=" % milestone_name)
-        # for each ticket, find out if its blockers are scheduled
-        for ticket_number in ticket_numbers:
-            ticket = self.tph.ticket_get(int(ticket_number))
-            blocking_ticket_numbers = re.split("[ ,]+", ticket[3]["blockedby"])
-            for blocking_ticket_number in blocking_ticket_numbers:
-                blocking_ticket = self.tph.ticket_get(int(blocking_ticket_number))
-                if blocking_ticket[3]["status"] != "closed" \
-                   and blocking_ticket[3]["milestone"] != milestone_name:
+not closed or not into the milestone, directly or through other tickets.
+
+Also display the dependency cycles and the critical path of the milestone, that
+        is the chain of blocking tickets with the highest remaining time."""
+        graph = self.tph.milestone_dependency_graph(milestone_name)
+        for (ticket_number, blockers) in \
+                graph.outside_blockers(milestone_name).items():
+            for blocking_ticket_number in blockers:
+                if blocking_ticket_number in graph.blockers[ticket_number]:
                     print("%s is blocked by %s not in current milestone" % (
                         ticket_number, blocking_ticket_number
                     ))
+                else:
+                    print("%s is transitively blocked by %s not in current milestone" % (
+                        ticket_number, blocking_ticket_number
+                    ))
+        for cycle in graph.cycles():
+            print("Dependency cycle between %s" % ", ".join(
+                str(number) for number in cycle
+            ))
+        milestone_tickets = [
+            number for (number, ticket) in graph.tickets.items()
+            if ticket[3].get("milestone") == milestone_name
+        ]
+        (time, path) = graph.critical_path(milestone_tickets)
+        if path:
+            print("Critical path (%s hours): %s" % (
+                time, " -> ".join(str(number) for number in path)
+            ))
 
     def do_wiki_search(self, query):
         """Print the result of the search of query into the wiki"""
@@ -621,19 +866,19 @@ not closed or not into the milestone"""
 
     def do_list_resolution(self, line):
         """Print the list of the resolutions."""
-        self.pp.pprint(self.tph.server.ticket.resolution.getAll())
+        self.pp.pprint(self.tph.metadata_get("resolutions"))
 
     def do_list_priority(self, line):
         """Print the list of the priority."""
-        self.pp.pprint(self.tph.server.ticket.priority.getAll())
+        self.pp.pprint(self.tph.metadata_get("priorities"))
 
     def do_list_status(self, line):
         """Print the list of the status."""
-        self.pp.pprint(self.tph.server.ticket.status.getAll())
+        self.pp.pprint(self.tph.metadata_get("statuses"))
 
     def do_list_type(self, line):
         """Print the list of the type."""
-        self.pp.pprint(self.tph.server.ticket.type.getAll())
+        self.pp.pprint(self.tph.metadata_get("types"))
 
     def do_wiki_attach_list(self, page):
         """Print the list of files attached to the wiki page."""
@@ -661,10 +906,14 @@ Existing attachments with the same name will be overwritten."""
         attach_files = glob_them(attach_files)
         files = {}
 
-        print(self.tph.wiki_attachment_put(
-            page,
-            attach_files
-        ))
+        try:
+            print(self.tph.wiki_attachment_put(
+                page,
+                attach_files
+            ))
+        except TransferError as error:
+            print(error)
+            return
         print("Files attached to the page")
 
     def do_wiki_attach_delete(self, page_attachs):
@@ -747,7 +996,7 @@ Existing attachments with the same name will be overwritten."""
 
     def do_ticket_query_web(self, query):
         """Open all the tickets matching query in the web browser."""
-        tickets = self.tph.server.ticket.query(query)
+        tickets = self.tph.ticket_query(query)
         for ticket in tickets:
             url="%(URL)s/ticket/%(TICKET)s" % {
                 "URL" : self.url,
@@ -781,6 +1030,7 @@ Existing attachments with the same name will be overwritten."""
 
     def do__api(self, ticket):
         """Open the API page with the browser"""
+        import subprocess
         subprocess.Popen(
             [os.environ['BROWSER'],
              "%(URL)s/login/xmlrpc" % {"URL" : self.url}],
@@ -792,9 +1042,11 @@ Existing attachments with the same name will be overwritten."""
         """Prints the remaining time of ticket_numbers. If sum is True, then the
         time of a ticket is the sum of its time and the time of all its children."""
         total = 0
+        if sum:
+            values = self.tph.ticket_remaining_time_sums(ticket_numbers)
         for ticket_number in ticket_numbers:
             if sum:
-                value = self.tph.ticket_remaining_time_sum(ticket_number)
+                value = values[int(str(ticket_number).replace("#", ""))]
             else:
                 value = self.tph.ticket_remaining_time(ticket_number)
             total += value
@@ -804,18 +1056,45 @@ Existing attachments with the same name will be overwritten."""
             print("Total :",total)
 
     def _ticket_edit(self, ticket_numbers):
-        """Open tickets for edition."""
+        """Open tickets for edition.
+
+The next tickets are got and the changes are sent in the background, see
+        TPH.edit_pipeline, the failed changes are reported at the end."""
         total = len(ticket_numbers)
         print("%s tickets to edit" % total)
-        for ticket_number in ticket_numbers:
-            print("Editing ticket %s" % ticket_number)
-            if self.tph.ticket_edit(int(ticket_number)):
-                total -= 1
-                print("Ticket %s edited, %s left" % (ticket_number, total))
+        pipeline = self.tph.edit_pipeline(ticket_numbers)
+        try:
+            for ticket_number in ticket_numbers:
+                print("Editing ticket %s" % ticket_number)
+                if self.tph.ticket_edit(int(ticket_number), pipeline=pipeline):
+                    total -= 1
+                    print("Ticket %s edited, %s left" % (ticket_number, total))
+                else:
+                    print("Edition aborted")
+        finally:
+            if pipeline is not None:
+                self._pipeline_report(pipeline.finish())
+
+    def _pipeline_report(self, results):
+        """Print the failures of the changes sent by a pipeline.EditPipeline
+        and return the results of the other ones."""
+        succeeded = []
+        for result in results:
+            if result["status"] in ("updated", "created"):
+                succeeded.append(result)
+                continue
+            if result["action"] == "create":
+                what = "Creation of a ticket"
+            else:
+                what = "Edition of ticket %s" % result["ticket"]
+            if result["status"] == "conflict":
+                print("%s not done, the ticket changed in the meantime" % what)
             else:
-                print("Edition aborted")
+                print("%s failed: %s" % (what, result["message"]))
+            print("  the change is kept in %s" % result["kept"])
+        return succeeded
 
-    def _ticket_edit_batch(self, ticket_numbers):
+    def _ticket_edit_batch(self, ticket_numbers, dry_run=False):
         """Open tickets for batch edition."""
         attributes = {
             field : ""
@@ -825,28 +1104,87 @@ Existing attachments with the same name will be overwritten."""
         if not attributes:
             print("Abort edition")
             return
-        comment = edit("Comment")
-        if not comment:
-            print("Aborting due to empty comment")
+        if dry_run:
+            comment = ""
+        else:
+            comment = edit("Comment")
+            if not comment:
+                print("Aborting due to empty comment")
+                return
+        results = self.tph.ticket_batch_update(
+            [(ticket_number, attributes) for ticket_number in ticket_numbers],
+            comment,
+            dry_run=dry_run
+        )
+        self._ticket_batch_report(results)
+
+    def _ticket_edit_many(self, ticket_numbers, dry_run=False):
+        """Edit the tickets in a single document."""
+        print("%s tickets to edit" % len(ticket_numbers))
+        results = self.tph.ticket_edit_many(ticket_numbers, dry_run)
+        if results is None:
+            print("Edition aborted")
             return
-        for ticket_number in ticket_numbers:
-            print("Editing ticket %s" % ticket_number)
-            print("Merging attributes")
-            ticket = self.tph.ticket_get(ticket_number)
-            new_attributes = self.tph.attrs.merge(ticket[3], attributes, True)
-            # handle the special case where nothing has changed
-            if new_attributes == ticket[3]:
+        self._ticket_batch_report(results)
+
+    def _ticket_batch_report(self, results):
+        """Print the results of TPH.ticket_batch_update."""
+        import difflib
+        for result in results:
+            ticket_number = result["ticket"]
+            if result["status"] == "unchanged":
                 print("Nothing to do for ticket %s" % ticket_number)
+            elif result["status"] == "dry-run":
+                new = dict(result["old"])
+                new.update(result["changes"])
+                # the fields in sorted order, the changed ones not in
+                # self.tph.attrs included, then the description ended by a
+                # line break so that its last line is not glued to the next
+                # one of the diff
+                keys = sorted(set(self.tph.attrs.fields).union(
+                    result["changes"]
+                ).difference(["description"]))
+
+                def lines(attributes):
+                    return [
+                        "%s=%s\n" % (key, attributes.get(key) or "")
+                        for key in keys
+                    ] + ((attributes.get("description") or "")
+                         + "\n").splitlines(True)
+                sys.stdout.writelines(difflib.unified_diff(
+                    lines(result["old"]), lines(new),
+                    "#%s" % ticket_number, "#%s" % ticket_number
+                ))
+                print()
+            elif result["status"] == "updated":
+                print("Ticket %s edited" % (ticket_number))
+            elif result["status"] == "conflict":
+                print("Ticket %s changed in the meantime, not edited" % (
+                    ticket_number
+                ))
             else:
-                if self.tph.server.ticket.update(
-                        ticket_number,
-                        comment,
-                        new_attributes,
-                        True
-                ):
-                    print("Ticket %s edited" % (ticket_number))
-                else:
-                    print("Failed to edit ticket %s" % (ticket_number))
+                print("Failed to edit ticket %s: %s" % (ticket_number,
+                                                        result["message"]))
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        print(", ".join(
+            "%s %s" % (count, status)
+            for (status, count) in sorted(counts.items())
+        ))
+
+    def _dry_run_parse(self, line):
+        """Return a tuple (dry_run, line) telling whether line starts with
+        --dry-run and the rest of the line."""
+        return self._flag_parse(line, "--dry-run")
+
+    def _flag_parse(self, line, flag):
+        """Return a tuple (present, line) telling whether line starts with
+        flag and the rest of the line."""
+        match = re.match("^ *%s( +|$)(.*)$" % re.escape(flag), line)
+        if match:
+            return (True, match.group(2))
+        return (False, line)
 
     def _ticket_attributes_parse_line(self, line):
         '''Ex: 72 {"summary":"New ticket"}'''
@@ -854,6 +1192,7 @@ Existing attachments with the same name will be overwritten."""
         ticket_number = content_match.group(1)
         attributes = content_match.group(3)
         if attributes:
+            import json
             attributes = json.loads(attributes)
         else:
             attributes = {}
@@ -867,6 +1206,7 @@ Existing attachments with the same name will be overwritten."""
 
     def _parse_date_recent_changes(self, date_time):
         """Parse the line given by the user as recent change date and return a date."""
+        import pickle
         if date_time:
             date = self._parse_date(date_time)
         elif self.report_last_time_file \
@@ -933,14 +1273,9 @@ Existing attachments with the same name will be overwritten."""
         else:
             self.pp.pprint(change)
 
-    def _ticket_sons_recursive(self, ticket_number, indent):
-        """Prints a hierarchy of tickets."""
-        print(indent + str(ticket_number))
-        for son in self.tph.ticket_sons(ticket_number):
-            self._ticket_sons_recursive(son, indent + "  ")
-
     def _open_in_browser(self, url):
         """Open the url with the web browser."""
+        import subprocess
         subprocess.Popen(
             [os.environ['BROWSER'],
              url
@@ -976,27 +1311,115 @@ Existing attachments with the same name will be overwritten."""
         return time
 
     def _wiki_attach_get(self, attachments):
-        for attachment in attachments:
-            attachment_binary = self.tph.server.wiki.getAttachment(
-                attachment
-            )
-            attachment_name = os.path.basename(attachment)
-            dest_file_name = os.path.join(os.getcwd(), attachment_name)
-            open(attachment_name, "wb").write(attachment_binary.data)
-            print("File %s got and written into %s" % (attachment,
-                                                       dest_file_name))
+        self._attach_get_report(
+            self.tph.wiki_attachment_get_many,
+            [
+                (attachment, os.path.basename(attachment))
+                for attachment in attachments
+            ]
+        )
 
     def _ticket_attach_get(self, attachments):
-        for text in attachments:
-            ticket = text.split("/")[0]
-            attachment_name = "/".join(text.split("/")[1:])
-            attachment_binary = self.tph.server.ticket.getAttachment(
-                ticket,
-                attachment_name
-            )
-            open(attachment_name, "wb").write(attachment_binary.data)
-            print("File %s got and written into %s" % (attachment_name,
-                                                       attachment_name))
+        self._attach_get_report(
+            self.tph.ticket_attachment_get_many,
+            [
+                (text.split("/")[0], "/".join(text.split("/")[1:]),
+                 "/".join(text.split("/")[1:]))
+                for text in attachments
+            ]
+        )
+
+    def _attach_get_report(self, get_many, attachments):
+        try:
+            got = get_many(attachments)
+        except TransferError as error:
+            got = error.results
+            print(error)
+        for (attachment, path) in got:
+            print("File %s got and written into %s" % (
+                attachment, os.path.join(os.getcwd(), path)
+            ))
+
+    def do_cache_sync(self, line):
+        """Synchronise the local ticket cache with the trac."""
+        if self.tph.cache is None:
+            print("No cache configured")
+            return
+        self.tph.cache_sync(force=True)
+        print("Cache synchronised")
+
+    def do_cache_fill(self, line):
+        """Put all the tickets of the trac into the local ticket cache, so that
+        the queries may then be evaluated without the trac."""
+        if self.tph.cache is None:
+            print("No cache configured")
+            return
+        self.tph.cache_fill()
+        print("Cache filled with %s tickets" % len(self.tph.cache.ticket_numbers()))
+
+    def do_wiki_mirror_sync(self, line):
+        """Synchronise the local wiki mirror with the trac."""
+        if self.tph.wiki_mirror is None:
+            print("No wiki mirror configured")
+            return
+        self.tph.wiki_mirror_sync(force=True)
+        print("Wiki mirror synchronised")
+
+    def do_metadata_invalidate(self, line):
+        """Forget the cached metadata of the trac (ticket fields, components,
+milestones...) so that they are got again.
+
+The arguments are the metadata to forget, among ticket_fields, components,
+        milestones, priorities, resolutions, statuses and types. Without
+        argument, forget them all."""
+        keys = shlex.split(line) or None
+        for key in keys or []:
+            if key not in METHODS:
+                print("Unknown metadata %s" % key)
+                return
+        self.tph.metadata_invalidate(keys)
+        print("Metadata invalidated")
+
+    def complete_metadata_invalidate(self, text, line, begidx, endidx):
+        return [key for key in sorted(METHODS) if key.startswith(text)]
+
+    def do_compression_stats(self, line):
+        """Show the bytes sent to and received from the trac since the start,
+        and how many of them the gzip compression saved."""
+        stats = getattr(self._transport(), "stats", None)
+        if stats is None:
+            print("No statistics with this transport")
+            return
+        print(stats)
+
+    def do_stats(self, line):
+        """Show the measures of the calls to the trac performed by the last
+command and by the whole session: per method, the number of calls, of errors,
+        the time spent in the calls, marshalling the requests, sending them and
+        waiting for the server, reading and unmarshalling the responses, the
+        bytes sent and received, and the latency histogram.
+
+The calls are measured only if enabled in the instrumentation section of the
+        configuration file."""
+        recorder = self.recorder
+        if recorder is None:
+            print("The calls are not measured, see the instrumentation section"
+                  " of the configuration file")
+            return
+        if recorder.command_line is not None:
+            print("Last command: %s" % recorder.command_line)
+            print(recorder.command.format())
+            print("")
+        print("Session:")
+        print(recorder.session.format())
+
+    def do_cache_clear(self, line):
+        """Empty the local ticket cache."""
+        if self.tph.cache is None:
+            print("No cache configured")
+            return
+        self.tph.cache_clear()
+        print("Cache cleared")
 
     def do_EOF(self, line):
         """EOF command quits the application"""
@@ -1020,11 +1443,45 @@ The format of the configuration file is expected to be:
 url=...
 trac_path=...
 protocol=...
+rpc=...
 [report]
 last_time_file=...
+[connection]
+keep_alive=...
+pool_size=...
+idle_timeout=...
+timeout=...
+encode_threshold=...
+accept_gzip=...
+multicall=...
+max_workers=...
+transfer_workers=...
+edit_prefetch=...
+probe=...
+[cache]
+ticket_file=...
+max_age=...
+query_default_max=...
+wiki_file=...
+metadata_file=...
+metadata_max_age=...
+[daemon]
+socket=...
+[instrumentation]
+enabled=...
+trace_file=...
 
 See the trac_connection library for more information about the server part and
-    the documentation of TracCmd for the documentation of last_time_file.
+    the documentation of TracCmd for the documentation of last_time_file. The
+    connection section is optional, see the transport library for more
+    information about it. The cache section is optional too, the ticket cache is
+    used only if ticket_file is given, see the cache library, the wiki mirror
+    only if wiki_file is given, see the wiki_mirror library, and the metadata
+    cache only if metadata_file is given, see the metadata library. The daemon
+    section is optional, it is only needed to run trac_cmd.py as a daemon, see
+    the daemon library. The instrumentation section is optional too, the calls
+    are measured only if enabled is set or trace_file is given, see the
+    instrumentation library.
 """
     configuration_file = os.environ.get("TRAC_CMDRC",
                    os.path.expanduser("~/.trac_cmdrc.conf"))
@@ -1050,16 +1507,103 @@ last_time_file=~/trac_cmd_last_time.picle
     protocol = config.get("server", "protocol")
     trac_path = config.get("server", "trac_path")
     last_time_file = config.get("report", "last_time_file")
-    (login, server) = trac_connection.from_netrc(url, protocol, trac_path)
-    return (login, server, protocol, url, trac_path, last_time_file)
+    timeout = config.get("connection", "timeout", fallback="")
+    encode_threshold = config.get("connection", "encode_threshold",
+                                  fallback="")
+    trace_file = config.get("instrumentation", "trace_file", fallback="")
+    if trace_file or config.getboolean("instrumentation", "enabled",
+                                       fallback=False):
+        from .instrumentation import Recorder
+        recorder = Recorder(os.path.expanduser(trace_file))
+    else:
+        recorder = None
+    (login, server_factory) = trac_connection.factory_from_netrc(
+        url, protocol, trac_path,
+        keep_alive=config.getboolean("connection", "keep_alive",
+                                     fallback=True),
+        pool_size=config.getint("connection", "pool_size", fallback=4),
+        idle_timeout=config.getfloat("connection", "idle_timeout",
+                                     fallback=60),
+        timeout=float(timeout) if timeout else None,
+        rpc=config.get("server", "rpc", fallback="xml"),
+        encode_threshold=int(encode_threshold) if encode_threshold else None,
+        accept_gzip=config.getboolean("connection", "accept_gzip",
+                                      fallback=True),
+        recorder=recorder,
+    )
+    server = server_factory()
+    # the connection is checked anyway by the first call, only spend a round
+    # trip on it in interactive mode
+    if config.getboolean("connection", "probe", fallback=len(sys.argv) <= 1):
+        trac_connection.check(server)
+    tph_options = {
+        "server_factory" : server_factory,
+        "multicall" : config.getboolean("connection", "multicall",
+                                        fallback=True),
+        "max_workers" : config.getint("connection", "max_workers",
+                                      fallback=1),
+        "transfer_workers" : config.getint("connection", "transfer_workers",
+                                           fallback=4),
+        "edit_prefetch" : config.getint("connection", "edit_prefetch",
+                                        fallback=4),
+        "cache_max_age" : config.getfloat("cache", "max_age", fallback=60),
+    }
+    ticket_file = config.get("cache", "ticket_file", fallback="")
+    if ticket_file:
+        from .cache import TicketCache
+        tph_options["cache"] = TicketCache(ticket_file)
+        tph_options["query_default_max"] = config.getint(
+            "cache", "query_default_max", fallback=100
+        )
+    wiki_file = config.get("cache", "wiki_file", fallback="")
+    if wiki_file:
+        from .wiki_mirror import WikiMirror
+        tph_options["wiki_mirror"] = WikiMirror(wiki_file)
+    metadata_file = config.get("cache", "metadata_file", fallback="")
+    if metadata_file:
+        from .metadata import MetadataCache
+        tph_options["metadata"] = MetadataCache(
+            metadata_file,
+            config.getfloat("cache", "metadata_max_age", fallback=86400)
+        )
+    return (login, server, protocol, url, trac_path, last_time_file,
+            tph_options)
+
+def thread_tph_options(tph_options):
+    """Return a copy of tph_options usable by a TPH in another thread.
+
+The caches cannot be shared among threads, they are opened again."""
+    tph_options = dict(tph_options)
+    if tph_options.get("cache") is not None:
+        from .cache import TicketCache
+        tph_options["cache"] = TicketCache(tph_options["cache"].path)
+    if tph_options.get("wiki_mirror") is not None:
+        from .wiki_mirror import WikiMirror
+        tph_options["wiki_mirror"] = WikiMirror(tph_options["wiki_mirror"].path)
+    if tph_options.get("metadata") is not None:
+        from .metadata import MetadataCache
+        tph_options["metadata"] = MetadataCache(
+            tph_options["metadata"].path, tph_options["metadata"].max_age
+        )
+    return tph_options
+
+def argv_command(argv):
+    """Return the command line to give to TracCmd.onecmd to run the command
+    given as command line arguments argv."""
+    return argv[0] + " " + " ".join([
+        shlex.quote(arg)
+        for arg in argv[1:]
+    ])
 
 def main():
+    logging.basicConfig(level=logging.DEBUG)
     (login,
      server,
      protocol,
      url,
      trac_path,
-     last_time_file) = get_configuration_options()
+     last_time_file,
+     tph_options) = get_configuration_options()
     program = TracCmd(server,
             login=login,
             url="%(PROTOCOL)s://%(URL)s%(PATH)s" % {
@@ -1067,13 +1611,60 @@ def main():
                 "URL" : url,
                 "PATH" : trac_path,
             },
-            report_last_time_file=last_time_file
+            report_last_time_file=last_time_file,
+            tph_options=tph_options
         )
+    if sys.argv[1:] == ["daemon"]:
+        from . import daemon
+        socket_path = daemon.socket_path()
+        assert socket_path, "You must indicate a socket in the daemon section" \
+            " of the config file"
+
+        def run(argv):
+            if argv[0] not in daemon.forwarded_commands:
+                sys.exit("%s needs the terminal of the user, it cannot be run"
+                         " by the daemon" % argv[0])
+            # the output of cmd itself goes to the client too
+            program.stdout = sys.stdout
+            line = program.precmd(argv_command(argv))
+            program.postcmd(program.onecmd(line), line)
+
+        daemon.serve(socket_path, run)
+        sys.exit(0)
+    if sys.argv[1:2] and sys.argv[1].startswith("-"):
+        # only the batch mode has options, the commands never start with -
+        import argparse
+        parser = argparse.ArgumentParser(
+            description="Run the commands of a file, one per line."
+        )
+        parser.add_argument("--batch", metavar="FILE",
+                            help="file of the commands, - for stdin")
+        parser.add_argument("--json", action="store_true",
+                            help="print the results as JSON lines")
+        parser.add_argument("--jobs", type=int, default=4,
+                            help="maximum number of commands run"
+                            " concurrently")
+        args = parser.parse_args()
+        if args.batch is None:
+            parser.error("the options are only meaningful with --batch")
+
+        def worker_factory():
+            return TracCmd(tph_options["server_factory"](),
+                           login=login,
+                           url=program.url,
+                           report_last_time_file=last_time_file,
+                           tph_options=thread_tph_options(tph_options))
+
+        if args.batch == "-":
+            lines = sys.stdin.readlines()
+        else:
+            with open(args.batch, "r") as fil:
+                lines = fil.readlines()
+        failures = program.batch(lines, worker_factory=worker_factory,
+                                 jobs=args.jobs, json_output=args.json)
+        sys.exit(1 if failures else 0)
     if len(sys.argv) > 1:
-        program.onecmd(sys.argv[1] + " " + " ".join([
-            "'{}'".format(arg)
-            for arg in sys.argv[2:]
-        ]))
+        program.onecmd(argv_command(sys.argv[1:]))
         sys.exit(0)
     program.cmdloop()
 
@@ -6,19 +6,60 @@ import netrc
 from urllib.parse import unquote, quote
 import logging
 import socket
+from .transport import make_transport, CompressionStats, ConnectionPool
 logger = logging.getLogger(__file__)
 
-def from_netrc(url, protocol, trac_path):
+def from_netrc(url, protocol, trac_path, keep_alive=True, pool_size=4,
+               idle_timeout=60, timeout=None, probe=True, rpc="xml",
+               encode_threshold=None, accept_gzip=True, recorder=None):
     """Retrieve connection information from netrc.
 
 url is the url of the server to be connected to, without the protocol part.
 protocol is the protocol to use.
 trac_path is the path to trac.
+keep_alive, pool_size, idle_timeout and timeout configure the pool of persistent
+    connections, encode_threshold and accept_gzip the compression, see
+    transport.make_transport.
+recorder is an instrumentation.Recorder measuring the calls, None means no
+    measure.
+probe tells whether to check the connection right away, see check. Otherwise,
+    nothing is sent to the server before the first call.
+rpc is the protocol spoken with the trac, "xml" for XML-RPC or "json" for
+    JSON-RPC, see the jsonrpc library.
 
 For instance, if connecting to https://somesite/trac/, then url, protocol,
     trac_path should be somesite, https and trac. the associated machine entry
     in netrc is expected to be https://somesite
     """
+    (login, server_factory) = factory_from_netrc(url, protocol, trac_path,
+                                                 keep_alive=keep_alive,
+                                                 pool_size=pool_size,
+                                                 idle_timeout=idle_timeout,
+                                                 timeout=timeout,
+                                                 rpc=rpc,
+                                                 encode_threshold=encode_threshold,
+                                                 accept_gzip=accept_gzip,
+                                                 recorder=recorder)
+    server = server_factory()
+    if probe:
+      check(server)
+    return (login, server,)
+
+def check(server):
+    """Make sure the connection to server is OK."""
+    try:
+      # try anything to make sure the connection is OK
+      server.system.listMethods()
+    except socket.gaierror as error:
+      if error.errno == -2:
+        print("Cannot connect to: {}".format(server))
+
+def netrc_url(url, protocol, trac_path, rpc="xml"):
+    """Return a tuple (login, conn_url) where conn_url is the url of the XML-RPC
+    interface of the trac, or of the JSON-RPC one if rpc is "json", with the
+    credentials found in netrc if any, see from_netrc. login is None when there
+    are no credentials.
+    """
     net = netrc.netrc()
     authentication = net.authenticators(
       "%s://%s" % (protocol, url,)
@@ -26,32 +67,75 @@ For instance, if connecting to https://somesite/trac/, then url, protocol,
     if authentication:
       logger.info("Using authenticated rpc")
       (login, account, password) = authentication
-      conn_url = "%(PROTOCOL)s://%(LOGIN)s:%(PASS)s@%(URL)s%(PATH)s/login/xmlrpc" % {"LOGIN" : login,
+      conn_url = "%(PROTOCOL)s://%(LOGIN)s:%(PASS)s@%(URL)s%(PATH)s/login/%(RPC)srpc" % {"LOGIN" : login,
                                                                                 "PASS" : password,
                                                                                 "PROTOCOL" : protocol,
                                                                                 "PATH" : trac_path,
                                                                                 "URL" : url,
+                                                                                "RPC" : rpc,
       }
       #logger.debug(conn_url)
-      server = xmlrpc.client.ServerProxy(conn_url)
     else:
       logger.warn("Using visitor rpc since no authentication provided")
       login = None
-      server = \
-               xmlrpc.client.ServerProxy(
-                 "%(PROTOCOL)s://%(URL)s%(PATH)s/rpc"
-                 % {
-                    "PROTOCOL" : protocol,
-                    "PATH" : trac_path,
-                    "URL" : url,
-                  }
-               )
+      conn_url = "%(PROTOCOL)s://%(URL)s%(PATH)s/rpc" % {
+        "PROTOCOL" : protocol,
+        "PATH" : trac_path,
+        "URL" : url,
+      }
 
-    try:
-      # try anything to make sure the connection is OK
-      server.system.listMethods()
-    except socket.gaierror as error:
-      if error.errno == -2:
-        print("Cannot connect to: {}".format(server))
+    return (login, conn_url,)
 
-    return (login, server,)
+def factory_from_netrc(url, protocol, trac_path, keep_alive=True, pool_size=4,
+                       idle_timeout=60, timeout=None, rpc="xml",
+                       encode_threshold=None, accept_gzip=True,
+                       recorder=None):
+    """Same as from_netrc, but return a tuple (login, server_factory).
+
+server_factory is a function taking no argument and returning a new server
+    proxy to the trac each time it is called. Since a server proxy cannot be
+    shared between threads, this is the way to give each thread its own
+    connection to the trac. The transports of all those server proxies share
+    the same transport.ConnectionPool of pool_size idle connections,
+    server("transport").pool, the same transport.CompressionStats,
+    server("transport").stats, and the same recorder,
+    server("transport").recorder.
+    """
+    (login, conn_url) = netrc_url(url, protocol, trac_path, rpc)
+    stats = CompressionStats()
+    pool = ConnectionPool(pool_size if keep_alive else 0, idle_timeout)
+
+    def server_factory():
+      if rpc == "json":
+        from . import jsonrpc
+        transport = jsonrpc.make_transport(protocol,
+                                           keep_alive=keep_alive,
+                                           pool_size=pool_size,
+                                           idle_timeout=idle_timeout,
+                                           timeout=timeout,
+                                           encode_threshold=encode_threshold,
+                                           accept_gzip=accept_gzip,
+                                           stats=stats,
+                                           recorder=recorder,
+                                           pool=pool)
+        if recorder is not None:
+          from .instrumentation import InstrumentedJsonServerProxy
+          return InstrumentedJsonServerProxy(conn_url, recorder,
+                                             transport=transport)
+        return jsonrpc.JsonServerProxy(conn_url, transport=transport)
+      transport = make_transport(protocol,
+                                 keep_alive=keep_alive,
+                                 pool_size=pool_size,
+                                 idle_timeout=idle_timeout,
+                                 timeout=timeout,
+                                 encode_threshold=encode_threshold,
+                                 accept_gzip=accept_gzip,
+                                 stats=stats,
+                                 recorder=recorder,
+                                 pool=pool)
+      if recorder is not None:
+        from .instrumentation import InstrumentedServerProxy
+        return InstrumentedServerProxy(conn_url, recorder, transport=transport)
+      return xmlrpc.client.ServerProxy(conn_url, transport=transport)
+
+    return (login, server_factory,)
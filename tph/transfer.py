@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Concurrent transfers of attachments.
+
+The transfers are performed by a pool of threads, each one with its own server
+proxy, hence its own connection to the trac. The progress of the transfers in
+flight and of the whole is shown on stderr, followed by a summary.
+"""
+
+import concurrent.futures
+import threading
+import time
+import sys
+
+class TransferError(Exception):
+    """Some transfers failed, failures is the list of the tuples (transfer,
+    exception) and results the list of the results of the other transfers."""
+
+    def __init__(self, failures, results=[]):
+        Exception.__init__(
+            self,
+            "%s transfer(s) failed: %s" % (
+                len(failures),
+                ", ".join(transfer.name for (transfer, error) in failures)
+            )
+        )
+        self.failures = failures
+        self.results = results
+
+class Transfer(object):
+    """A transfer to perform."""
+
+    def __init__(self, name, function, size=None):
+        """name is shown in the progress.
+function is called with a server proxy and a progress function, to be called
+        with the number of bytes transferred so far. It performs the transfer
+        and returns its result.
+size is the number of bytes to transfer, None if unknown."""
+        self.name = name
+        self.function = function
+        self.size = size
+        self.done = 0
+
+def _megabytes(size):
+    return "%.1f MB" % (size / 1e6)
+
+class TransferScheduler(object):
+    """Perform transfers concurrently."""
+
+    def __init__(self, server, server_factory=None, max_workers=4,
+                 output=None):
+        """server is the server proxy used when server_factory, a function
+returning a new server proxy, is not given. In that case, the transfers are
+        performed one after the other.
+max_workers is the maximum number of concurrent transfers.
+output is where the progress is shown, defaults to the current sys.stderr."""
+        self.server = server
+        self.server_factory = server_factory
+        self.max_workers = max_workers if server_factory else 1
+        self.output = output or sys.stderr
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._running = []
+        self._finished = 0
+        self._shown = 0
+
+    def run(self, transfers):
+        """Perform transfers and return the tuple (results, failures).
+
+results is the list of the results of the successful transfers, in the order of
+        transfers. failures is the list of the tuples (transfer, exception) of
+        the failed ones."""
+        self.transfers = list(transfers)
+        self._start = time.time()
+        self._running = []
+        self._finished = 0
+        results = {}
+        failures = {}
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._perform, transfer) : index
+                for (index, transfer) in enumerate(self.transfers)
+            }
+            for future in concurrent.futures.as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as error:
+                    failures[index] = (self.transfers[index], error)
+        failures = [failures[index] for index in sorted(failures)]
+        self._summary(failures)
+        return ([results[index] for index in sorted(results)], failures)
+
+    def _server(self):
+        if self.server_factory is None:
+            return self.server
+        server = getattr(self._local, "server", None)
+        if server is None:
+            server = self.server_factory()
+            self._local.server = server
+        return server
+
+    def _perform(self, transfer):
+        start = time.time()
+
+        def progress(done):
+            transfer.done = done
+            self._show()
+
+        with self._lock:
+            self._running.append(transfer)
+        try:
+            result = transfer.function(self._server(), progress)
+        except Exception as error:
+            self._print("%s: failed (%s)" % (transfer.name, error), transfer)
+            raise
+        duration = max(time.time() - start, 1e-6)
+        self._print("%s: %s in %.1f s (%.1f MB/s)" % (
+            transfer.name, _megabytes(transfer.done), duration,
+            transfer.done / 1e6 / duration
+        ), transfer)
+        return result
+
+    def _status(self):
+        """Return the line giving the global progress and the progress of the
+        transfers in flight."""
+        done = sum(transfer.done for transfer in self.transfers)
+        total = sum(transfer.size or 0 for transfer in self.transfers)
+        duration = max(time.time() - self._start, 1e-6)
+        status = "%s/%s %s" % (
+            self._finished,
+            len(self.transfers),
+            _megabytes(done)
+        )
+        if total:
+            status += "/%s" % _megabytes(total)
+        status += " %.1f MB/s" % (done / 1e6 / duration)
+        for transfer in self._running:
+            if transfer.size:
+                status += " | %s %d%%" % (transfer.name,
+                                          100 * transfer.done / transfer.size)
+            else:
+                status += " | %s %s" % (transfer.name,
+                                        _megabytes(transfer.done))
+        return status
+
+    def _show(self):
+        """Redraw the progress line, at most ten times a second."""
+        if not self.output.isatty():
+            return
+        with self._lock:
+            now = time.time()
+            if now - self._shown < 0.1:
+                return
+            self._shown = now
+            self.output.write("\r\033[K" + self._status()[:200])
+            self.output.flush()
+
+    def _print(self, line, finished):
+        with self._lock:
+            self._running.remove(finished)
+            self._finished += 1
+            if self.output.isatty():
+                self.output.write("\r\033[K")
+            self.output.write(line + "\n")
+            self.output.flush()
+            self._shown = 0
+
+    def _summary(self, failures):
+        done = sum(transfer.done for transfer in self.transfers)
+        duration = max(time.time() - self._start, 1e-6)
+        self.output.write(
+            "%s file(s) transferred, %s in %.1f s (%.1f MB/s)\n" % (
+                len(self.transfers) - len(failures), _megabytes(done),
+                duration, done / 1e6 / duration
+            )
+        )
+        if failures:
+            self.output.write("%s failure(s):\n" % len(failures))
+            for (transfer, error) in failures:
+                self.output.write("  %s: %s\n" % (transfer.name, error))
+        self.output.flush()
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""XML-RPC transports keeping the connections to the trac server alive.
+
+The transports of xmlrpc.client keep at most one connection and forget it as
+soon as anything goes wrong. The transports of this module keep a pool of
+persistent connections per host, drop the ones that have been idle for too long
+and transparently reconnect when the server closed a connection that was
+waiting in the pool. The pool may be shared by the transports of several
+threads, see ConnectionPool.
+
+They also ask for gzip encoded responses and decompress them while parsing
+them, instead of holding the whole compressed response like xmlrpc.client. The
+request bodies may be gzip encoded too, provided the web server in front of the
+trac decodes them. The bytes sent and received are counted in a
+CompressionStats.
+
+Given an instrumentation.Recorder, they measure each request.
+"""
+
+import xmlrpc.client
+import http.client
+import threading
+import socket
+import time
+import zlib
+import logging
+logger = logging.getLogger(__file__)
+
+# errors meaning that the server closed a connection we kept in the pool
+RECONNECT_ERRORS = (
+    http.client.RemoteDisconnected,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+# size of the pieces of the responses read at once
+READ_SIZE = 64 * 1024
+
+class CompressionStats(object):
+    """Count the bytes sent and received, as they are on the wire and as they
+are before compression or after decompression.
+
+It may be shared by the transports of several threads."""
+
+    def __init__(self):
+        self.sent = 0
+        self.sent_raw = 0
+        self.received = 0
+        self.received_raw = 0
+        self._lock = threading.Lock()
+
+    def add_sent(self, sent, raw):
+        with self._lock:
+            self.sent += sent
+            self.sent_raw += raw
+
+    def add_received(self, received, raw):
+        with self._lock:
+            self.received += received
+            self.received_raw += raw
+
+    def saved(self):
+        """Return the number of bytes compression kept off the wire."""
+        return self.sent_raw - self.sent + self.received_raw - self.received
+
+    def __str__(self):
+        def ratio(wire, raw):
+            return 100.0 * (raw - wire) / raw if raw else 0.0
+        return "\n".join([
+            "Sent %s bytes for %s (%.1f%% saved)" % (
+                self.sent, self.sent_raw, ratio(self.sent, self.sent_raw)
+            ),
+            "Received %s bytes for %s (%.1f%% saved)" % (
+                self.received, self.received_raw,
+                ratio(self.received, self.received_raw)
+            ),
+            "%s bytes saved" % self.saved(),
+        ])
+
+class ConnectionPool(object):
+    """Idle persistent connections, per host.
+
+It may be shared by the transports of several threads, each connection being
+used by one transport at a time."""
+
+    def __init__(self, size=4, idle_timeout=60):
+        """size is the maximum number of idle connections kept per host.
+idle_timeout is the number of seconds after which an idle connection is
+        considered dead and is closed instead of being reused."""
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def checkout(self, host):
+        """Return an idle connection to host if one is still fresh, None
+        otherwise."""
+        now = time.monotonic()
+        with self._lock:
+            connections = self._connections.get(host, [])
+            while connections:
+                (connection, last_used) = connections.pop()
+                if now - last_used < self.idle_timeout:
+                    return connection
+                connection.close()
+        return None
+
+    def checkin(self, host, connection):
+        """Put connection back in the pool, unless the pool is full."""
+        with self._lock:
+            connections = self._connections.setdefault(host, [])
+            if len(connections) < self.size:
+                connections.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def close(self):
+        """Close all the idle connections."""
+        with self._lock:
+            pool = self._connections
+            self._connections = {}
+        for connections in pool.values():
+            for (connection, last_used) in connections:
+                connection.close()
+
+class _BothStats(object):
+    """Counter of the bytes received giving them to two counters."""
+
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+
+    def add_received(self, received, raw):
+        self.first.add_received(received, raw)
+        self.second.add_received(received, raw)
+
+def response_chunks(response, stats=None):
+    """Iterate over the pieces of the body of the http.client.HTTPResponse
+response, decompressed on the fly if gzip encoded.
+
+The bytes are counted in stats, a CompressionStats, if given."""
+    if response.getheader("Content-Encoding", "") == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    else:
+        decompressor = None
+    received = 0
+    raw = 0
+    while True:
+        data = response.read(READ_SIZE)
+        if not data:
+            break
+        received += len(data)
+        if decompressor is not None:
+            data = decompressor.decompress(data)
+        raw += len(data)
+        yield data
+    if decompressor is not None:
+        data = decompressor.flush()
+        raw += len(data)
+        yield data
+    if stats is not None:
+        stats.add_received(received, raw)
+
+class PersistentTransport(xmlrpc.client.Transport):
+    """Transport using a pool of persistent HTTP connections."""
+
+    # type of the request bodies
+    content_type = "text/xml"
+
+    def __init__(self, pool_size=4, idle_timeout=60, timeout=None,
+                 use_datetime=False, use_builtin_types=False,
+                 encode_threshold=None, accept_gzip=True, stats=None,
+                 recorder=None, pool=None):
+        """Initializes the pool.
+
+pool is the ConnectionPool keeping the idle connections, shared with other
+        transports, None means a new one of pool_size connections per host
+        closed after idle_timeout seconds.
+timeout is the socket timeout of the connections, None means the default one.
+encode_threshold is the size in bytes above which the request bodies are gzip
+        encoded, None means never. The streamed bodies, see the streaming
+        library, are never encoded.
+accept_gzip tells whether to ask for gzip encoded responses.
+stats is the CompressionStats counting the bytes, a new one if None.
+recorder is the instrumentation.Recorder measuring the requests, None means no
+        measure.
+"""
+        xmlrpc.client.Transport.__init__(self, use_datetime, use_builtin_types)
+        if pool is None:
+            pool = ConnectionPool(pool_size, idle_timeout)
+        self.pool = pool
+        self.timeout = timeout
+        self.encode_threshold = encode_threshold
+        self.accept_gzip_encoding = accept_gzip
+        self.stats = CompressionStats() if stats is None else stats
+        self.recorder = recorder
+        # the instrumentation.Call of the request in progress when recording
+        self._call = None
+
+    def request(self, host, handler, request_body, verbose=False):
+        """Send the request, retrying once with a new connection if the pooled
+        one has been closed by the server in the meantime."""
+        if self.recorder is None:
+            return self._request(host, handler, request_body, verbose)
+        call = self.recorder.begin(request_body)
+        self._call = call
+        try:
+            return self._request(host, handler, request_body, verbose)
+        except Exception as error:
+            call.error = "%s: %s" % (error.__class__.__name__, error)
+            raise
+        finally:
+            self._call = None
+            self.recorder.end(call)
+
+    @property
+    def response_stats(self):
+        """The counter of the bytes received, see response_chunks."""
+        if self._call is None:
+            return self.stats
+        return _BothStats(self.stats, self._call)
+
+    def _request(self, host, handler, request_body, verbose):
+        while True:
+            (connection, reused) = self._checkout(host)
+            try:
+                return self._single_request(connection, host, handler,
+                                            request_body, verbose)
+            except RECONNECT_ERRORS as error:
+                connection.close()
+                if not reused:
+                    raise
+                logger.debug("Reconnecting to %s after %r" % (host, error))
+
+    def _single_request(self, connection, host, handler, request_body, verbose):
+        """Perform the request using connection and put it back in the pool
+        once the response is read."""
+        try:
+            self._send_request(connection, handler, request_body, verbose)
+            response = connection.getresponse()
+            if self._call is not None:
+                self._call.wait = time.perf_counter() - self._call.sent
+            if response.status == 200:
+                self.verbose = verbose
+                try:
+                    result = self._parse(response)
+                except xmlrpc.client.Fault:
+                    # the response has been fully read, the connection is fine
+                    self._checkin(host, connection, response)
+                    raise
+                self._checkin(host, connection, response)
+                return result
+            if response.getheader("content-length", ""):
+                response.read()
+        except xmlrpc.client.Fault:
+            raise
+        except:
+            # the connection is in an unknown state
+            connection.close()
+            raise
+        # we got an error response
+        connection.close()
+        raise xmlrpc.client.ProtocolError(
+            host + handler,
+            response.status, response.reason,
+            dict(response.getheaders())
+        )
+
+    def _parse(self, response):
+        if self._call is None:
+            return self.parse_response(response)
+        start = time.perf_counter()
+        try:
+            return self.parse_response(response)
+        finally:
+            self._call.unmarshal = time.perf_counter() - start
+
+    def _send_request(self, connection, handler, request_body, verbose):
+        """Send the request headers and body on connection."""
+        if self._call is not None:
+            self._call.sent = time.perf_counter()
+        headers = self._headers + self._extra_headers
+        if verbose:
+            connection.set_debuglevel(1)
+        if self.accept_gzip_encoding:
+            connection.putrequest("POST", handler, skip_accept_encoding=True)
+            headers.append(("Accept-Encoding", "gzip"))
+        else:
+            connection.putrequest("POST", handler)
+        headers.append(("Content-Type", self.content_type))
+        headers.append(("User-Agent", self.user_agent))
+        self.send_headers(connection, headers)
+        self.send_content(connection, request_body)
+
+    def send_content(self, connection, request_body):
+        """Send request_body, gzip encoded if longer than encode_threshold."""
+        length = len(request_body)
+        if self.encode_threshold is not None \
+           and length > self.encode_threshold \
+           and isinstance(request_body, bytes):
+            connection.putheader("Content-Encoding", "gzip")
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            request_body = compressor.compress(request_body) + compressor.flush()
+        self.stats.add_sent(len(request_body), length)
+        connection.putheader("Content-Length", str(len(request_body)))
+        connection.endheaders(request_body)
+
+    def parse_response(self, response):
+        """Parse response while receiving it, see response_chunks."""
+        (parser, unmarshaller) = self.getparser()
+        for data in response_chunks(response, self.response_stats):
+            if self.verbose:
+                print("body:", repr(data))
+            parser.feed(data)
+        parser.close()
+        return unmarshaller.close()
+
+    def make_connection(self, host):
+        """Return a new connection to host."""
+        (chost, self._extra_headers, x509) = self.get_host_info(host)
+        return http.client.HTTPConnection(chost, timeout=self._timeout())
+
+    def _timeout(self):
+        if self.timeout is None:
+            return socket._GLOBAL_DEFAULT_TIMEOUT
+        return self.timeout
+
+    def _checkout(self, host):
+        """Return a tuple (connection, reused) with an idle connection to host
+        if one is still fresh or a new connection."""
+        connection = self.pool.checkout(host)
+        if connection is None:
+            return (self.make_connection(host), False)
+        # the connection may have been made by another transport sharing the
+        # pool, get the authentication headers make_connection would have got
+        (chost, self._extra_headers, x509) = self.get_host_info(host)
+        return (connection, True)
+
+    def _checkin(self, host, connection, response):
+        """Put connection back in the pool, unless the server asked to close it
+        or the pool is full."""
+        if response.will_close:
+            connection.close()
+            return
+        self.pool.checkin(host, connection)
+
+    def close(self):
+        """Close all the pooled connections, the ones of the transports sharing
+        the pool included."""
+        self.pool.close()
+        xmlrpc.client.Transport.close(self)
+
+class PersistentSafeTransport(PersistentTransport):
+    """Transport using a pool of persistent HTTPS connections."""
+
+    def __init__(self, pool_size=4, idle_timeout=60, timeout=None,
+                 use_datetime=False, use_builtin_types=False, context=None,
+                 encode_threshold=None, accept_gzip=True, stats=None,
+                 recorder=None, pool=None):
+        PersistentTransport.__init__(self, pool_size, idle_timeout, timeout,
+                                     use_datetime, use_builtin_types,
+                                     encode_threshold, accept_gzip, stats,
+                                     recorder, pool)
+        self.context = context
+
+    def make_connection(self, host):
+        """Return a new TLS connection to host."""
+        (chost, self._extra_headers, x509) = self.get_host_info(host)
+        return http.client.HTTPSConnection(chost, timeout=self._timeout(),
+                                           context=self.context,
+                                           **(x509 or {}))
+
+def make_transport(protocol, keep_alive=True, pool_size=4, idle_timeout=60,
+                   timeout=None, encode_threshold=None, accept_gzip=True,
+                   stats=None, recorder=None, pool=None):
+    """Return the transport to use for protocol (http or https).
+
+If keep_alive is false, the connections are closed after each call, unless a
+    pool is given. See PersistentTransport for the other arguments."""
+    if not keep_alive:
+        pool_size = 0
+    if protocol == "https":
+        transport_class = PersistentSafeTransport
+    else:
+        transport_class = PersistentTransport
+    return transport_class(pool_size=pool_size,
+                           idle_timeout=idle_timeout,
+                           timeout=timeout,
+                           encode_threshold=encode_threshold,
+                           accept_gzip=accept_gzip,
+                           stats=stats,
+                           recorder=recorder,
+                           pool=pool)
@@ -1,39 +1,145 @@
 #!/usr/bin/env python3
 # -*- coding:utf-8 -*-
 
-import netrc
-import tempfile
-import subprocess
 import datetime
 import os
 import re
 import xmlrpc.client
 import fnmatch
+import heapq
+import itertools
+import threading
+import time
+import concurrent.futures
 
 from .attributes import TPHAttributes
 from .edit import edit
+from .query import Query, UnsupportedQuery
+from .hierarchy import TicketHierarchy, ticket_numbers
+from .dependencies import DependencyGraph
+from .streaming import StreamedFile, call_with_file, call_to_file
+from .transfer import Transfer, TransferScheduler, TransferError
+from .metadata import METHODS
 
 class TPH(object):
     """This class provides a level functions on top of trac XML-RPC mechanism.
 
 It contains the special attributes server and attrs that may be changed by the
 user to fit her needs.
+
+Nothing is asked to the trac before being needed: the ticket fields, and the
+attrs built from them, are only got when first used.
+"""
+    def __init__(self, server, server_factory=None, multicall=True,
+                 max_workers=1, cache=None, cache_max_age=60,
+                 query_default_max=100, wiki_mirror=None, transfer_workers=4,
+                 metadata=None, edit_prefetch=4):
+        """Initializes the server to use.
+
+server_factory is a function returning a new server proxy to the same trac. It
+        is needed to perform concurrent calls since a server proxy cannot be
+        shared among threads.
+multicall tells whether the trac accepts system.multicall to bundle calls.
+max_workers is the maximum number of concurrent calls performed when multicall
+        is not available. It is only used if server_factory is given.
+cache is a cache.TicketCache used to avoid getting again and again the same
+        tickets from the trac. None means no cache.
+cache_max_age is the number of seconds during which the cache is trusted before
+        being synchronised again with the trac.
+query_default_max is the number of results of a query not giving max, that is
+        the items_per_page setting of the trac. It is used to evaluate the
+        queries locally when the cache holds all the tickets, see ticket_query.
+wiki_mirror is a wiki_mirror.WikiMirror used to search the wiki locally, see
+        wiki_source_grep. It is synchronised with the trac at most every
+        cache_max_age seconds. None means no mirror.
+transfer_workers is the maximum number of attachments transferred concurrently.
+        It is only used if server_factory is given.
+metadata is a metadata.MetadataCache used to avoid asking the trac its ticket
+        fields, components, milestones... each time they are needed. None means
+        no cache.
+edit_prefetch is the number of tickets got ahead while editing tickets one
+        after the other, see edit_pipeline. 0 disables the pipelined edition.
 """
-    def __init__(self, server):
-        """Initializes the server to use."""
         self.server = server
-        # Initialize the attributes according to what the trac gives me, ignore
-        # the time fields since I don't know yet how to serialize them
-        # properly. Also, the description is handled differently
-        self.attrs = TPHAttributes(
-            [
-                attribute["name"] for attribute in
-                server.ticket.getTicketFields()
-                if not "time" in attribute["name"]
-                and not attribute["name"] == "description"
-            ]
-        )
-        self.template_attributes = {}
+        self.server_factory = server_factory
+        self.multicall = multicall
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._local = threading.local()
+        self.cache = cache
+        self.cache_max_age = cache_max_age
+        self._cache_sync_time = None
+        self.query_default_max = query_default_max
+        self.wiki_mirror = wiki_mirror
+        self._wiki_mirror_sync_time = None
+        self.transfer_workers = transfer_workers
+        self.metadata = metadata
+        self.edit_prefetch = edit_prefetch
+        self._ticket_fields = None
+        self._attrs = None
+        self._attrs_fields = None
+        self._template_content = None
+        self._template_attributes = {}
+
+    @property
+    def ticket_fields(self):
+        """The fields of the tickets, as given by ticket.getTicketFields.
+
+With a metadata cache, they are asked to it each time, so that a long running
+        TPH, as the one of the daemon, sees them change once they are older
+        than its max_age. Otherwise, they are got once."""
+        if self._ticket_fields is not None:
+            return self._ticket_fields
+        ticket_fields = self.metadata_get("ticket_fields")
+        if self.metadata is None:
+            self._ticket_fields = ticket_fields
+        return ticket_fields
+
+    @ticket_fields.setter
+    def ticket_fields(self, ticket_fields):
+        self._ticket_fields = ticket_fields
+
+    @property
+    def attrs(self):
+        """The TPHAttributes used to edit the tickets, built again when the
+        ticket fields change."""
+        if self._attrs is not None and self._attrs_fields is None:
+            # given explicitly
+            return self._attrs
+        ticket_fields = self.ticket_fields
+        if self._attrs_fields is not ticket_fields:
+            # Initialize the attributes according to what the trac gives me,
+            # ignore the time fields since I don't know yet how to serialize
+            # them properly. Also, the description is handled differently
+            self._attrs = TPHAttributes(
+                [
+                    attribute["name"] for attribute in ticket_fields
+                    if not "time" in attribute["name"]
+                    and not attribute["name"] == "description"
+                ]
+            )
+            self._attrs_fields = ticket_fields
+        return self._attrs
+
+    @attrs.setter
+    def attrs(self, attrs):
+        self._attrs = attrs
+        self._attrs_fields = None
+
+    @property
+    def template_attributes(self):
+        """The attributes of the ticket template, parsed from the template file
+        when first used."""
+        if self._template_content is not None:
+            self._template_attributes = self.attrs.load(self._template_content)
+            self._template_content = None
+        return self._template_attributes
+
+    @template_attributes.setter
+    def template_attributes(self, attributes):
+        self._template_content = None
+        self._template_attributes = attributes
 
     def edit_comment(self, comment="", info="", prefix=""):
         """Use the edit library to edit the comment of a ticket."""
@@ -51,19 +157,41 @@ user to fit her needs.
         ]
         return "\n".join(new_comment_lines)
 
+    def metadata_get(self, key):
+        """Return the piece of metadata key, one of the keys of
+metadata.METHODS, for instance "milestones".
+
+It is taken from the metadata cache if one is configured."""
+        fetch = getattr(self.server, METHODS[key])
+        if self.metadata is None:
+            return fetch()
+        return self.metadata.get(key, fetch)
+
+    def metadata_invalidate(self, keys=None):
+        """Forget the cached metadata keys, all of them if None, so that they
+        are got again from the trac."""
+        if self.metadata is not None:
+            self.metadata.invalidate(keys)
+        if keys is None or "ticket_fields" in keys:
+            self._ticket_fields = None
+            self._attrs = None
+            self._attrs_fields = None
+
     def ticket_field_values(self, field_name):
-        fields = self.server.ticket.getTicketFields()
         values = {
             field["name"]:field.get("options", [])
-            for field in fields
+            for field in self.ticket_fields
         }
         return values[field_name]
 
-    def ticket_create(self, p_attributes, use_editor=False):
+    def ticket_create(self, p_attributes, use_editor=False, pipeline=None):
         """Create a new ticket, using p_attributes as set of attributes to set.
 
 If use_editor is set, use the attributes library to edit them before creating
 the ticket.
+If pipeline, a pipeline.EditPipeline, is given, the creation is sent in the
+        background and the concurrent.futures.Future of the id of the ticket is
+        returned.
 """
         attributes = self.template_attributes.copy()
         attributes.update(p_attributes)
@@ -76,6 +204,8 @@ the ticket.
             if attributes == None:
                 return None
 
+        if pipeline is not None:
+            return pipeline.create(summary, description, attributes)
         return self.server.ticket.create(
             summary,
             description,
@@ -116,11 +246,11 @@ the ticket.
                                               new_attributes)
             new_attributes = self.attrs.filter(new_attributes)
             if new_attributes:
-                res = self.server.ticket.update(int(blocking_number),
-                                          comment,
-                                          new_attributes,
-                                          True
-                                      )
+                res = self.ticket_update(int(blocking_number),
+                                   comment,
+                                   new_attributes,
+                                   True
+                               )
                 blockings_done.append(blocking_number)
         return blockings_done
 
@@ -146,15 +276,20 @@ attributes overrides some attributes of the ticket before edition
 
         return self.ticket_create(ticket_attributes, use_editor)
 
-    def ticket_son_create(self, ticket_number, reporter, attributes={}, use_editor=False):
+    def ticket_son_create(self, ticket_number, reporter, attributes={}, use_editor=False,
+                          pipeline=None):
         """Create a son ticket of ticket_number.
 
-use_editor is given to the call to ticket_create.
+use_editor and pipeline are given to the call to ticket_create, the pipeline
+        also gets ticket_number.
 reporter specifies who created the ticket, it defaults to self.me
 attributes overrides some attributes of the ticket before edition
 """
         # get the ticket to clone
-        ticket = self.ticket_get(ticket_number)
+        if pipeline is None:
+            ticket = self.ticket_get(ticket_number)
+        else:
+            ticket = pipeline.get(ticket_number)
         ticket_old_attributes = ticket[3]
         # get only the relevant info to copy from the parent ticket
         ticket_attributes = {
@@ -172,19 +307,159 @@ attributes overrides some attributes of the ticket before edition
             "description" : ticket_old_attributes["description"],
         }
         ticket_attributes.update(attributes)
-        return self.ticket_create(ticket_attributes, use_editor)
+        return self.ticket_create(ticket_attributes, use_editor, pipeline)
 
     def ticket_batch_set(self, id_list, attributes):
         """Set some attributes to a bunch of tickets.
 
 id_list is a list of ticket id
-attributes is a dictionary of attributes to set."""
-        for id in id_list:
-            self.server.ticket.update(int(id),
-                                      "",
-                                      attributes,
-                                      True
-                                  )
+attributes is a dictionary of attributes to set.
+
+See ticket_batch_update for the returned value."""
+        return self.ticket_batch_update(
+            [(id, attributes) for id in id_list],
+            merge=False
+        )
+
+    def ticket_batch_update(self, updates, comment="", merge=True,
+                            dry_run=False, tickets=None):
+        """Update a bunch of tickets at once.
+
+updates is a list of tuples (ticket id, attributes).
+comment is the comment added to all the updated tickets.
+merge tells whether the attributes are merged into the ones of the tickets
+        with self.attrs.merge (allowing to toggle, add or remove keywords and cc
+        values) or simply replace them.
+dry_run, if set, computes the changes without updating anything.
+tickets, if given, are the tickets of updates, in the same order, as already
+        got by ticket_get_many. A ticket changed since then is reported as a
+        conflict.
+
+The tickets are got in bulk and the new attributes are computed locally. The
+        tickets whose attributes do not change are not updated. The updates of
+        the other tickets are sent using call_many, with their _ts so that
+        trac refuses to update a ticket changed in the meantime.
+
+Return a list of dictionaries, one per ticket, with the keys:
+- ticket: the ticket id,
+- status: one of unchanged, dry-run, updated, conflict (the ticket was changed
+        by someone else since it was got) and failed,
+- old: the attributes of the ticket before the update,
+- changes: the attributes changed by the update,
+- message: the error message when the update failed."""
+        updates = [
+            (int(str(ticket_number).replace("#", "")), attributes)
+            for (ticket_number, attributes) in updates
+        ]
+        if tickets is None:
+            tickets = self.ticket_get_many([number for (number, _) in updates])
+        results = []
+        for ((number, attributes), ticket) in zip(updates, tickets):
+            old = ticket[3]
+            if merge:
+                attributes = self.attrs.merge(dict(old), attributes, True)
+            changes = {
+                key : value for (key, value) in attributes.items()
+                if key != "_ts" and (old.get(key) or "") != (value or "")
+            }
+            results.append({
+                "ticket" : number,
+                "status" : "unchanged" if not changes
+                           else "dry-run" if dry_run else "updated",
+                "old" : old,
+                "changes" : changes,
+                "message" : "",
+            })
+        to_update = [
+            result for result in results if result["status"] == "updated"
+        ]
+        updated = self.call_many(
+            "ticket.update",
+            [
+                (result["ticket"], comment,
+                 dict(result["changes"], _ts=result["old"]["_ts"]), True)
+                for result in to_update
+            ],
+            faults=True
+        )
+        for (result, ticket) in zip(to_update, updated):
+            if isinstance(ticket, xmlrpc.client.Fault):
+                result["message"] = ticket.faultString
+                if "updated since last get" in ticket.faultString:
+                    result["status"] = "conflict"
+                else:
+                    result["status"] = "failed"
+            elif self.cache is not None:
+                self.cache.put_many([ticket])
+        return results
+
+    def ticket_edit_many(self, ticket_numbers, dry_run=False):
+        """Edit the tickets ticket_numbers in a single editor session.
+
+The tickets are got in bulk and dumped into one document with
+        self.attrs.dump_many. The text above the first ticket is the comment of
+        the changes, its lines beginning with # are avoided. Removing the
+        section of a ticket leaves it unchanged.
+
+The changed tickets are updated with ticket_batch_update, with the _ts they had
+        when they were got, so that a ticket changed by someone else during the
+        edition is reported as a conflict.
+
+Return the results of ticket_batch_update, including the tickets that could not
+        be got as failed, or None if the edition was aborted."""
+        ticket_numbers = [
+            int(str(ticket_number).replace("#", ""))
+            for ticket_number in ticket_numbers
+        ]
+        results = []
+        tickets = {}
+        for (number, ticket) in zip(
+                ticket_numbers, self.ticket_get_many(ticket_numbers,
+                                                     faults=True)
+        ):
+            if isinstance(ticket, xmlrpc.client.Fault):
+                results.append({"ticket" : number, "status" : "failed",
+                                "old" : {}, "changes" : {},
+                                "message" : ticket.faultString})
+            else:
+                tickets[number] = ticket
+        if not tickets:
+            return results
+        document = self.attrs.dump_many(
+            [(number, ticket[3]) for (number, ticket) in tickets.items()]
+        )
+        new_document = edit(
+            "\n# comment of the changes above, lines beginning with # are"
+            " avoided\n# remove the section of a ticket to leave it"
+            " unchanged\n" + document,
+            prefix="tickets_"
+        )
+        if not new_document:
+            return None
+        (preamble, sections) = self.attrs.load_many(new_document)
+        comment = "\n".join([
+            line for line in preamble.splitlines()
+            if not re.search("^#", line)
+        ]).strip()
+        # compare with the attributes loaded from the untouched document, since
+        # dumping and loading normalises the line breaks of the descriptions
+        original = dict(self.attrs.load_many(document)[1])
+        changes = {}
+        for (number, attributes) in sections:
+            if number not in tickets:
+                continue
+            changes[number] = {
+                key : value for (key, value) in attributes.items()
+                if original[number].get(key) != value
+            }
+        results.extend(self.ticket_batch_update(
+            [(number, changes.get(number, {})) for number in tickets],
+            comment,
+            merge=False,
+            dry_run=dry_run,
+            tickets=list(tickets.values())
+        ))
+        return results
 
     def ticket_sibling_create(self, ticket_number, attributes, use_editor=False, reporter=""):
         """Create a sibling ticket of ticket_number.
@@ -220,7 +495,209 @@ attributes overrides some attributes of the ticket before edition
         """Get the ticket, given its id."""
         if type(ticket) == str:
             ticket = ticket.replace("#", "")
-        return self.server.ticket.get(ticket)
+        if self.cache is None:
+            return self.server.ticket.get(ticket)
+        self.cache_sync()
+        result = self.cache.get(ticket)
+        if result is None:
+            result = self.server.ticket.get(ticket)
+            self.cache.put_many([result])
+        return result
+
+    def ticket_get_many(self, tickets, chunk_size=100, faults=False):
+        """Get the tickets whose ids are in tickets, in the same order.
+
+See call_many for the meaning of chunk_size and faults."""
+        tickets = [
+            ticket.replace("#", "") if type(ticket) == str else ticket
+            for ticket in tickets
+        ]
+        if self.cache is None:
+            return self.call_many("ticket.get",
+                                  [(ticket,) for ticket in tickets],
+                                  chunk_size, faults)
+        self.cache_sync()
+        cached = self.cache.get_many(tickets)
+        missing = sorted(set(
+            int(ticket) for ticket in tickets
+            if int(ticket) not in cached
+        ))
+        fetched = self.call_many("ticket.get",
+                                 [(ticket,) for ticket in missing],
+                                 chunk_size, faults)
+        self.cache.put_many([
+            ticket for ticket in fetched
+            if not isinstance(ticket, xmlrpc.client.Fault)
+        ])
+        cached.update(zip(missing, fetched))
+        return [cached[int(ticket)] for ticket in tickets]
+
+    def ticket_query(self, query):
+        """Return the ids of the tickets matching query.
+
+When the cache holds all the tickets (see cache_fill), the query is evaluated
+        locally if the query.Query class understands it. Otherwise, it is given
+        to the trac."""
+        if self.cache is not None and self.cache.is_complete():
+            try:
+                parsed_query = Query(query, self.query_default_max)
+                fields = [field["name"] for field in self.ticket_fields]
+                for (field, operator, values) in parsed_query.constraints:
+                    if field not in fields:
+                        raise UnsupportedQuery("Unknown field %s" % field)
+            except UnsupportedQuery:
+                pass
+            else:
+                self.cache_sync()
+                enums = {
+                    field["name"] : field["options"]
+                    for field in self.ticket_fields
+                    if field["name"] in ("priority", "severity")
+                    and "options" in field
+                }
+                return parsed_query.execute(self.cache.tickets(), enums)
+        return self.server.ticket.query(query)
+
+    def ticket_update(self, ticket, comment, attributes, notify=True):
+        """Update the ticket with attributes and comment and return the updated
+        ticket, keeping the cache up to date."""
+        result = self.server.ticket.update(int(ticket), comment, attributes,
+                                           notify)
+        if self.cache is not None:
+            self.cache.put_many([result])
+        return result
+
+    def cache_sync(self, force=False):
+        """Synchronise the ticket cache with the trac.
+
+The tickets changed since the last synchronisation are removed from the cache,
+        so that they are got again from the trac the next time they are needed.
+        Unless force is set, nothing is done if the cache has been synchronised
+        less than cache_max_age seconds ago."""
+        if self.cache is None:
+            return
+        now = time.time()
+        if not force and self._cache_sync_time is not None \
+           and now - self._cache_sync_time < self.cache_max_age:
+            return
+        date = datetime.datetime.utcnow()
+        since = self.cache.last_sync()
+        if since is None:
+            # nothing tells what changed since the tickets have been cached
+            self.cache.clear()
+        else:
+            # leave some room for the clock skew between the trac and me
+            changed = self.server.ticket.getRecentChanges(
+                since - datetime.timedelta(minutes=5)
+            )
+            if self.cache.is_complete():
+                # get them back to keep all the tickets in the cache
+                self._cache_refresh(changed)
+            else:
+                self.cache.invalidate(changed)
+        self.cache.set_last_sync(date)
+        self._cache_sync_time = now
+
+    def cache_fill(self):
+        """Put all the tickets of the trac into the cache.
+
+Once done, the cache is kept complete by cache_sync and the queries may be
+        evaluated locally, see ticket_query."""
+        date = datetime.datetime.utcnow()
+        self.cache.clear()
+        self._cache_refresh(self.server.ticket.query("max=0&order=id"))
+        self.cache.set_complete(True)
+        self.cache.set_last_sync(date)
+        self._cache_sync_time = time.time()
+
+    def _cache_refresh(self, tickets):
+        """Get tickets from the trac and put them in the cache, removing from
+        the cache the ones that do not exist anymore."""
+        results = self.call_many("ticket.get",
+                                 [(int(ticket),) for ticket in tickets],
+                                 faults=True)
+        self.cache.put_many([
+            result for result in results
+            if not isinstance(result, xmlrpc.client.Fault)
+        ])
+        self.cache.invalidate([
+            ticket for (ticket, result) in zip(tickets, results)
+            if isinstance(result, xmlrpc.client.Fault)
+        ])
+
+    def cache_clear(self):
+        """Empty the ticket cache."""
+        if self.cache is not None:
+            self.cache.clear()
+            self._cache_sync_time = None
+
+    def call_many(self, method_name, args_list, chunk_size=100, faults=False,
+                  server=None):
+        """Call the XML-RPC method method_name once per tuple of arguments in
+args_list and return the results in the same order.
+
+If multicall is enabled, the calls are bundled into system.multicall requests
+        of at most chunk_size calls, so that n calls cost n / chunk_size round
+        trips instead of n. Otherwise, if a server_factory has been given, the
+        calls are performed by at most max_workers threads, each with its own
+        server proxy. Otherwise, they are performed one after the other.
+If faults is set, a call failing with a xmlrpc.client.Fault gives the fault as
+        result instead of raising it.
+server is the server proxy to use instead of self.server, for instance by
+        another thread. The calls are then performed one after the other with
+        it, even without multicall."""
+        args_list = list(args_list)
+        threaded = server is None
+        if server is None:
+            server = self.server
+        if self.multicall:
+            result = []
+            for start in range(0, len(args_list), chunk_size):
+                multicall = xmlrpc.client.MultiCall(server)
+                chunk = args_list[start:start + chunk_size]
+                for args in chunk:
+                    getattr(multicall, method_name)(*args)
+                results = multicall()
+                for index in range(len(chunk)):
+                    try:
+                        result.append(results[index])
+                    except xmlrpc.client.Fault as fault:
+                        if not faults:
+                            raise
+                        result.append(fault)
+            return result
+
+        def call(server, args):
+            try:
+                return getattr(server, method_name)(*args)
+            except xmlrpc.client.Fault as fault:
+                if not faults:
+                    raise
+                return fault
+
+        if threaded and self.server_factory and self.max_workers > 1 \
+             and len(args_list) > 1:
+            # call_many may be called by several threads, the pipelines' ones
+            # for instance
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.max_workers
+                    )
+            return list(self._executor.map(
+                lambda args:call(self._worker_server(), args),
+                args_list
+            ))
+        else:
+            return [call(server, args) for args in args_list]
+
+    def _worker_server(self):
+        """Return the server proxy of the current worker thread."""
+        server = getattr(self._local, "server", None)
+        if server is None:
+            server = self.server_factory()
+            self._local.server = server
+        return server
 
     def ticket_close(self, ticket):
         """Close the ticket whose id is ticket."""
@@ -230,17 +707,18 @@ attributes overrides some attributes of the ticket before edition
         content_split = content.splitlines()
         resolution = content_split[0]
         comment = "\n".join(content_split[2:])
-        self.server.ticket.update(ticket,
-                                  comment,
-                                  {
-                                      'action':'resolve',
-                                      'action_resolve_resolve_resolution': resolution,
-                                  },
-                                  True
-                              )
+        self.ticket_update(ticket,
+                           comment,
+                           {
+                               'action':'resolve',
+                               'action_resolve_resolve_resolution': resolution,
+                           },
+                           True
+                       )
         return True
 
-    def ticket_edit(self, ticket_number, new_attributes={}, name=""):
+    def ticket_edit(self, ticket_number, new_attributes={}, name="",
+                    pipeline=None):
         """Edit the ticket attributes.
 
 ticket_number is the id of the ticket to edit
@@ -248,10 +726,15 @@ new_attributes is a dictionary of attributes that will override the ones of the
         ticket before edition.
 name is a special string used in the name of the temporary file containing the
         attributes to edit
+pipeline is a pipeline.EditPipeline getting the ticket and sending the update in
+        the background, see edit_pipeline. None means waiting for both.
 """
         if not name:
             name = str(ticket_number)
-        ticket = self.ticket_get(ticket_number)
+        if pipeline is None:
+            ticket = self.ticket_get(ticket_number)
+        else:
+            ticket = pipeline.get(ticket_number)
         attributes = ticket[3]
         attributes.update(new_attributes)
 
@@ -261,7 +744,10 @@ name is a special string used in the name of the temporary file containing the
             comment = self.edit_comment(info=attributes_string, prefix=str(ticket_number))
             if comment is None:
                 return False
-            self.server.ticket.update(
+            if pipeline is not None:
+                pipeline.update(ticket[0], comment, attributes)
+                return True
+            self.ticket_update(
                 ticket[0],
                 comment,
                 attributes,
@@ -271,6 +757,20 @@ name is a special string used in the name of the temporary file containing the
         else:
             return False
 
+    def edit_pipeline(self, ticket_numbers=()):
+        """Return a pipeline.EditPipeline getting edit_prefetch of the tickets
+ticket_numbers ahead of the one being edited and sending the changes in the
+        background, to give to ticket_edit, ticket_son_create or ticket_split.
+        Its finish method must be called once the editions are done, to wait
+        for the changes and get their results.
+
+Return None if edit_prefetch is 0 or if there is no server_factory to give the
+        threads of the pipeline their server proxies."""
+        if not self.edit_prefetch or self.server_factory is None:
+            return None
+        from .pipeline import EditPipeline
+        return EditPipeline(self, ticket_numbers, self.edit_prefetch)
+
     def ticket_accept(self, ticket_number, owner):
         """Change the status of the ticket ticket_number to accepter and the
         owner to owner."""
@@ -287,7 +787,7 @@ name is a special string used in the name of the temporary file containing the
                 prefix="accept_"+str(ticket_number))
             if comment is None:
                 return False
-            self.server.ticket.update(
+            self.ticket_update(
                 ticket[0],
                 comment,
                 attributes,
@@ -299,7 +799,7 @@ name is a special string used in the name of the temporary file containing the
 
     def ticket_sons(self, ticket_number):
         """Returns the sons of the ticket ticket_number."""
-        return self.server.ticket.query("parents=~%s" % (ticket_number))
+        return self.ticket_query("parents=~%s" % (ticket_number))
 
     def ticket_parents(self, ticket_number):
         """Returns the parents of ticket_number."""
@@ -308,7 +808,10 @@ name is a special string used in the name of the temporary file containing the
     def ticket_remaining_time(self, ticket_number):
         """Returns the remaining time of ticket_number."""
         ticket = self.ticket_get(ticket_number)
-        attributes = ticket[3]
+        return self._remaining_time(ticket[3])
+
+    def _remaining_time(self, attributes):
+        """Returns the remaining time given the attributes of a ticket."""
         if attributes["estimatedhours"]:
             hours = int(attributes["estimatedhours"])
         else:
@@ -318,17 +821,81 @@ name is a special string used in the name of the temporary file containing the
     def ticket_remaining_time_sum(self, ticket_number):
         """Returns the sum of the remaining time of ticket_number and the
 remaining time of all its sons."""
-        time = self.ticket_remaining_time(ticket_number)
-        for child in self.ticket_sons(ticket_number):
-            time += self.ticket_remaining_time_sum(child)
-        return time
+        return self.ticket_remaining_time_sums([ticket_number])[
+            int(str(ticket_number).replace("#", ""))
+        ]
+
+    def ticket_remaining_time_sums(self, ticket_numbers):
+        """Returns a dictionary giving for each of ticket_numbers the sum of its
+remaining time and the remaining time of all its descendants.
+
+The hierarchy is computed once for all the tickets, see ticket_hierarchy, and
+        each descendant is counted once even if it has several parents."""
+        ticket_numbers = [
+            int(str(ticket_number).replace("#", ""))
+            for ticket_number in ticket_numbers
+        ]
+        hierarchy = self.ticket_hierarchy(ticket_numbers)
+        times = {
+            number : self._remaining_time(ticket[3])
+            for (number, ticket) in hierarchy.tickets.items()
+        }
+        return {
+            ticket_number : sum(
+                times.get(number, 0)
+                for number in hierarchy.descendants(ticket_number)
+            )
+            for ticket_number in ticket_numbers
+        }
+
+    def ticket_hierarchy(self, roots=(), chunk_size=100):
+        """Return a hierarchy.TicketHierarchy of the tickets roots and of all
+their descendants.
+
+The hierarchy is expanded level by level: the sons of all the tickets of a level
+        are found with parents=~ queries of at most chunk_size tickets, bundled
+        like call_many does, and got with ticket_get_many. It costs two round
+        trips per level instead of two per ticket. When the cache holds all the
+        tickets, the queries are evaluated locally, see ticket_query."""
+        level = sorted(set(
+            int(str(root).replace("#", "")) for root in roots
+        ))
+        tickets = dict(zip(level, self.ticket_get_many(level)))
+        # the tickets got so far, the ones not being sons included
+        got = dict(tickets)
+        while level:
+            queries = [
+                ("parents=~%s&max=0" % "|".join(
+                    str(number) for number in level[start:start + chunk_size]
+                ),)
+                for start in range(0, len(level), chunk_size)
+            ]
+            if self.cache is not None and self.cache.is_complete():
+                results = [self.ticket_query(*query) for query in queries]
+            else:
+                results = self.call_many("ticket.query", queries)
+            candidates = sorted(set(
+                number for result in results for number in result
+                if number not in tickets
+            ))
+            missing = [number for number in candidates if number not in got]
+            got.update(zip(missing, self.ticket_get_many(missing)))
+            parents = set(level)
+            level = []
+            # =~ matches the ticket 12 in the parents #123, keep the sons only
+            for number in candidates:
+                its_parents = ticket_numbers(got[number][3].get("parents"))
+                if parents.intersection(its_parents):
+                    tickets[number] = got[number]
+                    level.append(number)
+        return TicketHierarchy(tickets.values())
 
     def ticket_query_time_sum(self, query):
         """Returns the sum of the remaining time of all tickets matching query."""
-        tickets = self.server.ticket.query(query)
+        tickets = self.ticket_query(query)
         time = 0
-        for ticket in tickets:
-            time += self.ticket_remaining_time(ticket)
+        for ticket in self.ticket_get_many(tickets):
+            time += self._remaining_time(ticket[3])
 
         return time
 
@@ -337,11 +904,11 @@ remaining time of all its sons."""
         for id in id_list:
             ticket = self.ticket_get(id)
             attributes = self.attrs.edit(ticket[3])
-            self.server.ticket.update(int(id),
-                                      "",
-                                      attributes,
-                                      True
-                                  )
+            self.ticket_update(int(id),
+                               "",
+                               attributes,
+                               True
+                           )
 
     def ticket_changelog(self, ticket, filter=lambda x:True):
         """Return the changelog of ticket filtering with the filter argument
@@ -351,71 +918,216 @@ All the entries of the resulting changelog contains contain ticket as first elem
         cl = self.server.ticket.changeLog(ticket)
         return [[ticket] + l for l in cl if filter([ticket] + l)]
 
+    def ticket_changelog_many(self, tickets, filter=lambda x:True):
+        """Return the changelogs of tickets, in the same order, as returned by
+        ticket_changelog.
+
+The calls are performed using call_many."""
+        changelogs = self.call_many("ticket.changeLog",
+                                    [(ticket,) for ticket in tickets])
+        return [
+            [[ticket] + l for l in cl if filter([ticket] + l)]
+            for (ticket, cl) in zip(tickets, changelogs)
+        ]
+
     def ticket_recent_changes(self, since, filter=lambda x:True):
-        """Returns recent changes since the since date.
+        """Returns recent changes since the since date, sorted by date.
 
 filter may be used to filter the results."""
-        tickets = self.server.ticket.getRecentChanges(since)
-        created_tickets = self.server.ticket.query(
-            "created=%s.." % (since.strftime("%m/%d/%y"))
-        )
+        changes = [
+            change
+            for batch in self._ticket_recent_changes_batches(since, filter)
+            for change in batch
+        ]
+        changes.sort(key=lambda log:log[1])
+        return changes
+
+    def ticket_recent_changes_iter(self, since, filter=lambda x:True,
+                                   batch_size=100, ordered=False):
+        """Iterate over the recent changes since the since date.
+
+The tickets are handled batch_size at a time and the changes of a batch are
+        yielded sorted by date as soon as the batch is got. As the changes of a
+        ticket spread over the whole period, the batches overlap in time.
+        If ordered is true, all the changes are yielded sorted by date instead:
+        the sorted batches are written into a temporary file and merged lazily
+        once the last one is got, so that only one batch and one change per
+        batch are kept in memory, but nothing is yielded before all the
+        tickets are got.
+filter may be used to filter the results."""
+        import pickle
+        import tempfile
+        batches = self._ticket_recent_changes_batches(since, filter,
+                                                      batch_size)
+        if not ordered:
+            for batch in batches:
+                for change in batch:
+                    yield change
+            return
+        first = next(batches, [])
+        second = next(batches, None)
+        if second is None:
+            # a single batch, nothing to merge
+            for change in first:
+                yield change
+            return
+
+        def read(fil, position, count):
+            for index in range(count):
+                fil.seek(position)
+                change = pickle.load(fil)
+                position = fil.tell()
+                yield change
+
+        with tempfile.TemporaryFile() as fil:
+            runs = []
+            for batch in itertools.chain([first, second], batches):
+                runs.append((fil.tell(), len(batch)))
+                for change in batch:
+                    pickle.dump(change, fil)
+            for change in heapq.merge(*[
+                    read(fil, position, count) for (position, count) in runs
+            ], key=lambda log:log[1]):
+                yield change
+
+    def _ticket_recent_changes_batches(self, since, filter=lambda x:True,
+                                       batch_size=100):
+        """Iterate over the lists of the recent changes since the since date of
+        batch_size tickets at a time, each list being sorted by date."""
+        tickets = set(self.server.ticket.getRecentChanges(since))
+        created_tickets = set(self.ticket_query(
+            "created=%s..&max=0" % (since.strftime("%m/%d/%y"))
+        ))
         new_filter = lambda log:filter(log) and since <= log[1]
-        # from the created tickets. Retrieve only those that have been created
-        # after since
-        created_tickets_changelogs = []
-        for ticket_number in created_tickets:
-            ticket = self.ticket_get(ticket_number)
-            ticket_log = [ticket_number, ticket[1], ticket[3]["reporter"], "created", "", "", ""]
-            if new_filter(ticket_log):
-                created_tickets_changelogs.append(
-                    ticket_log
+        tickets = sorted(tickets.union(created_tickets))
+        for start in range(0, len(tickets), batch_size):
+            batch = tickets[start:start + batch_size]
+            changelogs = self.ticket_changelog_many(batch, new_filter)
+            # from the created tickets. Retrieve only those that have been
+            # created after since
+            created = {
+                ticket[0] : ticket for ticket in self.ticket_get_many(
+                    [number for number in batch if number in created_tickets]
                 )
-
-        changelogs = []
-        for ticket in tickets:
-            changelogs = changelogs + self.ticket_changelog(ticket, new_filter)
-        return created_tickets_changelogs + changelogs
+            }
+            for (number, changelog) in zip(batch, changelogs):
+                if number in created:
+                    ticket = created[number]
+                    ticket_log = [number, ticket[1], ticket[3]["reporter"],
+                                  "created", "", "", ""]
+                    if new_filter(ticket_log):
+                        changelog.insert(0, ticket_log)
+            yield list(heapq.merge(*changelogs, key=lambda log:log[1]))
 
     def ticket_attachment_put(self, ticket, files_desc, override=False):
         """Attach a set of files to the ticket.
 
 files_desc is a dictionary whose keys are the path to the files to be attached
         and the values are the descriptions of those files.
+The files are streamed, they are never read in memory as a whole, and at most
+        transfer_workers of them are sent concurrently, see transfer.
 override, if set to true, will override the file if remotely present."""
         attachments = set(self.ticket_attachment_list(ticket))
         files = set([os.path.basename(fil) for fil in list(files_desc.keys())])
         # make sure the attachments won't be overridden if not precised
         assert not (attachments.intersection(files) and override)
-        done_files = []
+        transfers = []
         for fil in files_desc:
             basename = os.path.basename(fil)
-            content = ""
-            with open(fil, "rb") as fil_:
-                content = fil_.read()
-
-            done_files.append(
-                self.server.ticket.putAttachment(
-                    ticket,
-                    basename,
-                    files_desc[fil],
-                    xmlrpc.client.Binary(content),
-                    True
-                )
-            )
-        return done_files
+            transfers.append(Transfer(
+                fil,
+                lambda server, progress, fil=fil, basename=basename:
+                call_with_file(
+                    server,
+                    "ticket.putAttachment",
+                    (ticket, basename, files_desc[fil],
+                     StreamedFile(fil, progress), True)
+                ),
+                os.path.getsize(fil)
+            ))
+        return self.transfer(transfers)
+
+    def ticket_attachment_get(self, ticket, attachment_name, path):
+        """Write the attachment attachment_name of ticket into the file path.
+
+The attachment is streamed to a temporary file, renamed to path once
+        complete."""
+        call_to_file(self.server, "ticket.getAttachment",
+                     (ticket, attachment_name), path)
+
+    def ticket_attachment_get_many(self, attachments):
+        """Get several ticket attachments concurrently, see transfer.
+
+attachments is a list of tuples (ticket, attachment_name, path), path being the
+        file the attachment is written into, see ticket_attachment_get.
+Return the list of the tuples (ticket/attachment_name, path) got."""
+        attachments = [
+            (int(str(ticket).replace("#", "")), name, path)
+            for (ticket, name, path) in attachments
+        ]
+        tickets = sorted(set(ticket for (ticket, name, path) in attachments))
+        sizes = {}
+        for (ticket, listed) in zip(
+                tickets,
+                self.call_many("ticket.listAttachments",
+                               [(ticket,) for ticket in tickets])):
+            for attach in listed:
+                sizes[(ticket, attach[0])] = attach[2]
+        transfers = []
+        for (ticket, name, path) in attachments:
+            transfers.append(Transfer(
+                "%s/%s" % (ticket, name),
+                lambda server, progress, ticket=ticket, name=name, path=path:
+                call_to_file(server, "ticket.getAttachment", (ticket, name),
+                             path, progress) or ("%s/%s" % (ticket, name), path),
+                sizes.get((ticket, name))
+            ))
+        return self.transfer(transfers)
+
+    def transfer(self, transfers):
+        """Perform the transfer.Transfer objects transfers and return their
+results.
+
+At most transfer_workers transfers are performed concurrently, each one with a
+        server proxy made by server_factory, and their progress is shown on
+        stderr. Without server_factory, they are performed one after the other.
+If some transfers fail, the other ones are performed anyway and a
+        transfer.TransferError is raised at the end."""
+        (results, failures) = TransferScheduler(
+            self.server, self.server_factory, self.transfer_workers
+        ).run(transfers)
+        if failures:
+            raise TransferError(failures, results)
+        return results
 
     def ticket_attachment_list(self, ticket):
         """List the attachments of ticket."""
         return [attach[0] for attach in self.server.ticket.listAttachments(ticket)]
 
-    def ticket_split(self, ticket, number, reporter, use_editor=False):
+    def ticket_attachment_list_many(self, tickets):
+        """List the attachments of tickets, in the same order.
+
+The calls are performed using call_many."""
+        return [
+            [attach[0] for attach in attachments]
+            for attachments in self.call_many("ticket.listAttachments",
+                                              [(ticket,) for ticket in tickets])
+        ]
+
+    def ticket_split(self, ticket, number, reporter, use_editor=False,
+                     pipeline=None):
         """Split the ticket into number subtickets and ask the user to edit each of
         them. Also set the remaining time of ticket to 0.
         If one edition is aborted, stop here
+        With a pipeline.EditPipeline, the ticket is got once and the changes are
+        sent in the background, the returned children are then the
+        concurrent.futures.Future of their ids. The remaining time of ticket is
+        then set to 0 even if the creation of a child fails.
         """
         children = []
         for i in range(0, number):
-            child = self.ticket_son_create(ticket, reporter, use_editor=use_editor)
+            child = self.ticket_son_create(ticket, reporter, use_editor=use_editor,
+                                           pipeline=pipeline)
             if not child:
                 break
             children.append(child)
@@ -423,50 +1135,143 @@ override, if set to true, will override the file if remotely present."""
         if children != []:
             self.ticket_edit(
                 ticket, {"estimatedhours" : "0"},
-                "parent_ticket_%s" % ticket)
+                "parent_ticket_%s" % ticket, pipeline=pipeline)
 
         return children
 
     def wiki_attachment_put(self, page, file_names, override=False):
         """Attach a set of files to the wiki page.
 
+The files are streamed and sent concurrently, see ticket_attachment_put.
 override, if set to true, will override the file if remotely present."""
         attachments = set(self.wiki_attachment_list(page))
         # make sure the attachments won't be overridden if not precised
         assert not (attachments.intersection(file_names) and override)
-        done_files = []
-        for fil in file_names:
+
+        def put(server, progress, fil):
             basename = os.path.basename(fil)
-            path = page + "/" + basename
-            content = ""
-            with open(fil, "rb") as fil_:
-                content = fil_.read()
-
-            self.server.wiki.putAttachmentEx(
-                page,
-                basename,
-                "",
-                xmlrpc.client.Binary(content),
+            call_with_file(
+                server,
+                "wiki.putAttachmentEx",
+                (page, basename, "", StreamedFile(fil, progress))
+            )
+            return page + "/" + basename
+
+        return self.transfer([
+            Transfer(
+                fil,
+                lambda server, progress, fil=fil:put(server, progress, fil),
+                os.path.getsize(fil)
+            )
+            for fil in file_names
+        ])
+
+    def wiki_attachment_get(self, attachment, path):
+        """Write the attachment of the wiki attachment, as page/file, into the
+file path.
+
+The attachment is streamed to a temporary file, renamed to path once
+        complete."""
+        call_to_file(self.server, "wiki.getAttachment", (attachment,), path)
+
+    def wiki_attachment_get_many(self, attachments):
+        """Get several wiki attachments concurrently, see transfer.
+
+attachments is a list of tuples (attachment, path), see wiki_attachment_get.
+Return the list of the tuples (attachment, path) got."""
+        return self.transfer([
+            Transfer(
+                attachment,
+                lambda server, progress, attachment=attachment, path=path:
+                call_to_file(server, "wiki.getAttachment", (attachment,),
+                             path, progress) or (attachment, path)
             )
-            done_files.append(path)
-        return done_files
+            for (attachment, path) in attachments
+        ])
 
     def wiki_attachment_list(self, page):
         """List the attachment of the wiki page."""
         return self.server.wiki.listAttachments(page)
 
     def wiki_source_grep(self, page_pattern, grep_pattern):
-        """Allows to search for content into the sources of pages."""
-        pages = [page for page in self.server.wiki.getAllPages() if
+        """Allows to search for content into the sources of pages.
+
+If a wiki mirror is configured, the search is performed locally in the pages
+        that may match according to the trigram index of the mirror. Otherwise,
+        the pages are got from the trac in batches."""
+        regexp = re.compile(grep_pattern)
+        if self.wiki_mirror is not None:
+            self.wiki_mirror_sync()
+            pages = (
+                (page, self.wiki_mirror.text(page))
+                for page in self.wiki_mirror.candidates(grep_pattern)
+                if fnmatch.fnmatch(page, page_pattern)
+            )
+        else:
+            pages = self._wiki_pages(
+                [page for page in self.server.wiki.getAllPages() if
                  fnmatch.fnmatch(page, page_pattern)]
-        for page in pages:
-            content = self.server.wiki.getPage(page)
+            )
+        for (page, content) in pages:
             line_number = 0
             for line in content.splitlines():
                 line_number+=1
-                if re.search(grep_pattern, line):
+                if regexp.search(line):
                     yield (page, line_number, line)
 
+    def _wiki_pages(self, pages, batch_size=100):
+        """Iterate over the tuples (page, content) of pages, getting them from
+        the trac batch_size at a time."""
+        for start in range(0, len(pages), batch_size):
+            batch = pages[start:start + batch_size]
+            contents = self.call_many("wiki.getPage",
+                                      [(page,) for page in batch])
+            for (page, content) in zip(batch, contents):
+                yield (page, content)
+
+    def wiki_mirror_sync(self, force=False):
+        """Synchronise the wiki mirror with the trac.
+
+The first time, all the pages are got. Then, only the pages given by
+        wiki.getRecentChanges with a newer version are got again and the pages
+        removed from the trac are removed from the mirror. Unless force is set,
+        nothing is done if the mirror has been synchronised less than
+        cache_max_age seconds ago."""
+        if self.wiki_mirror is None:
+            return
+        now = time.time()
+        if not force and self._wiki_mirror_sync_time is not None \
+           and now - self._wiki_mirror_sync_time < self.cache_max_age:
+            return
+        date = datetime.datetime.utcnow()
+        since = self.wiki_mirror.last_sync()
+        versions = self.wiki_mirror.versions()
+        all_pages = set(self.server.wiki.getAllPages())
+        self.wiki_mirror.remove_many(set(versions).difference(all_pages))
+        if since is None:
+            to_get = sorted(all_pages)
+        else:
+            # leave some room for the clock skew between the trac and me
+            to_get = sorted(set(
+                info["name"] for info in self.server.wiki.getRecentChanges(
+                    since - datetime.timedelta(minutes=5)
+                )
+                if info["name"] in all_pages
+                and info["version"] != versions.get(info["name"])
+            ).union(all_pages.difference(versions)))
+        for start in range(0, len(to_get), 100):
+            batch = to_get[start:start + 100]
+            infos = self.call_many("wiki.getPageInfo",
+                                   [(page,) for page in batch])
+            contents = self.call_many("wiki.getPage",
+                                      [(page,) for page in batch])
+            self.wiki_mirror.put_many([
+                (page, info["version"], content)
+                for (page, info, content) in zip(batch, infos, contents)
+            ])
+        self.wiki_mirror.set_last_sync(date)
+        self._wiki_mirror_sync_time = now
+
     def template_edit(self):
         """Edit the ticket template. This template is used each time a ticket is
         created."""
@@ -492,7 +1297,8 @@ override, if set to true, will override the file if remotely present."""
         """Loads the ticket template from file_name."""
         assert os.path.exists(file_name)
         with open(file_name, "r") as file:
-            self.template_attributes = self.attrs.load(file.read())
+            # parsed when used, see template_attributes
+            self._template_content = file.read()
 
         return True
 
@@ -501,7 +1307,7 @@ override, if set to true, will override the file if remotely present."""
 
 filter may be used to filter the results."""
         return [
-            comp for comp in self.server.ticket.component.getAll()
+            comp for comp in self.metadata_get("components")
             if filter(comp)
         ]
 
@@ -526,10 +1332,40 @@ filter may be used to filter the results."""
 
 filter may be used to filter the results."""
         return [
-            milestone for milestone in self.server.ticket.milestone.getAll()
+            milestone for milestone in self.metadata_get("milestones")
             if filter(milestone)
         ]
 
+    def milestone_dependency_graph(self, milestone_name):
+        """Return a dependencies.DependencyGraph of the tickets of
+milestone_name and of all the tickets they transitively block or are blocked
+by.
+
+The tickets are got level by level, each level in one batch. The weight of the
+        tickets is their remaining time."""
+        tickets = {}
+        to_get = set(self.ticket_query("milestone=%s&max=0" % milestone_name))
+        while to_get:
+            to_get = sorted(to_get)
+            got = self.ticket_get_many(to_get, faults=True)
+            for (number, ticket) in zip(to_get, got):
+                # a fault tells a reference to a ticket that does not exist
+                tickets[number] = ticket
+            to_get = set()
+            for ticket in got:
+                if isinstance(ticket, xmlrpc.client.Fault):
+                    continue
+                to_get.update(ticket_numbers(ticket[3].get("blockedby")))
+                to_get.update(ticket_numbers(ticket[3].get("blocking")))
+            to_get.difference_update(tickets)
+        return DependencyGraph(
+            [
+                ticket for ticket in tickets.values()
+                if not isinstance(ticket, xmlrpc.client.Fault)
+            ],
+            weight=lambda ticket:self._remaining_time(ticket[3])
+        )
+
     def milestone_time_sum(self, milestone_name):
         """Sum the times of all tickets belonging to milestone_name."""
         return self.ticket_query_time_sum("milestone=%s&status=!closed" % milestone_name)
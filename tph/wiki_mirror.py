@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""Local mirror of the wiki pages with a trigram index.
+
+The pages are stored with their version in a sqlite database, along with the
+set of trigrams of their lower case text. A regular expression can then be
+searched in the pages containing all the trigrams of its literal parts only.
+"""
+
+import sqlite3
+import os
+import re
+from datetime import datetime
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+def trigrams(text):
+    """Return the set of the trigrams of the lower case text."""
+    text = text.lower()
+    return set(text[index:index + 3] for index in range(len(text) - 2))
+
+def literals(pattern):
+    """Return the literal strings that any match of the regular expression
+pattern must contain.
+
+Only the top level sequence of the pattern is looked at, and only ASCII
+        characters are kept so that lower casing them is consistent with the
+        case insensitive matching of re. In case insensitive patterns, i, k and
+        s are not kept either since re matches them with non ASCII letters."""
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return []
+    ignore_case = parsed.state.flags & re.IGNORECASE
+    result = []
+    current = ""
+    for (op, value) in parsed:
+        if op == sre_parse.LITERAL and value < 128 \
+           and not (ignore_case and chr(value).lower() in "iks"):
+            current += chr(value)
+        else:
+            if current:
+                result.append(current)
+            current = ""
+    if current:
+        result.append(current)
+    return result
+
+class WikiMirror(object):
+    """Class storing the wiki pages in a sqlite database."""
+
+    def __init__(self, path):
+        """Open the mirror stored in the file path, creating it if needed."""
+        self.path = os.path.expanduser(path)
+        self.connection = sqlite3.connect(self.path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS page ("
+                "name TEXT PRIMARY KEY, version INTEGER, text TEXT)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS trigram ("
+                "trigram TEXT, name TEXT, PRIMARY KEY (trigram, name))"
+                " WITHOUT ROWID"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS trigram_name ON trigram (name)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta ("
+                "key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    def versions(self):
+        """Return a dictionary page name -> version of the mirrored pages."""
+        return dict(self.connection.execute("SELECT name, version FROM page"))
+
+    def text(self, name):
+        """Return the text of the page name or None if not mirrored."""
+        row = self.connection.execute(
+            "SELECT text FROM page WHERE name = ?", (name,)
+        ).fetchone()
+        return row and row[0]
+
+    def put_many(self, pages):
+        """Store pages, a list of tuples (name, version, text)."""
+        with self.connection:
+            for (name, version, text) in pages:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO page VALUES (?, ?, ?)",
+                    (name, version, text)
+                )
+                self.connection.execute(
+                    "DELETE FROM trigram WHERE name = ?", (name,)
+                )
+                self.connection.executemany(
+                    "INSERT INTO trigram VALUES (?, ?)",
+                    [(trigram, name) for trigram in trigrams(text)]
+                )
+
+    def remove_many(self, names):
+        """Remove the pages names from the mirror."""
+        with self.connection:
+            for name in names:
+                self.connection.execute(
+                    "DELETE FROM page WHERE name = ?", (name,)
+                )
+                self.connection.execute(
+                    "DELETE FROM trigram WHERE name = ?", (name,)
+                )
+
+    def candidates(self, pattern):
+        """Return the sorted names of the pages that may contain a match of the
+        regular expression pattern."""
+        needed = set()
+        for literal in literals(pattern):
+            needed.update(trigrams(literal))
+        if not needed:
+            return sorted(self.versions())
+        needed = sorted(needed)
+        return [
+            row[0] for row in self.connection.execute(
+                "SELECT name FROM trigram WHERE trigram IN (%s)"
+                " GROUP BY name HAVING COUNT(*) = ? ORDER BY name"
+                % ",".join("?" * len(needed)),
+                needed + [len(needed)]
+            )
+        ]
+
+    def last_sync(self):
+        """Return the date (UTC) of the last synchronisation or None."""
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = 'last_sync'"
+        ).fetchone()
+        if row is None:
+            return None
+        return datetime.strptime(row[0], "%Y-%m-%dT%H:%M:%S")
+
+    def set_last_sync(self, date):
+        """Record date (UTC) as the date of the last synchronisation."""
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('last_sync', ?)",
+                (date.strftime("%Y-%m-%dT%H:%M:%S"),)
+            )